@@ -8,3 +8,12 @@ def make_inline_btn(btns, sizes):
         builder.add(InlineKeyboardButton(text=text, callback_data=text))  # important!
     builder.adjust(*sizes)
     return builder.as_markup()
+
+
+def make_inline_btn_data(btns, sizes):
+    # btns: (text, callback_data) pairs, for buttons whose payload is not their label
+    builder = InlineKeyboardBuilder()
+    for text, data in btns:
+        builder.add(InlineKeyboardButton(text=text, callback_data=data))
+    builder.adjust(*sizes)
+    return builder.as_markup()
@@ -1,7 +1,13 @@
 from aiogram import Dispatcher
 
+from bot.middlewares import DbSessionMiddleware, HandlerMetricsMiddleware
+from db.async_engine import AsyncSessionLocal
 from environment.utils import Env
 
 BOT_TOKEN = Env.bot.TOKEN
 dp = Dispatcher()
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+dp.message.middleware(DbSessionMiddleware(AsyncSessionLocal))
+dp.callback_query.middleware(DbSessionMiddleware(AsyncSessionLocal))
 TOKEN=Env().bot.TOKEN
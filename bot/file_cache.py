@@ -0,0 +1,144 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+from sqlalchemy import or_
+
+from db.engine import SessionLocal
+from db.models import ApartmentImage
+from environment.utils import Env
+from webscrape.image_store import BASE_IMG_DIR
+
+IMG_DIR = BASE_IMG_DIR
+WARMUP_INTERVAL = 30
+WARMUP_BATCH = 10  # max photos in one media group
+
+
+def build_media(text: str | None, images) -> tuple[list[InputMediaPhoto], list]:
+    """
+    Builds a media group for a listing, preferring cached Telegram file_ids over local files.
+    Returns the media and, aligned with it, the image rows it was built from.
+    """
+    media = []
+    used = []
+    for img in images:
+        caption = text if not media and text else None
+        parse_mode = "HTML" if caption else None
+        if img.telegram_file_id:
+            media.append(InputMediaPhoto(media=img.telegram_file_id, caption=caption, parse_mode=parse_mode))
+        else:
+            # fallback to local file
+            file_path = IMG_DIR / img.local_path
+            if not file_path.exists():
+                continue
+            media.append(InputMediaPhoto(media=FSInputFile(str(file_path)), caption=caption, parse_mode=parse_mode))
+        used.append(img)
+    return media, used
+
+
+def remember_file_ids(sent: list[Message], images: list) -> int:
+    """
+    Persists the file_id Telegram assigned to each photo that was uploaded from disk.
+    The id is stored on every row sharing the same content hash, so a blob is uploaded once.
+    """
+    updates = {}
+    for msg, img in zip(sent, images):
+        if img.telegram_file_id or not msg.photo:
+            continue
+        updates[img.id] = (img.content_hash, msg.photo[-1].file_id)
+    if not updates:
+        return 0
+
+    session_db = SessionLocal()
+    try:
+        for image_id, (content_hash, file_id) in updates.items():
+            condition = ApartmentImage.id == image_id
+            if content_hash:
+                condition = or_(condition, ApartmentImage.content_hash == content_hash)
+            (
+                session_db.query(ApartmentImage)
+                .filter(condition, ApartmentImage.telegram_file_id.is_(None))
+                .update({"telegram_file_id": file_id}, synchronize_session=False)
+            )
+        session_db.commit()
+    finally:
+        session_db.close()
+    return len(updates)
+
+
+async def send_listing(message: Message, text: str, images) -> None:
+    """
+    Sends one listing card (photos with the text as caption, or just the text) and
+    caches the file_ids of any photos that had to be uploaded from disk.
+    The sends are paced by the bot's SendQueueMiddleware (bot/send_queue.py).
+    """
+    media, used = build_media(text, images)
+    if len(media) > 1:
+        # answer_media_group will ignore captions after the first
+        sent = await message.answer_media_group(media)
+    elif media:
+        sent = [await message.answer_photo(media[0].media, caption=text, parse_mode="HTML")]
+    else:
+        await message.answer(text, parse_mode="HTML")
+        return
+    await asyncio.to_thread(remember_file_ids, sent, used)
+
+
+def _pending_images(limit: int, skip_ids: set) -> list[ApartmentImage]:
+    session_db = SessionLocal()
+    try:
+        query = (
+            session_db.query(ApartmentImage)
+            .filter(ApartmentImage.telegram_file_id.is_(None))
+            .order_by(ApartmentImage.id)
+        )
+        if skip_ids:
+            query = query.filter(ApartmentImage.id.notin_(skip_ids))
+        rows = []
+        hashes = set()
+        for img in query.limit(limit * 4):
+            # one upload per blob is enough, the file_id is copied to the others
+            if img.content_hash and img.content_hash in hashes:
+                continue
+            hashes.add(img.content_hash)
+            rows.append(img)
+            if len(rows) == limit:
+                break
+        session_db.expunge_all()
+        return rows
+    finally:
+        session_db.close()
+
+
+async def warmup_file_ids(bot: Bot, chat_id: int | str = Env.bot.ADMIN_CHAT_ID,
+                          interval: float = WARMUP_INTERVAL) -> None:
+    """
+    Background worker: uploads photos that have no telegram_file_id yet to the admin chat
+    and stores the returned file_ids, so user-facing sends only reference file_ids.
+    """
+    skip_ids: set = set()
+    while True:
+        images = await asyncio.to_thread(_pending_images, WARMUP_BATCH, skip_ids)
+        if not images:
+            await asyncio.sleep(interval)
+            continue
+
+        media, used = build_media(None, images)
+        skip_ids.update(img.id for img in images if img not in used)
+        if not media:
+            continue
+        try:
+            if len(media) > 1:
+                sent = await bot.send_media_group(chat_id, media)
+            else:
+                sent = [await bot.send_photo(chat_id, media[0].media)]
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except TelegramAPIError as e:
+            print(f"File id warm-up failed: {e}")
+            skip_ids.update(img.id for img in used)
+            await asyncio.sleep(interval)
+            continue
+        await asyncio.to_thread(remember_file_ids, sent, used)
@@ -8,34 +8,31 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.utils.media_group import MediaGroupBuilder
 
 from sqlalchemy import and_, text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
 from bot.buttons.additional import make_inline_btn_like
 from bot.buttons.reply import make_reply_btn
-from bot.buttons.inline import make_inline_btn
+from bot.buttons.inline import make_inline_btn, make_inline_btn_data
 from bot.dispatcher import dp
+from bot.file_cache import send_listing
+from bot.middlewares import HANDLER_ERRORS
 from bot.states import StepByStepStates, SearchState
 
-from db.engine import SessionLocal, engine
+from db.districts import DISTRICTS
 from db.manager import *
+from db.search import SearchFilters, search_page
 
 import re
 
 
-db = SessionLocal()
-
 @dp.message(StepByStepStates.start, F.text == "Getting Apartment")
 async def name_handler(message: Message, state: FSMContext):
     await state.set_state(SearchState.district)
 
-    btns = [
-        "Алмазарский район", "Бектемирский район", "Мирзо-Улугбекский район",
-        "Сергелийский район", "Чиланзарский район", "Шайхантахурский район",
-        "Юнусабадский район", "Яккасарайский район", "Яшнабадский район", "Учтепинский район"
-    ]
-    sizes = [2, 2, 2, 2, 2]
-    markup = make_inline_btn(btns, sizes)
+    btns = [(d.name, f"district_{d.id}") for d in DISTRICTS]
+    sizes = [2] * 6
+    markup = make_inline_btn_data(btns, sizes)
     await message.delete()
     await message.answer(
         text="...",
@@ -47,10 +44,10 @@ async def name_handler(message: Message, state: FSMContext):
     )
 
 
-@dp.callback_query(SearchState.district,F.data)
+@dp.callback_query(SearchState.district, F.data.startswith("district_"))
 async def name_handler(callback:CallbackQuery,state:FSMContext):
-    district=callback.data
-    await state.update_data({"district":district})
+    district_id = int(callback.data.removeprefix("district_"))
+    await state.update_data({"district_id": district_id})
     await state.set_state(SearchState.rooms)
     btns=[
         "1",
@@ -94,95 +91,62 @@ async def name_handler(message: Message, state: FSMContext):
 from aiogram.types import InputMediaPhoto, FSInputFile
 
 @dp.message(SearchState.end_price, F.text.isdigit())
-async def price_handler(message: Message, state: FSMContext):
+async def price_handler(message: Message, state: FSMContext, session: AsyncSession):
     end_price = int(message.text)
     await state.update_data({"end_price": end_price})
     data = await state.get_data()
-    await state.clear()
 
-    required_keys = ["rooms", "district", "start_price", "end_price"]
+    required_keys = ["rooms", "district_id", "start_price", "end_price"]
     if not all(key in data for key in required_keys):
+        await state.clear()
         await message.answer("Iltimos, barcha ma'lumotlarni to'ldiring (xona, tuman, qavat, narx).")
         return
 
-    session: Session = SessionLocal()
+    # only the filters and the keyset cursor of the next page are kept between pages
+    filters = SearchFilters(int(data["district_id"]), int(data["rooms"]), int(data["start_price"]), end_price)
+    await state.set_state(SearchState.results)
+    await state.set_data({"filters": list(filters), "cursor": None})
+    await send_search_page(message, state, session)
+
+
+@dp.callback_query(SearchState.results, F.data == "search_next")
+async def next_page_handler(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await send_search_page(callback.message, state, session)
+
+
+async def send_search_page(message: Message, state: FSMContext, session: AsyncSession):
+    data = await state.get_data()
+    cursor = tuple(data["cursor"]) if data.get("cursor") else None
+    next_cursor = None
     try:
-        # ORM query
-        apartments = (
-            session.query(Apartment)
-            .filter_by(rooms=int(data["rooms"]), district=data["district"])
-            .filter(Apartment.price > int(data["start_price"]))
-            .filter(Apartment.price < end_price)
-            .all()
-        )
-
-        if not apartments:
+        cards, next_cursor = await search_page(session, SearchFilters(*data["filters"]), cursor)
+        # the cards are plain tuples: give the connection back before the slow photo sends
+        await session.close()
+
+        if not cards and cursor is None:
             await message.answer("🚫 Hech qanday uy topilmadi.")
-            return
-
-        for apt in apartments:
-            text = (
-                f"🔑(№ {apt.id})🔑"
-                f"📍 Tuman: {apt.district}\n"
-                f"🛏️ Xona: {apt.rooms}\n"
-                f"🏢 Turi: {apt.building_type or '-'}\n"
-                f"🛠️ Remont: {apt.repair or '-'}\n"
-                f"📞 Uy egasi raqami: {apt.phone_number or '-'}\n"
-                f"🏬 Qavat: {apt.floor}/{apt.total_storeys}\n"
-                f"💰 Narx: ${apt.price}\n"
-                f"🔗 Manzil: {apt.map_link or '—'}\n"
-                f"🌐 URL: {apt.url.url}\n"
-            )
-
-            # Prepare media group
-            media = []
-            for idx, img in enumerate(apt.images_list):
-                # prefer cached file_id
-                if img.telegram_file_id:
-                    if idx == 0:
-                        media.append(
-                            InputMediaPhoto(
-                                media=img.telegram_file_id,
-                                caption=text,
-                                parse_mode="HTML"
-                            )
-                        )
-                    else:
-                        media.append(InputMediaPhoto(media=img.telegram_file_id))
-                else:
-                    # fallback to local file
-                    file_path = Path(os.getenv("APARTMENT_IMG_DIR", "images")) / img.local_path
-                    if file_path.exists():
-                        media.append(
-                            InputMediaPhoto(
-                                media=FSInputFile(str(file_path)),
-                                caption=text if idx == 0 else None,
-                                parse_mode="HTML" if idx == 0 else None
-                            )
-                        )
-                    else:
-                        continue
-
-            # Send either media group or just text
-            if media:
-                # answer_media_group will ignore captions after the first
-                await message.answer_media_group(media)
-            else:
-                await message.answer(text, parse_mode="HTML")
+
+        for card in cards:
+            await send_listing(message, card.text(), card.images)
 
     except Exception as e:
         await message.answer("⚠️ Ma'lumotlar bazasida xatolik yuz berdi. Iltimos, keyinroq urinib ko'ring.")
+        HANDLER_ERRORS.inc(handler="getting.price_handler")
         print("price_handler error:", e)
-    finally:
-        session.close()
 
-    # back button
     builder = InlineKeyboardBuilder()
+    if next_cursor:
+        await state.update_data({"cursor": list(next_cursor)})
+        builder.add(InlineKeyboardButton(text="Keyingi ▶️", callback_data="search_next"))
+    else:
+        await state.clear()
+    # back button
     builder.add(InlineKeyboardButton(text="🔙Orqaga", callback_data="/start"))
     builder.adjust(1)
 
     await message.answer("⬅️ Asosiy panelga qaytish", reply_markup=builder.as_markup())
-    await state.clear()
 
 @dp.callback_query(F.data=="/start")
 async def command_start_handler(call: CallbackQuery, state: FSMContext) -> None:
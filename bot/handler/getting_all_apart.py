@@ -1,17 +1,17 @@
 import asyncio
 import logging
-import time
 import traceback
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, ReplyKeyboardRemove, InputMediaPhoto, InlineKeyboardButton, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.types import InputMediaPhoto, FSInputFile
 from bot.buttons.reply import make_reply_btn
-from db.models import Apartment
-from db.engine import Base, SessionLocal
+from db.search import browse_page
 from bot.dispatcher import dp
-from bot.states import StepByStepStates
+from bot.file_cache import send_listing
+from bot.middlewares import HANDLER_ERRORS
+from bot.states import BrowseState, StepByStepStates
 import os
 from pathlib import Path
 from aiogram import F
@@ -19,84 +19,69 @@ from aiogram import F
 
 
 @dp.message(StepByStepStates.start, F.text == "Getting All Apartment")
-async def phone_request_handler(message: Message, state: FSMContext) -> None:
+async def phone_request_handler(message: Message, state: FSMContext, session: AsyncSession) -> None:
     await message.answer(text='Malumotlar bazasidagi barcha kvartiralar:',reply_markup=ReplyKeyboardRemove())
-    session: Session = SessionLocal()
+    # only the keyset cursors of the neighbouring pages are kept between pages
+    await state.set_state(BrowseState.page)
+    await state.set_data({})
+    await send_browse_page(message, state, session)
+
+
+@dp.callback_query(BrowseState.page, F.data.in_({"browse_next", "browse_prev"}))
+async def browse_page_handler(callback: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
+    data = await state.get_data()
+    cursor = data.get("next" if callback.data == "browse_next" else "prev")
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    if not cursor:
+        return
+    if callback.data == "browse_next":
+        await send_browse_page(callback.message, state, session, after=tuple(cursor))
+    else:
+        await send_browse_page(callback.message, state, session, before=tuple(cursor))
+
+
+async def send_browse_page(message: Message, state: FSMContext, session: AsyncSession,
+                           after=None, before=None) -> None:
+    prev_cursor = next_cursor = None
     try:
-        # ORM query
-        apartments = (
-            session.query(Apartment).all()
-        )
+        # a bounded range scan per page, never the whole table
+        cards, prev_cursor, next_cursor = await browse_page(session, after=after, before=before)
+        # the cards are plain tuples: give the connection back before the slow photo sends
+        await session.close()
 
-        if not apartments:
+        if not cards and not (after or before):
             await message.answer("🚫 Hech qanday uy topilmadi.")
-            return
-
-        for apt in apartments:
-            text = (
-                f"🔑(№ {apt.id})🔑"
-                f"📍 Tuman: {apt.district}\n"
-                f"🛏️ Xona: {apt.rooms}\n"
-                f"🏢 Turi: {apt.building_type or '-'}\n"
-                f"🛠️ Remont: {apt.repair or '-'}\n"
-                f"📞 Uy egasi raqami: {apt.phone_number or '-'}\n"
-                f"🏬 Qavat: {apt.floor}/{apt.total_storeys}\n"
-                f"💰 Narx: ${apt.price}\n"
-                f"🔗 Manzil: {apt.map_link or '—'}\n"
-                f"🌐 URL: {apt.url.url}\n"
-            )
 
-            # Prepare media group
-            media = []
-            for idx, img in enumerate(apt.images_list):
-                # prefer cached file_id
-                if img.telegram_file_id:
-                    if idx == 0:
-                        media.append(
-                            InputMediaPhoto(
-                                media=img.telegram_file_id,
-                                caption=text,
-                                parse_mode="HTML"
-                            )
-                        )
-                    else:
-                        media.append(InputMediaPhoto(media=img.telegram_file_id))
-                else:
-                    # fallback to local file
-                    file_path = Path(os.getenv("APARTMENT_IMG_DIR", "images")) / img.local_path
-                    if file_path.exists():
-                        media.append(
-                            InputMediaPhoto(
-                                media=FSInputFile(str(file_path)),
-                                caption=text if idx == 0 else None,
-                                parse_mode="HTML" if idx == 0 else None
-                            )
-                        )
-                    else:
-                        continue
-            if media:
-                await message.answer_media_group(media)
-            else:
-                await message.answer(text, parse_mode="HTML")
-            time.sleep(0.5)
+        for card in cards:
+            await send_listing(message, card.text(), card.images)
 
     except Exception as e:
+        HANDLER_ERRORS.inc(handler="getting_all_apart.phone_request_handler")
         print("phone_request_handler error:", e)
         traceback.print_exc()
         await message.answer(
             "⚠️ Ma'lumotlar bazasida xatolik yuz berdi. Iltimos, keyinroq urinib ko'ring."
 
         )
-    finally:
-        session.close()
 
-    # back button
     builder = InlineKeyboardBuilder()
+    if prev_cursor:
+        builder.add(InlineKeyboardButton(text="◀️ Oldingi", callback_data="browse_prev"))
+    if next_cursor:
+        builder.add(InlineKeyboardButton(text="Keyingi ▶️", callback_data="browse_next"))
+    if prev_cursor or next_cursor:
+        await state.update_data({
+            "prev": list(prev_cursor) if prev_cursor else None,
+            "next": list(next_cursor) if next_cursor else None,
+        })
+    else:
+        await state.clear()
+    # back button
     builder.add(InlineKeyboardButton(text="🔙Orqaga", callback_data="/start"))
-    builder.adjust(1)
+    builder.adjust(2 if prev_cursor and next_cursor else 1, 1)
 
     await message.answer("⬅️ Asosiy panelga qaytish", reply_markup=builder.as_markup())
-    await state.clear()
 
 @dp.callback_query(F.data=="/start")
 async def command_start_handler(call: CallbackQuery, state: FSMContext) -> None:
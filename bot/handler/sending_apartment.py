@@ -10,6 +10,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from bot.dispatcher import dp
 from bot.states import StepByStepStates
+from environment.utils import Env
 from webscrape import get_all_urls_for_apart
 
 
@@ -58,7 +59,9 @@ async def phone_request_handler(message: Message, state: FSMContext) -> None:
 
     async def run_scrape():
         try:
-            await asyncio.to_thread(get_all_urls_for_apart, url, stop_event)
+            # with external workers the bot only stores the URLs; worker.py scrapes them
+            await asyncio.to_thread(get_all_urls_for_apart, url, stop_event,
+                                    ingest=not Env.scraper.EXTERNAL_WORKERS)
             if not stop_event.is_set():
                 await message.answer("✅ Scraping yakunlandi.")
         except Exception:
@@ -0,0 +1,90 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from monitoring.metrics import counter, histogram
+
+HANDLER_SECONDS = histogram(
+    "bot_handler_seconds", "Time spent in each bot handler; several handlers share a name, so the FSM state is a label",
+    ("handler", "state"),
+)
+HANDLER_ERRORS = counter(
+    "bot_handler_errors_total", "Handler failures, raised or caught and reported to the user", ("handler",),
+)
+TELEGRAM_SECONDS = histogram("bot_telegram_request_seconds", "Bot API call latency", ("method", "outcome"))
+
+
+def handler_name(callback: Callable) -> str:
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware for dp.message / dp.callback_query: times the handler that matched
+    the update and counts the exceptions it lets through.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = handler_name(data["handler"].callback)
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, handler=name, state=data.get("raw_state") or "")
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Inner middleware for dp.message / dp.callback_query: opens an AsyncSession for a
+    handler that takes a session argument and passes it in. Other handlers get none.
+    The session is closed (and an unfinished transaction rolled back) when the handler
+    returns; it only checks a connection out of the pool at its first query.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        if handler_object is None or "session" not in handler_object.params:
+            return await handler(event, data)
+        async with self.session_factory() as session:
+            data["session"] = session
+            return await handler(event, data)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware timing every Bot API call (sendMessage, sendMediaGroup, ...)."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        t0 = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await make_request(bot, method)
+            outcome = "ok" if response.ok else "error"
+            return response
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - t0, method=method.__api_method__, outcome=outcome)
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMediaGroup, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from environment.utils import Env
+from monitoring.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+SEND_WAIT_SECONDS = histogram("bot_send_queue_wait_seconds", "Time a Bot API send waited for its rate limit slot")
+FLOOD_WAITS = counter("bot_flood_waits_total", "RetryAfter (flood wait) answers from Telegram")
+
+# methods that post or change a message in a chat, the ones Telegram rate-limits
+THROTTLED_PREFIXES = ("send", "copy", "forward", "edit")
+UNTHROTTLED_METHODS = {"sendChatAction"}
+
+
+class TokenBucket:
+    """rate tokens per second up to capacity; block() empties it for a flood wait."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, cost: float, now: float) -> float:
+        """Seconds until cost tokens are available (0 when they are)."""
+        self._refill(now)
+        # an album can cost more than the bucket holds: it then waits for a full bucket
+        cost = min(cost, self.capacity)
+        return max(self.blocked_until - now, (cost - self.tokens) / self.rate, 0.0)
+
+    def idle_in(self, now: float) -> float:
+        """Seconds until the bucket is full again, i.e. forgetting it changes nothing."""
+        self._refill(now)
+        return max(self.blocked_until - now, (self.capacity - self.tokens) / self.rate, 0.0)
+
+    async def acquire(self, cost: float = 1) -> None:
+        # the lock makes waiters take turns, so a big album is not starved by single messages
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = self.delay(cost, now)
+                if wait <= 0:
+                    self.tokens -= min(cost, self.capacity)
+                    return
+                await asyncio.sleep(wait)
+
+    def block(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        # refilling starts when the wait is over: no burst right after a flood wait
+        self.updated = self.blocked_until
+
+
+class SendQueue:
+    """
+    Outbound Bot API scheduler. Each chat has a FIFO queue drained by its own task, so
+    different chats are sent in parallel and one chat's messages keep their order.
+    Every send takes a token from its chat's bucket (TELEGRAM_CHAT_RATE per second with
+    bursts of TELEGRAM_CHAT_BURST; TELEGRAM_GROUP_RATE per minute in groups) and from
+    the global bucket (TELEGRAM_GLOBAL_RATE per second, an album costs one per photo).
+
+    A RetryAfter answer blocks the chat's bucket for the wait Telegram asked for and the
+    same request is sent again, up to TELEGRAM_MAX_FLOOD_RETRIES times.
+    """
+
+    def __init__(self, global_rate: float = Env.bot.GLOBAL_RATE, chat_rate: float = Env.bot.CHAT_RATE,
+                 chat_burst: float = Env.bot.CHAT_BURST, group_rate: float = Env.bot.GROUP_RATE,
+                 max_retries: int = Env.bot.MAX_FLOOD_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate / 60
+        self.max_retries = max_retries
+        self._queues: dict[Any, asyncio.Queue] = {}
+        self._buckets: dict[Any, TokenBucket] = {}
+        # strong references: the loop only keeps weak ones, an unreferenced task can be collected
+        self._drainers: dict[Any, asyncio.Task] = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # negative ids are groups and channels, limited per minute
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, 1 if is_group else self.chat_burst)
+        return bucket
+
+    async def submit(self, chat_id, send: Callable[[], Awaitable[Any]], cost: int = 1) -> Any:
+        """Queues send() behind the chat's earlier sends and returns its result."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+            task = self._drainers[chat_id] = asyncio.create_task(self._drain(chat_id, queue))
+            task.add_done_callback(lambda t: self._drainer_done(chat_id, t))
+        queue.put_nowait((send, cost, future, time.perf_counter()))
+        return await future
+
+    def _drainer_done(self, chat_id, task: asyncio.Task) -> None:
+        if self._drainers.get(chat_id) is task:
+            del self._drainers[chat_id]
+        error = None if task.cancelled() else task.exception()
+        if error is None and not task.cancelled():
+            return
+        if error is not None:
+            logger.error("Send queue for chat %s failed", chat_id, exc_info=error)
+        # a drainer that did not finish normally left its queue behind: release the sends
+        # waiting on it and let the next submit start a fresh one
+        queue = self._queues.pop(chat_id, None)
+        self._buckets.pop(chat_id, None)
+        while queue is not None and not queue.empty():
+            future = queue.get_nowait()[2]
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    async def _drain(self, chat_id, queue: asyncio.Queue) -> None:
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # the bucket is kept until it has refilled, so a chat cannot gain a
+                # fresh burst by pausing briefly; then the chat's state is dropped
+                idle = bucket.idle_in(time.monotonic())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=idle) if idle > 0 else None
+                except asyncio.TimeoutError:
+                    item = None
+                if item is None:
+                    if not queue.empty():
+                        continue
+                    del self._queues[chat_id]
+                    self._buckets.pop(chat_id, None)
+                    return
+            send, cost, future, queued_at = item
+            if future.cancelled():
+                continue
+            try:
+                result = await self._send(chat_id, bucket, send, cost, queued_at)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _send(self, chat_id, bucket: TokenBucket, send, cost: int, queued_at: float):
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire(cost)
+            if attempt == 0:
+                SEND_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+            try:
+                return await send()
+            except TelegramRetryAfter as e:
+                FLOOD_WAITS.inc()
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Flood wait in chat %s: retrying in %ss", chat_id, e.retry_after)
+                bucket.block(e.retry_after)
+
+
+class SendQueueMiddleware(BaseRequestMiddleware):
+    """
+    Session middleware putting every message send or edit of the bot (message.answer,
+    answer_media_group, edit_reply_markup, ...) through a SendQueue. Register it before
+    TelegramMetricsMiddleware so that one times the API call, not the queueing.
+    """
+
+    def __init__(self, queue: Optional[SendQueue] = None):
+        self.queue = queue or SendQueue()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or name in UNTHROTTLED_METHODS or not name.startswith(THROTTLED_PREFIXES):
+            return await make_request(bot, method)
+        cost = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        return await self.queue.submit(chat_id, lambda: make_request(bot, method), cost)
+
+
+send_queue = SendQueue()
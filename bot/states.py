@@ -11,4 +11,9 @@ class SearchState(StatesGroup):
     start_price = State()
     end_price = State()
     rooms=State()
+    results = State()
 
+
+
+class BrowseState(StatesGroup):
+    page = State()
@@ -0,0 +1,52 @@
+# db/async_engine.py
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from db.engine import DB_NAME, DB_PASSWORD, DB_USER, host_port
+from environment.utils import Env
+from monitoring.metrics import instrument_engine
+
+# Bot handlers only: they run on the event loop, so their queries go through asyncpg.
+# The scraper workers and migrations keep the psycopg2 engine in db.engine.
+ASYNC_DB_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{host_port}/{DB_NAME}"
+
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    pool_size=Env.db.POOL_SIZE,
+    max_overflow=Env.db.MAX_OVERFLOW,
+    pool_timeout=Env.db.POOL_TIMEOUT,
+    # connections dropped by PostgreSQL restarts or idle timeouts are replaced, not handed out
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={
+        # a runaway query is cancelled by the server instead of holding a pool slot
+        "server_settings": {"statement_timeout": str(Env.db.STATEMENT_TIMEOUT_MS)},
+    },
+)
+instrument_engine(async_engine.sync_engine)
+
+# expire_on_commit=False: results stay readable after commit without another round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def connection_budget() -> int:
+    """Most connections the bot process can hold: both pools at full overflow."""
+    return Env.db.POOL_SIZE + Env.db.MAX_OVERFLOW + Env.db.SYNC_POOL_SIZE + Env.db.SYNC_MAX_OVERFLOW
+
+
+def check_connection_budget(engine) -> None:
+    """
+    Warns at startup when the bot's two pools alone could use more connections than the
+    server allows. Each scraper worker adds DB_SYNC_POOL_SIZE + DB_SYNC_MAX_OVERFLOW more.
+    """
+    with engine.connect() as conn:
+        max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+    budget = connection_budget()
+    worker_budget = Env.db.SYNC_POOL_SIZE + Env.db.SYNC_MAX_OVERFLOW
+    if budget > max_connections:
+        print(f"DB pools: the bot can open {budget} connections but max_connections is {max_connections}; "
+              f"lower DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_SYNC_POOL_SIZE / DB_SYNC_MAX_OVERFLOW")
+    else:
+        print(f"DB pools: bot up to {budget} of {max_connections} connections, "
+              f"room for {(max_connections - budget) // max(worker_budget, 1)} scraper workers at {worker_budget} each")
@@ -0,0 +1,80 @@
+from typing import NamedTuple, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Apartment, ApartmentImage, ApartmentUrl
+
+
+class CardImage(NamedTuple):
+    # the fields bot.file_cache needs to send a photo and cache its file_id
+    id: int
+    local_path: str
+    telegram_file_id: Optional[str]
+    content_hash: Optional[str]
+
+
+class ListingCard(NamedTuple):
+    """Read-only snapshot of an apartment as the bot shows it; safe to use after the session closes."""
+    id: int
+    district: str
+    rooms: int
+    building_type: Optional[str]
+    repair: Optional[str]
+    phone_number: Optional[str]
+    floor: int
+    total_storeys: int
+    price: int
+    map_link: Optional[str]
+    url: str
+    images: tuple[CardImage, ...] = ()
+
+    def text(self) -> str:
+        return (
+            f"🔑(№ {self.id})🔑"
+            f"📍 Tuman: {self.district}\n"
+            f"🛏️ Xona: {self.rooms}\n"
+            f"🏢 Turi: {self.building_type or '-'}\n"
+            f"🛠️ Remont: {self.repair or '-'}\n"
+            f"📞 Uy egasi raqami: {self.phone_number or '-'}\n"
+            f"🏬 Qavat: {self.floor}/{self.total_storeys}\n"
+            f"💰 Narx: ${self.price}\n"
+            f"🔗 Manzil: {self.map_link or '—'}\n"
+            f"🌐 URL: {self.url}\n"
+        )
+
+
+# ListingCard fields except images, in order; the URL comes from the same row via the join
+CARD_COLUMNS = (
+    Apartment.id, Apartment.district, Apartment.rooms, Apartment.building_type, Apartment.repair,
+    Apartment.phone_number, Apartment.floor, Apartment.total_storeys, Apartment.price, Apartment.map_link,
+    ApartmentUrl.url,
+)
+
+
+def card_query() -> Select:
+    """
+    Projection query for listing cards: only the columns a card shows, with the URL
+    joined in, so the caller adds its filters / ORDER BY / LIMIT and gets plain rows
+    (no ORM objects, no lazy loads). Pass the rows to load_cards().
+    """
+    return select(*CARD_COLUMNS).join(ApartmentUrl, Apartment.url_id == ApartmentUrl.id)
+
+
+async def load_cards(session: AsyncSession, rows) -> list[ListingCard]:
+    """
+    Turns card_query() rows into ListingCards with their images, fetched for all rows in
+    one IN query: a page costs two queries however many cards and photos it has.
+    """
+    if not rows:
+        return []
+    images: dict[int, list[CardImage]] = {row.id: [] for row in rows}
+    result = await session.execute(
+        select(ApartmentImage.apartment_id, ApartmentImage.id, ApartmentImage.local_path,
+               ApartmentImage.telegram_file_id, ApartmentImage.content_hash)
+        .where(ApartmentImage.apartment_id.in_(list(images)))
+        .order_by(ApartmentImage.apartment_id, ApartmentImage.id)
+    )
+    for apartment_id, *image in result:
+        images[apartment_id].append(CardImage(*image))
+    return [ListingCard(*row, images=tuple(images[row.id])) for row in rows]
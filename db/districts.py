@@ -0,0 +1,113 @@
+import re
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+
+class District(NamedTuple):
+    id: int
+    name: str      # Russian name, as shown on the search buttons
+    name_uz: str   # Uzbek Latin
+    aliases: tuple
+
+
+# Canonical Tashkent districts. Ids are stored in apartments.district_id: never reuse
+# or renumber them, only append.
+DISTRICTS = [
+    District(1, "Алмазарский район", "Olmazor tumani", ("алмазар", "олмазор", "olmazor", "almazar")),
+    District(2, "Бектемирский район", "Bektemir tumani", ("бектемир", "bektemir")),
+    District(3, "Мирабадский район", "Mirobod tumani", ("мирабад", "миробод", "mirobod", "mirabad")),
+    District(4, "Мирзо-Улугбекский район", "Mirzo Ulug'bek tumani",
+             ("мирзо-улугбек", "мирзо улугбек", "мирзоулугбек", "mirzo ulugbek", "mirzo-ulugbek", "ulugbek")),
+    District(5, "Сергелийский район", "Sergeli tumani", ("сергели", "сергелий", "sergeli")),
+    District(6, "Учтепинский район", "Uchtepa tumani", ("учтепа", "учтепин", "uchtepa")),
+    District(7, "Чиланзарский район", "Chilonzor tumani", ("чиланзар", "чилонзор", "chilonzor", "chilanzar")),
+    District(8, "Шайхантахурский район", "Shayxontohur tumani",
+             ("шайхантахур", "шайхонтохур", "shayxontohur", "shaykhantakhur", "shayhontohur")),
+    District(9, "Юнусабадский район", "Yunusobod tumani", ("юнусабад", "юнус-абад", "юнусобод", "yunusobod", "yunusabad")),
+    District(10, "Яккасарайский район", "Yakkasaroy tumani", ("яккасарай", "яккасарой", "yakkasaroy", "yakkasaray")),
+    District(11, "Яшнабадский район", "Yashnobod tumani", ("яшнабад", "яшнобод", "yashnobod", "yashnabad")),
+    District(12, "Янгихаётский район", "Yangihayot tumani", ("янгихаёт", "янгиҳаёт", "yangihayot", "yangixayot")),
+]
+DISTRICTS_BY_ID = {d.id: d for d in DISTRICTS}
+
+_APOSTROPHES_RE = re.compile(r"['’ʻʼ`‘]")
+_SEPARATOR_RE = re.compile(r"[^\w-]+")
+# "район", "р-н", "tumani" ... are dropped; the adjective endings of Russian names are stemmed
+_DISTRICT_WORDS = {"район", "р-н", "туман", "тумани", "tuman", "tumani", "district", "г", "город", "ташкент", "toshkent", "tashkent"}
+_RU_ADJECTIVE_ENDINGS = ("ского", "скому", "ским", "ском", "ский", "ская", "кий", "ий")
+
+
+def _normalize(value: str) -> str:
+    value = value.lower().replace("ё", "е").replace("ҳ", "х").replace("ў", "у").replace("қ", "к").replace("ғ", "г")
+    return _APOSTROPHES_RE.sub("", value)
+
+
+def _stem(word: str) -> str:
+    for ending in _RU_ADJECTIVE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 4:
+            return word[:-len(ending)]
+    return word
+
+
+def _build_lookup() -> dict[str, int]:
+    lookup: dict[str, int] = {}
+    for d in DISTRICTS:
+        forms = [d.name.rsplit(" ", 1)[0], d.name_uz.rsplit(" ", 1)[0], *d.aliases]
+        for form in forms:
+            key = _normalize(form)
+            lookup[key] = d.id
+            lookup[_stem(key)] = d.id
+            lookup[key.replace("-", " ")] = d.id
+            lookup[key.replace("-", "").replace(" ", "")] = d.id
+    return lookup
+
+
+# every known spelling (normalized) -> district id, built once at import
+DISTRICT_LOOKUP = _build_lookup()
+
+
+def resolve_district(location: Optional[str]) -> Optional[int]:
+    """
+    Maps a free-text OLX location ("Юнусабадский район", "Toshkent, Yunusobod tumani",
+    "Мирзо-Улугбекский р-н") to a district id with a few dict lookups, or None.
+    """
+    if not location:
+        return None
+    normalized = _normalize(location)
+    words = [w for w in _SEPARATOR_RE.split(normalized) if w and w not in _DISTRICT_WORDS]
+    if not words:
+        return None
+
+    # whole remainder first ("mirzo ulugbek"), then single words, last word first
+    for candidate in (" ".join(words), "".join(words)):
+        if candidate in DISTRICT_LOOKUP:
+            return DISTRICT_LOOKUP[candidate]
+    for word in reversed(words):
+        district_id = DISTRICT_LOOKUP.get(word) or DISTRICT_LOOKUP.get(_stem(word))
+        if district_id:
+            return district_id
+    return None
+
+
+def backfill_district_ids(conn) -> None:
+    """
+    Migration step: resolves district_id for existing apartments from their district text.
+    Resolution runs once per distinct district string, then one UPDATE per district.
+    """
+    rows = conn.execute(text("SELECT DISTINCT district FROM apartments WHERE district_id IS NULL")).all()
+    by_id: dict[int, list[str]] = {}
+    unresolved = []
+    for (district,) in rows:
+        district_id = resolve_district(district)
+        if district_id:
+            by_id.setdefault(district_id, []).append(district)
+        else:
+            unresolved.append(district)
+    for district_id, names in by_id.items():
+        conn.execute(
+            text("UPDATE apartments SET district_id = :id WHERE district_id IS NULL AND district = ANY(:names)"),
+            {"id": district_id, "names": names},
+        )
+    if unresolved:
+        print(f"Districts without a match: {unresolved}")
@@ -5,6 +5,9 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from environment.utils import Env
+from monitoring.metrics import instrument_engine
+
 # Load .env
 load_dotenv()
 
@@ -36,8 +39,16 @@ else:
 
 DB_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{host_port}/{DB_NAME}"
 
-# Create engine
-engine = create_engine(DB_URL)
+# Create engine: scraper workers, migrations, and the bot's background jobs (in-process
+# scraping, file_id caching). Bot handlers use the asyncpg pool in db/async_engine.py.
+engine = create_engine(
+    DB_URL,
+    pool_size=Env.db.SYNC_POOL_SIZE,
+    max_overflow=Env.db.SYNC_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+# db_queries_total / db_query_seconds / db_commits_total on the metrics endpoint
+instrument_engine(engine)
 
 # Session factory
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
@@ -1,7 +1,152 @@
-from sqlalchemy.orm import Session
+from datetime import timedelta
+from typing import Callable
 
-from db.models import Apartment
+from sqlalchemy import and_, delete, exists, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import func
+
+from db.models import AgentPhoneNumber, Apartment, ApartmentUrl
 
 
 def get_phone(session: Session, phone_number: str):
-    return session.query(Apartment).filter_by(phone_number=phone_number).first()
\ No newline at end of file
+    return session.query(Apartment).filter_by(phone_number=phone_number).first()
+
+
+def insert_new_urls(session: Session, urls: list[str]) -> set[str]:
+    """
+    Inserts ad URLs as 'new' in a single INSERT ... ON CONFLICT (url) DO NOTHING
+    and returns the ones that were actually inserted (i.e. not seen before).
+    """
+    if not urls:
+        return set()
+    stmt = (
+        insert(ApartmentUrl)
+        .values([{"url": u, "status": "new"} for u in urls])
+        .on_conflict_do_nothing(index_elements=[ApartmentUrl.url])
+        .returning(ApartmentUrl.id, ApartmentUrl.url)
+    )
+    return {row.url for row in session.execute(stmt)}
+
+
+def claim_urls(session: Session, worker_id: str, batch_size: int, lease_seconds: int,
+               max_retries: int = 0) -> list[tuple[int, str]]:
+    """
+    Claims up to batch_size URLs for one worker: 'new' ones, 'in_progress' ones whose
+    lease expired (their worker died) and 'error' ones with fewer than max_retries
+    failures whose retry time has come. Rows locked by a concurrent claim are skipped
+    (FOR UPDATE SKIP LOCKED), so any number of workers can claim at once without overlap.
+    The caller commits.
+    """
+    claimable = (
+        select(ApartmentUrl.id)
+        .where(or_(
+            ApartmentUrl.status == "new",
+            and_(
+                ApartmentUrl.status == "in_progress",
+                or_(ApartmentUrl.lease_until.is_(None), ApartmentUrl.lease_until < func.now()),
+            ),
+            and_(
+                ApartmentUrl.status == "error",
+                ApartmentUrl.retry_count < max_retries,
+                or_(ApartmentUrl.lease_until.is_(None), ApartmentUrl.lease_until < func.now()),
+            ),
+        ))
+        .order_by(ApartmentUrl.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(ApartmentUrl)
+        .where(ApartmentUrl.id.in_(claimable.scalar_subquery()))
+        .values(
+            status="in_progress",
+            claimed_by=worker_id,
+            lease_until=func.now() + timedelta(seconds=lease_seconds),
+        )
+        .returning(ApartmentUrl.id, ApartmentUrl.url)
+        .execution_options(synchronize_session=False)
+    )
+    return [(row.id, row.url) for row in session.execute(stmt)]
+
+
+def claim_refresh_urls(session: Session, worker_id: str, batch_size: int, lease_seconds: int) -> list:
+    """
+    Claims up to batch_size scraped URLs whose apartment is still active and whose next
+    check is due, never-checked ones first. The URL keeps its 'done' status; the claim
+    only pushes next_check_at lease_seconds ahead, so a crashed worker's URLs come due
+    again by themselves. Same SKIP LOCKED scheme as claim_urls; the caller commits.
+    Returns rows with id, url, etag, last_modified, page_hash and check_interval.
+    """
+    due = (
+        select(ApartmentUrl.id)
+        .join(Apartment, Apartment.url_id == ApartmentUrl.id)
+        .where(
+            ApartmentUrl.status == "done",
+            Apartment.status == "active",
+            or_(ApartmentUrl.next_check_at.is_(None), ApartmentUrl.next_check_at <= func.now()),
+        )
+        .order_by(ApartmentUrl.next_check_at.asc().nulls_first())
+        .limit(batch_size)
+        .with_for_update(of=ApartmentUrl, skip_locked=True)
+    )
+    stmt = (
+        update(ApartmentUrl)
+        .where(ApartmentUrl.id.in_(due.scalar_subquery()))
+        .values(claimed_by=worker_id, next_check_at=func.now() + timedelta(seconds=lease_seconds))
+        .returning(
+            ApartmentUrl.id, ApartmentUrl.url, ApartmentUrl.etag, ApartmentUrl.last_modified,
+            ApartmentUrl.page_hash, ApartmentUrl.check_interval,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return session.execute(stmt).all()
+
+
+def one_per_cluster(query, criteria: Callable[[type[Apartment]], tuple]):
+    """
+    Filters an Apartment query by criteria (a function building the conditions for the
+    Apartment entity it is given) and keeps one apartment per near-duplicate cluster: the
+    newest one that also matches criteria. Written as NOT EXISTS on the cluster_id index
+    rather than DISTINCT ON, so the caller keeps its own ORDER BY (and keyset
+    pagination) and LIMIT can stop early. The newer cluster member must pass the same
+    criteria, otherwise a repost outside the filters would hide an older one inside them.
+    Cluster members are always newer than the first ad, which has cluster_id NULL.
+    """
+    newer = aliased(Apartment)
+    return query.filter(*criteria(Apartment), ~exists().where(
+        newer.cluster_id == func.coalesce(Apartment.cluster_id, Apartment.id),
+        newer.id > Apartment.id,
+        *criteria(newer),
+    ))
+
+
+def phone_counts(session: Session) -> list[tuple[str, int]]:
+    """Number of apartments per phone number, in one GROUP BY over apartments."""
+    return (
+        session.query(Apartment.phone_number, func.count())
+        .filter(Apartment.phone_number.isnot(None))
+        .group_by(Apartment.phone_number)
+        .all()
+    )
+
+
+def agent_phones(session: Session) -> list[str]:
+    return [p for (p,) in session.query(AgentPhoneNumber.phone_number).filter(AgentPhoneNumber.phone_number.isnot(None))]
+
+
+def promote_agent_phone(session: Session, phone_number: str, agent_name: str | None = None) -> int:
+    """
+    Blocks a number as an agent's and deletes every apartment listed with it (their
+    images go with them through the ON DELETE CASCADE). Returns the number of apartments
+    deleted. The caller commits.
+    """
+    session.execute(
+        insert(AgentPhoneNumber)
+        .values(phone_number=phone_number, agent_name=agent_name)
+        .on_conflict_do_nothing(index_elements=[AgentPhoneNumber.phone_number])
+    )
+    result = session.execute(
+        delete(Apartment).where(Apartment.phone_number == phone_number).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
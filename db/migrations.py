@@ -0,0 +1,90 @@
+from sqlalchemy import text
+
+from db.districts import backfill_district_ids
+from db.near_duplicates import backfill_clusters
+from db.engine import engine
+
+# Schema changes that Base.metadata.create_all() cannot make on an existing database
+# (new columns/indexes on tables that already exist). Append new entries at the end;
+# each runs once and is recorded in schema_migrations. Statements are idempotent so a
+# fresh database, where create_all already built everything, is unaffected.
+# A step is either an SQL string or a callable taking the connection (for backfills).
+MIGRATIONS = [
+    ("0001_apartment_images_content_hash", [
+        "ALTER TABLE apartment_images ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+        "ALTER TABLE apartment_images ADD COLUMN IF NOT EXISTS phash BIGINT",
+        "CREATE INDEX IF NOT EXISTS ix_apartment_images_content_hash ON apartment_images (content_hash)",
+        "CREATE INDEX IF NOT EXISTS ix_apartment_images_phash ON apartment_images (phash)",
+    ]),
+    ("0002_apartments_district_id", [
+        "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS district_id SMALLINT",
+        "CREATE INDEX IF NOT EXISTS ix_apartments_district_id ON apartments (district_id)",
+        backfill_district_ids,
+    ]),
+    ("0003_apartmenturls_lease", [
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(100)",
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP",
+        # the claim query only looks at claimable rows
+        "CREATE INDEX IF NOT EXISTS ix_apartmenturls_claimable ON apartmenturls (id) "
+        "WHERE status IN ('new', 'in_progress')",
+    ]),
+    ("0004_apartmenturls_retry_count", [
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS retry_count INTEGER NOT NULL DEFAULT 0",
+        "DROP INDEX IF EXISTS ix_apartmenturls_claimable",
+        "CREATE INDEX IF NOT EXISTS ix_apartmenturls_claimable ON apartmenturls (id) "
+        "WHERE status IN ('new', 'in_progress', 'error')",
+    ]),
+    ("0005_apartmenturls_refresh", [
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS etag VARCHAR(200)",
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS last_modified VARCHAR(100)",
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS page_hash VARCHAR(64)",
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS checked_at TIMESTAMP",
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS next_check_at TIMESTAMP",
+        "ALTER TABLE apartmenturls ADD COLUMN IF NOT EXISTS check_interval INTEGER",
+        # never-checked URLs (NULL) sort first, which is the order the refresh claims them in
+        "CREATE INDEX IF NOT EXISTS ix_apartmenturls_refresh_due ON apartmenturls (next_check_at NULLS FIRST) "
+        "WHERE status = 'done'",
+    ]),
+    ("0006_agent_phone_indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_apartments_phone_number ON apartments (phone_number)",
+        # numbers entered by hand may repeat; keep the first row of each before making it unique
+        "DELETE FROM agentphonenumbers a USING agentphonenumbers b "
+        "WHERE a.phone_number = b.phone_number AND a.id > b.id",
+        "CREATE UNIQUE INDEX IF NOT EXISTS agentphonenumbers_phone_number_key ON agentphonenumbers (phone_number)",
+    ]),
+    ("0007_apartments_near_duplicates", [
+        "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS minhash BYTEA",
+        "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS lsh_bands BIGINT[]",
+        "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS cluster_id BIGINT",
+        "CREATE INDEX IF NOT EXISTS ix_apartments_cluster_id ON apartments (cluster_id)",
+        "CREATE INDEX IF NOT EXISTS ix_apartments_lsh_bands ON apartments USING gin (lsh_bands)",
+        backfill_clusters,
+    ]),
+    ("0008_apartments_search_indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_apartments_search ON apartments (district_id, rooms, price, id) "
+        "WHERE status = 'active'",
+        "CREATE INDEX IF NOT EXISTS ix_apartments_active_price ON apartments (price, id) WHERE status = 'active'",
+        # superseded by ix_apartments_search for every query that filters on the district
+        "DROP INDEX IF EXISTS ix_apartments_district_id",
+        "ANALYZE apartments",
+    ]),
+]
+
+
+def apply_migrations(bind=engine) -> None:
+    with bind.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR(200) PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        applied = {row.name for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+        for name, statements in MIGRATIONS:
+            if name in applied:
+                continue
+            for step in statements:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            print(f"Applied migration {name}")
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import BIGINT, String, Text, Integer, DECIMAL, Boolean, TIMESTAMP, ForeignKey, Enum
-from sqlalchemy.sql import func
+from sqlalchemy import BIGINT, String, Text, Integer, SmallInteger, DECIMAL, Boolean, TIMESTAMP, ForeignKey, Enum, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import func, text
 from db.engine import Base
 from decimal import Decimal
 from db.engine import engine
@@ -16,6 +17,10 @@ class ApartmentImage(Base):
     original_url: Mapped[str] = mapped_column(String(500), nullable=True)
     local_path: Mapped[str] = mapped_column(String(500), nullable=False)
     telegram_file_id: Mapped[str] = mapped_column(String(200), nullable=True)
+    # sha256 of the file; rows sharing a blob in the content-addressed store share this
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=True, index=True)
+    # 64-bit perceptual hash (signed) used to match near-identical photos
+    phash: Mapped[int] = mapped_column(BIGINT, nullable=True, index=True)
     created_at: Mapped[str] = mapped_column(TIMESTAMP, server_default=func.now())
     apartment = relationship("Apartment", back_populates="images_list")
 
@@ -25,6 +30,12 @@ class ApartmentImage(Base):
 
 class Apartment(Base):
     __tablename__ = "apartments"
+    __table_args__ = (
+        Index("ix_apartments_lsh_bands", "lsh_bands", postgresql_using="gin"),
+        # bot search (db.search) and browsing: only active apartments, in (price, id) order
+        Index("ix_apartments_search", "district_id", "rooms", "price", "id", postgresql_where=text("status = 'active'")),
+        Index("ix_apartments_active_price", "price", "id", postgresql_where=text("status = 'active'")),
+    )
 
     id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=True)
     owner_name: Mapped[str] = mapped_column(String(100), nullable=True)
@@ -37,7 +48,9 @@ class Apartment(Base):
     rooms: Mapped[int] = mapped_column(Integer, nullable=False)
     is_furnished: Mapped[bool] = mapped_column(Boolean, nullable=False)
     district: Mapped[str] = mapped_column(String(100), nullable=False)
-    phone_number: Mapped[str] = mapped_column(String(50), nullable=True)
+    # canonical id from db.districts.DISTRICTS; NULL when the location did not resolve
+    district_id: Mapped[int] = mapped_column(SmallInteger, nullable=True)
+    phone_number: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
     building_type: Mapped[str] = mapped_column(String(50), nullable=True)
     repair: Mapped[str] = mapped_column(String(50), nullable=True)
     map_link: Mapped[str] = mapped_column(String(500), nullable=True)
@@ -45,6 +58,11 @@ class Apartment(Base):
     longitude: Mapped[Decimal] = mapped_column(DECIMAL(9, 6), nullable=True)
     scraped_at: Mapped[str] = mapped_column(TIMESTAMP, server_default=func.now())
     status: Mapped[str] = mapped_column(String(50), nullable=True)
+    # near-duplicate detection (db.near_duplicates): MinHash of title + description, its LSH
+    # band keys, and the first ad of the cluster this one copies (NULL: its own cluster)
+    minhash: Mapped[bytes] = mapped_column(LargeBinary, nullable=True, deferred=True)
+    lsh_bands: Mapped[list] = mapped_column(ARRAY(BIGINT), nullable=True, deferred=True)
+    cluster_id: Mapped[int] = mapped_column(BIGINT, nullable=True, index=True)
     url_id: Mapped[int] = mapped_column(
         ForeignKey("apartmenturls.id"),
         nullable=False,
@@ -88,6 +106,19 @@ class ApartmentUrl(Base):
         default="new",
         nullable=False,
     )
+    # scraper worker holding an 'in_progress' URL, and until when; expired leases are reclaimed.
+    # For 'error' URLs lease_until is the earliest time they may be retried.
+    claimed_by: Mapped[str] = mapped_column(String(100), nullable=True)
+    lease_until: Mapped[str] = mapped_column(TIMESTAMP, nullable=True)
+    retry_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # refresh of 'done' URLs: validators for conditional requests, fingerprint of the last
+    # page seen, and the schedule (check_interval doubles while the ad does not change)
+    etag: Mapped[str] = mapped_column(String(200), nullable=True)
+    last_modified: Mapped[str] = mapped_column(String(100), nullable=True)
+    page_hash: Mapped[str] = mapped_column(String(64), nullable=True)
+    checked_at: Mapped[str] = mapped_column(TIMESTAMP, nullable=True)
+    next_check_at: Mapped[str] = mapped_column(TIMESTAMP, nullable=True)
+    check_interval: Mapped[int] = mapped_column(Integer, nullable=True)
     apartment: Mapped[Apartment] = relationship(
         "Apartment",
         back_populates="url",
@@ -100,4 +131,27 @@ class AgentPhoneNumber(Base):
 
     id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=True)
     agent_name: Mapped[str] = mapped_column(String(100), nullable=True)
-    phone_number: Mapped[str] = mapped_column(String(50), nullable=True)
+    # normalized 9-digit number, as stored in apartments.phone_number
+    phone_number: Mapped[str] = mapped_column(String(50), nullable=True, unique=True)
+
+
+# Per-search crawl bookkeeping used by incremental re-crawls of a listing URL
+class SearchCrawlState(Base):
+    __tablename__ = "searchcrawlstates"
+
+    id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=True)
+    search_url: Mapped[str] = mapped_column(String(1000), nullable=False, unique=True)
+    # first ad (in page order) that was new on the previous crawl
+    high_water_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    pages_crawled: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_crawled_at: Mapped[str] = mapped_column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+# LLM address answers keyed by the sha256 of the normalized ad description; address NULL means "no address"
+class AddressCache(Base):
+    __tablename__ = "addresscache"
+
+    description_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    address: Mapped[str] = mapped_column(String(500), nullable=True)
+    model: Mapped[str] = mapped_column(String(50), nullable=True)
+    created_at: Mapped[str] = mapped_column(TIMESTAMP, server_default=func.now())
@@ -0,0 +1,150 @@
+import hashlib
+import random
+import re
+from array import array
+from typing import Optional
+
+from sqlalchemy import select, text
+
+from db.models import Apartment
+
+# MinHash over character 5-gram shingles of title + description (robust to the small
+# edits reposts get: a changed price, an added "СРОЧНО!"; word 3-grams lose half their
+# overlap on those). NUM_PERM values per signature,
+# split into LSH_BANDS bands of LSH_ROWS: two ads land in a common band with probability
+# 1 - (1 - J^rows)^bands (J = Jaccard similarity), ~0.89 at J=0.6 and ~0.12 at J=0.3;
+# candidates are then checked against the full signature.
+# Queries show one ad per cluster with db.manager.one_per_cluster: a NOT EXISTS anti-join
+# on cluster_id that keeps the newest member passing the caller's filters.
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+# estimated Jaccard similarity above which two ads are the same apartment; reposts score
+# 0.7-0.85, different flats described with the same template around 0.4
+DUPLICATE_THRESHOLD = 0.6
+# a boilerplate text shared by hundreds of ads should not turn one lookup into a scan
+MAX_CANDIDATES = 200
+
+_MERSENNE = (1 << 61) - 1
+_rnd = random.Random(20240601)  # fixed: signatures are stored, so the permutations must never change
+_PERMUTATIONS = [(_rnd.randrange(1, _MERSENNE), _rnd.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(title: Optional[str], description: Optional[str]) -> set[str]:
+    # punctuation and runs of whitespace are dropped, so they do not count as edits
+    normalized = " ".join(_WORD_RE.findall(f"{title or ''} {description or ''}".lower().replace("ё", "е")))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+def minhash_signature(title: Optional[str], description: Optional[str]) -> Optional[bytes]:
+    """
+    NUM_PERM 32-bit minimums packed into bytes (Apartment.minhash), or None for an empty text.
+    Only the low 32 bits of each minimum are kept: equal minimums stay equal, and two
+    different ones collide with probability 2^-32.
+    """
+    hashes = [_hash64(s.encode("utf-8")) for s in shingles(title, description)]
+    if not hashes:
+        return None
+    return array("I", (
+        min([(a * h + b) % _MERSENNE for h in hashes]) & 0xFFFFFFFF for a, b in _PERMUTATIONS
+    )).tobytes()
+
+
+def band_keys(signature: bytes) -> list[int]:
+    """One signed 64-bit key per band (Apartment.lsh_bands); the band number is part of the key."""
+    width = LSH_ROWS * 4
+    keys = []
+    for band in range(LSH_BANDS):
+        key = _hash64(bytes([band]) + signature[band * width:(band + 1) * width])
+        keys.append(key - (1 << 64) if key >= (1 << 63) else key)
+    return keys
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    # share of equal minimums estimates the Jaccard similarity of the shingle sets
+    x, y = array("I"), array("I")
+    x.frombytes(a)
+    y.frombytes(b)
+    return sum(1 for i, j in zip(x, y) if i == j) / NUM_PERM
+
+
+def find_cluster(session, signature: Optional[bytes], bands: Optional[list[int]]) -> Optional[int]:
+    """
+    Cluster id for a new ad: the cluster of the most similar stored ad above
+    DUPLICATE_THRESHOLD, or None when it is the first of its kind. Candidates come from
+    one query on the GIN-indexed lsh_bands column (any shared band), so the cost depends
+    on how many ads look alike, not on how many are stored.
+    """
+    if not signature:
+        return None
+    rows = session.execute(
+        select(Apartment.id, Apartment.cluster_id, Apartment.minhash)
+        .where(Apartment.lsh_bands.overlap(bands), Apartment.minhash.isnot(None))
+        .limit(MAX_CANDIDATES)
+    ).all()
+    best, best_score = None, DUPLICATE_THRESHOLD
+    for apartment_id, cluster_id, minhash in rows:
+        score = similarity(signature, bytes(minhash))
+        if score >= best_score:
+            best, best_score = cluster_id or apartment_id, score
+    return best
+
+
+def backfill_clusters(conn, batch_size: int = 1000) -> None:
+    """
+    Migration step: signs and clusters the apartments stored before near-duplicate
+    detection, oldest first, so each cluster is rooted at its first ad. Band keys are
+    matched in memory for the duration of the backfill.
+    """
+    first_in_band: dict[int, list[int]] = {}
+    signatures: dict[int, bytes] = {}
+    clusters: dict[int, int] = {}
+    update = text(
+        "UPDATE apartments SET minhash = :minhash, lsh_bands = CAST(:bands AS BIGINT[]), cluster_id = :cluster_id "
+        "WHERE id = :id"
+    )
+    last_id = 0
+    clustered = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, title, description FROM apartments WHERE minhash IS NULL AND id > :last "
+                 "ORDER BY id LIMIT :limit"),
+            {"last": last_id, "limit": batch_size},
+        ).all()
+        if not rows:
+            break
+        params = []
+        for apartment_id, title, description in rows:
+            last_id = apartment_id
+            signature = minhash_signature(title, description)
+            if signature is None:
+                continue
+            bands = band_keys(signature)
+            best, best_score = None, DUPLICATE_THRESHOLD
+            for key in bands:
+                for candidate in first_in_band.get(key, ()):
+                    score = similarity(signature, signatures[candidate])
+                    if score >= best_score:
+                        best, best_score = candidate, score
+            cluster_id = clusters[best] if best is not None else None
+            clusters[apartment_id] = cluster_id or apartment_id
+            signatures[apartment_id] = signature
+            for key in bands:
+                members = first_in_band.setdefault(key, [])
+                if len(members) < MAX_CANDIDATES:
+                    members.append(apartment_id)
+            clustered += cluster_id is not None
+            params.append({"minhash": signature, "bands": bands, "cluster_id": cluster_id, "id": apartment_id})
+        if params:
+            conn.execute(update, params)
+    if signatures:
+        print(f"Near-duplicates: signed {len(signatures)} apartments, {clustered} joined an earlier cluster")
@@ -0,0 +1,76 @@
+from typing import NamedTuple, Optional
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.cards import ListingCard, card_query, load_cards
+from db.manager import one_per_cluster
+from db.models import Apartment
+
+# listing cards per page; each card can be a media group of up to 10 photos
+PAGE_SIZE = 5
+
+
+class SearchFilters(NamedTuple):
+    district_id: int
+    rooms: int
+    min_price: int
+    max_price: int
+
+
+async def search_page(session: AsyncSession, filters: SearchFilters, after: Optional[tuple[int, int]] = None,
+                      limit: int = PAGE_SIZE) -> tuple[list[ListingCard], Optional[tuple[int, int]]]:
+    """
+    One page of active apartments matching filters, cheapest first, one per near-duplicate
+    cluster. Pages are keyset-paginated on (price, id): after is the cursor returned with
+    the previous page, so every page is a range scan of ix_apartments_search that stops
+    after limit + 1 rows, however deep the user pages. Returns the page as ListingCards
+    (two queries in all, see db.cards) and the cursor of the next one (None on the last page).
+    """
+    query = one_per_cluster(card_query(), lambda a: (
+        a.status == "active",
+        a.district_id == filters.district_id,
+        a.rooms == filters.rooms,
+        a.price > filters.min_price,
+        a.price < filters.max_price,
+    ))
+    cards, _, next_cursor = await _keyset_page(session, query, after, None, limit)
+    return cards, next_cursor
+
+
+async def browse_page(session: AsyncSession, after: Optional[tuple[int, int]] = None,
+                      before: Optional[tuple[int, int]] = None,
+                      limit: int = PAGE_SIZE) -> tuple[list[ListingCard], Optional[tuple[int, int]], Optional[tuple[int, int]]]:
+    """
+    One page of all active apartments (one per cluster), cheapest first, for the
+    "Getting All Apartment" browse mode: the page after the cursor after, the page before
+    the cursor before, or the first page. Same keyset scheme as search_page(), on
+    ix_apartments_active_price. Returns the page and the cursors of the previous and next
+    pages (None when there is none).
+    """
+    query = one_per_cluster(card_query(), lambda a: (a.status == "active",))
+    return await _keyset_page(session, query, after, before, limit)
+
+
+async def _keyset_page(session: AsyncSession, query, after, before, limit):
+    key = tuple_(Apartment.price, Apartment.id)
+    if before:
+        # walk backwards from the cursor, then put the page back in order
+        rows = (await session.execute(
+            query.where(key < tuple_(*before)).order_by(Apartment.price.desc(), Apartment.id.desc()).limit(limit + 1)
+        )).all()
+        more_before = len(rows) > limit
+        rows = rows[:limit][::-1]
+        more_after = True
+    else:
+        if after:
+            query = query.where(key > tuple_(*after))
+        rows = (await session.execute(query.order_by(Apartment.price, Apartment.id).limit(limit + 1))).all()
+        more_before = bool(after)
+        more_after = len(rows) > limit
+        rows = rows[:limit]
+    if not rows:
+        return [], None, None
+    prev_cursor = (rows[0].price, rows[0].id) if more_before else None
+    next_cursor = (rows[-1].price, rows[-1].id) if more_after else None
+    return await load_cards(session, rows), prev_cursor, next_cursor
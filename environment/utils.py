@@ -6,16 +6,37 @@ load_dotenv()
 
 class OpenApi:
     OPENAI_API_KEY=getenv('OPENAI_API_KEY')
+    OPENAI_BASE_URL = getenv("OPENAI_BASE_URL")
+    OPENAI_MODEL = getenv("OPENAI_MODEL", "gpt-4o")
+    OPENAI_MAX_CONCURRENCY = int(getenv("OPENAI_MAX_CONCURRENCY", "4"))
 
 class Bot:
     TOKEN = getenv("TOKEN")
     ADMIN_CHAT_ID=getenv("ADMIN_CHAT_ID")
+    API_URL = getenv("TELEGRAM_API_URL")
+    FILE_WARMUP = getenv("TELEGRAM_FILE_WARMUP", "0") == "1"
+    # outbound send limits (bot/send_queue.py): messages per second over all chats and per
+    # private chat (with a short burst), per minute in a group
+    GLOBAL_RATE = float(getenv("TELEGRAM_GLOBAL_RATE", "30"))
+    CHAT_RATE = float(getenv("TELEGRAM_CHAT_RATE", "1"))
+    CHAT_BURST = float(getenv("TELEGRAM_CHAT_BURST", "3"))
+    GROUP_RATE = float(getenv("TELEGRAM_GROUP_RATE", "20"))
+    MAX_FLOOD_RETRIES = int(getenv("TELEGRAM_MAX_FLOOD_RETRIES", "5"))
 class DB:
     DB_NAME = getenv("DB_NAME")
     DB_USER = getenv("DB_USER")
     DB_PASSWORD = getenv("DB_PASSWORD")
     DB_HOST = getenv("DB_HOST")
     DB_PORT = getenv("DB_PORT")
+    # async (asyncpg) pool used by the bot handlers, see db/async_engine.py
+    POOL_SIZE = int(getenv("DB_POOL_SIZE", "10"))
+    MAX_OVERFLOW = int(getenv("DB_MAX_OVERFLOW", "10"))
+    # psycopg2 pool (db/engine.py) of the scraper workers and the bot's background jobs;
+    # every process opens its own, so keep the sum of all pools under max_connections
+    SYNC_POOL_SIZE = int(getenv("DB_SYNC_POOL_SIZE", "5"))
+    SYNC_MAX_OVERFLOW = int(getenv("DB_SYNC_MAX_OVERFLOW", "5"))
+    POOL_TIMEOUT = int(getenv("DB_POOL_TIMEOUT", "10"))
+    STATEMENT_TIMEOUT_MS = int(getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
 
 class Web:
     TOKEN = getenv("WEB_TOKEN")
@@ -23,9 +44,45 @@ class Web:
 class Payment:
     CLICK_TOKEN = getenv("CLICK_TOKEN")
 
+class Scraper:
+    MAX_IN_FLIGHT = int(getenv("SCRAPER_MAX_IN_FLIGHT", "8"))
+    PER_HOST_LIMIT = int(getenv("SCRAPER_PER_HOST_LIMIT", "4"))
+    IMAGE_PER_HOST_LIMIT = int(getenv("SCRAPER_IMAGE_PER_HOST_LIMIT", "16"))
+    SESSION_TTL = int(getenv("SCRAPER_SESSION_TTL", "900"))
+    MAX_SESSIONS = int(getenv("SCRAPER_MAX_SESSIONS", "8"))
+    LISTING_CONCURRENCY = int(getenv("SCRAPER_LISTING_CONCURRENCY", "3"))
+    HTML_PARSER = getenv("SCRAPER_HTML_PARSER", "auto")
+    # attempts per request, and how often a failed ad URL is picked up again
+    MAX_ATTEMPTS = int(getenv("SCRAPER_MAX_ATTEMPTS", "3"))
+    URL_MAX_RETRIES = int(getenv("SCRAPER_URL_MAX_RETRIES", "3"))
+    # consecutive failures that open the per-host circuit, and for how long (seconds)
+    BREAKER_THRESHOLD = int(getenv("SCRAPER_BREAKER_THRESHOLD", "8"))
+    BREAKER_COOLDOWN = int(getenv("SCRAPER_BREAKER_COOLDOWN", "60"))
+    # 1: the bot only discovers URLs, standalone workers (worker.py) scrape them
+    EXTERNAL_WORKERS = getenv("SCRAPER_EXTERNAL_WORKERS", "0") == "1"
+    CLAIM_BATCH = int(getenv("SCRAPER_CLAIM_BATCH", "16"))
+    LEASE_SECONDS = int(getenv("SCRAPER_LEASE_SECONDS", "600"))
+    POLL_INTERVAL = int(getenv("SCRAPER_POLL_INTERVAL", "30"))
+    # seconds between re-checks of a scraped ad: the minimum right after it changed,
+    # doubling while it stays the same up to the maximum
+    REFRESH_MIN_INTERVAL = int(getenv("SCRAPER_REFRESH_MIN_INTERVAL", "3600"))
+    REFRESH_MAX_INTERVAL = int(getenv("SCRAPER_REFRESH_MAX_INTERVAL", "86400"))
+    # a phone number on this many ads is an agent's: it is blocked and its ads are deleted
+    AGENT_PHONE_THRESHOLD = int(getenv("SCRAPER_AGENT_PHONE_THRESHOLD", "3"))
+    # points the scraper at a stand-in server (see webscrape/benchmarks/olx_standin.py)
+    OLX_BASE_URL = getenv("OLX_BASE_URL", "https://www.olx.uz").rstrip("/")
+
+class Metrics:
+    # Prometheus text format on http://HOST:PORT/metrics; 0 disables the endpoint
+    HOST = getenv("METRICS_HOST", "127.0.0.1")
+    PORT = int(getenv("METRICS_PORT", "9100"))
+    WORKER_PORT = int(getenv("METRICS_WORKER_PORT", "9101"))
+
 class Env:
     bot = Bot()
     db = DB()
     web = Web()
     pay = Payment()
     key= OpenApi()
+    scraper = Scraper()
+    metrics = Metrics()
@@ -1,12 +1,35 @@
 from bot.handler import *
 from db.models import Apartment,ApartmentUrl,ApartmentImage,AgentPhoneNumber
+from db.async_engine import async_engine, check_connection_budget
+from db.engine import Base, engine
+from db.migrations import apply_migrations
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from bot.file_cache import warmup_file_ids
+from bot.middlewares import TelegramMetricsMiddleware
+from bot.send_queue import SendQueueMiddleware, send_queue
+from environment.utils import Env
+from monitoring.metrics import start_metrics_server
 
 
 async def main() -> None:
-    bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    await dp.start_polling(bot)
+    # TELEGRAM_API_URL points the bot at a self-hosted or stand-in Bot API server
+    session = AiohttpSession(api=TelegramAPIServer.from_base(Env.bot.API_URL)) if Env.bot.API_URL else None
+    bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # every send goes through the rate-limited queue; registered first, so it is the outer one
+    bot.session.middleware(SendQueueMiddleware(send_queue))
+    bot.session.middleware(TelegramMetricsMiddleware())
+    start_metrics_server(Env.metrics.PORT, Env.metrics.HOST)
+    if Env.bot.FILE_WARMUP and Env.bot.ADMIN_CHAT_ID:
+        asyncio.create_task(warmup_file_ids(bot, Env.bot.ADMIN_CHAT_ID))
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await async_engine.dispose()
 
 if __name__ == "__main__":
     Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+    check_connection_budget(engine)
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1 @@
+from monitoring.metrics import REGISTRY, Counter, Histogram, counter, histogram, instrument_engine, start_metrics_server
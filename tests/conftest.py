@@ -0,0 +1,15 @@
+import os
+
+# db.engine refuses to import without these; nothing connects to PostgreSQL in the tests
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+os.environ.setdefault("DB_NAME", "test")
+
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+
+
+@compiles(ARRAY, "sqlite")
+def _array_as_text(type_, compiler, **kw):
+    # the tests run on SQLite; lsh_bands is never read by the queries under test
+    return "TEXT"
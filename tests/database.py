@@ -0,0 +1,51 @@
+import asyncio
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from db.models import Apartment, ApartmentImage, ApartmentUrl
+
+
+class Database:
+    """An in-memory SQLite database with the listing tables, counting the statements it runs."""
+
+    def __init__(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.statements: list[str] = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    async def create(self) -> None:
+        tables = [ApartmentUrl.__table__, Apartment.__table__, ApartmentImage.__table__]
+        async with self.engine.begin() as conn:
+            await conn.run_sync(lambda c: ApartmentUrl.metadata.create_all(c, tables=tables))
+
+    async def add_apartment(self, id: int, price: int, *, rooms: int = 2, district_id: int = 1,
+                            cluster_id: int = None, status: str = "active", images: int = 1) -> None:
+        # SQLite only autoincrements INTEGER keys, so ids are explicit
+        async with self.sessionmaker() as session:
+            session.add(ApartmentUrl(id=id, url=f"https://www.olx.uz/d/obyavlenie/{id}.html", status="done"))
+            session.add(Apartment(
+                id=id, title=f"Kvartira {id}", description="-", price=price, floor=1, total_storeys=9,
+                area=Decimal("50"), rooms=rooms, is_furnished=False, district="Chilonzor",
+                district_id=district_id, status=status, cluster_id=cluster_id, url_id=id,
+            ))
+            for n in range(images):
+                session.add(ApartmentImage(id=id * 100 + n, apartment_id=id, local_path=f"{id}/{n}.jpg"))
+            await session.commit()
+
+
+def run(scenario):
+    """Runs scenario(db) on a fresh database in one event loop (aiosqlite connections are loop-bound)."""
+    async def main():
+        database = Database()
+        await database.create()
+        try:
+            return await scenario(database)
+        finally:
+            await database.engine.dispose()
+    return asyncio.run(main())
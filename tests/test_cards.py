@@ -0,0 +1,46 @@
+from db.cards import CardImage, card_query, load_cards
+from db.models import Apartment
+from tests.database import run
+
+
+def test_page_of_cards_costs_two_queries():
+    async def scenario(db):
+        for i in range(1, 21):
+            await db.add_apartment(i, 100 + i, images=3)
+        db.statements.clear()
+        async with db.sessionmaker() as session:
+            rows = (await session.execute(card_query().order_by(Apartment.price, Apartment.id))).all()
+            cards = await load_cards(session, rows)
+        return cards, list(db.statements)
+
+    cards, statements = run(scenario)
+    assert len(cards) == 20
+    # the card projection, then one IN (...) query for every card's images: not 1 + 2N
+    assert len(statements) == 2
+    assert "JOIN apartmenturls" in statements[0]
+    assert "apartment_images" in statements[1] and " IN " in statements[1]
+    assert all(len(card.images) == 3 for card in cards)
+
+
+def test_cards_are_detached_tuples():
+    async def scenario(db):
+        await db.add_apartment(1, 300, images=2)
+        await db.add_apartment(2, 200, images=0)
+        async with db.sessionmaker() as session:
+            rows = (await session.execute(card_query().order_by(Apartment.price))).all()
+            return await load_cards(session, rows)
+
+    no_photos, card = run(scenario)
+    assert no_photos.id == 2 and no_photos.images == ()
+    assert card.url == "https://www.olx.uz/d/obyavlenie/1.html"
+    assert card.images == (CardImage(100, "1/0.jpg", None, None), CardImage(101, "1/1.jpg", None, None))
+    assert "💰 Narx: $300" in card.text()
+
+
+def test_empty_page_runs_no_image_query():
+    async def scenario(db):
+        async with db.sessionmaker() as session:
+            db.statements.clear()
+            return await load_cards(session, []), list(db.statements)
+
+    assert run(scenario) == ([], [])
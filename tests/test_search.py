@@ -0,0 +1,60 @@
+from db.search import SearchFilters, browse_page, search_page
+from tests.database import run
+
+
+def ids(cards):
+    return [card.id for card in cards]
+
+
+def test_search_pages_in_price_order():
+    async def scenario(db):
+        for i, price in enumerate([500, 300, 400, 300, 700, 600, 450], start=1):
+            await db.add_apartment(i, price)
+        filters = SearchFilters(district_id=1, rooms=2, min_price=0, max_price=1000)
+        async with db.sessionmaker() as session:
+            first, cursor = await search_page(session, filters, limit=3)
+            second, cursor2 = await search_page(session, filters, after=cursor, limit=3)
+            third, cursor3 = await search_page(session, filters, after=cursor2, limit=3)
+        return ids(first), cursor, ids(second), ids(third), cursor3
+
+    first, cursor, second, third, last_cursor = run(scenario)
+    assert first == [2, 4, 3]
+    assert cursor == (400, 3)
+    assert second == [7, 1, 6]
+    assert third == [5]
+    assert last_cursor is None
+
+
+def test_search_keeps_cluster_when_newest_repost_is_outside_filters():
+    async def scenario(db):
+        # 1 is the first ad, 2 a repost of it at a price above the user's range
+        await db.add_apartment(1, 400)
+        await db.add_apartment(2, 900, cluster_id=1)
+        # 3 and 4 are both in range: only the newer one is shown
+        await db.add_apartment(3, 350)
+        await db.add_apartment(4, 360, cluster_id=3)
+        # an inactive repost does not hide the active original
+        await db.add_apartment(5, 420)
+        await db.add_apartment(6, 410, cluster_id=5, status="inactive")
+        async with db.sessionmaker() as session:
+            cards, _ = await search_page(session, SearchFilters(1, 2, 0, 500))
+        return ids(cards)
+
+    assert run(scenario) == [4, 1, 5]
+
+
+def test_browse_pages_forwards_and_backwards():
+    async def scenario(db):
+        for i in range(1, 8):
+            await db.add_apartment(i, 100 * i)
+        await db.add_apartment(8, 250, cluster_id=2)
+        async with db.sessionmaker() as session:
+            first, prev1, next1 = await browse_page(session, limit=3)
+            second, prev2, next2 = await browse_page(session, after=next1, limit=3)
+            back, prev3, next3 = await browse_page(session, before=prev2, limit=3)
+        return (ids(first), prev1, next1), (ids(second), prev2, next2), (ids(back), prev3, next3)
+
+    first, second, back = run(scenario)
+    assert first == ([1, 8, 3], None, (300, 3))
+    assert second == ([4, 5, 6], (400, 4), (600, 6))
+    assert back == first
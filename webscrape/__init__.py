@@ -1,3 +1,5 @@
+from webscrape.olx_session import *
+from webscrape.olx_parsers import *
 from webscrape.olx_utils import *
 from webscrape.process_olx import *
 from webscrape.scrapping_urls_olx import *
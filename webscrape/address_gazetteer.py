@@ -0,0 +1,390 @@
+import re
+from collections import deque
+from typing import Optional
+
+# Offline fast path for address extraction. It follows the priority order of the LLM prompt in
+# address_llm.SYSTEM_PROMPT: street + number > landmark with qualifier/distance > landmark >
+# metro > массив + number. Names are matched with one Aho-Corasick pass over a transliteration
+# "folded" form of the text, so Cyrillic, Uzbek Latin and chat spellings (Do'stlik, Дўстлик,
+# Дустлик, dustlik) all hit the same entry. When nothing confident is found the caller falls
+# back to the LLM.
+
+STREET, LANDMARK_QUALIFIED, LANDMARK, METRO, MASSIV = range(5)
+
+# canonical name -> extra spellings; names marked with needs_cue are also districts, massivs or
+# streets and only count as a metro station next to "метро"/"м."/"metro"/"bekati"
+METRO_STATIONS = [
+    ("Олмазор", ["Алмазар", "Olmazor"], True),
+    ("Чиланзар", ["Чилонзор", "Chilonzor"], True),
+    ("Мирзо Улугбек", ["Mirzo Ulug'bek"], True),
+    ("Новза", ["Novza"], False),
+    ("Миллий Бог", ["Milliy bog'", "Миллий богʻ"], False),
+    ("Бунёдкор", ["Bunyodkor", "Дружба народов", "Xalqlar do'stligi"], True),
+    ("Пахтакор", ["Paxtakor"], False),
+    ("Мустакиллик Майдони", ["Mustaqillik maydoni", "Площадь Независимости"], False),
+    ("Амир Темур Хиёбони", ["Amir Temur xiyoboni", "Сквер Амира Темура"], False),
+    ("Хамид Олимжон", ["Hamid Olimjon", "Хамида Алимджана"], False),
+    ("Пушкин", ["Pushkin", "Пушкинская"], True),
+    ("Буюк Ипак Йули", ["Buyuk Ipak Yo'li", "Максима Горького"], False),
+    ("Беруний", ["Beruniy"], True),
+    ("Тинчлик", ["Tinchlik"], True),
+    ("Чорсу", ["Chorsu"], True),
+    ("Гафур Гулом", ["G'afur G'ulom", "Гафура Гуляма"], False),
+    ("Алишер Навои", ["Alisher Navoiy"], True),
+    ("Узбекистан", ["O'zbekiston"], True),
+    ("Космонавтлар", ["Kosmonavtlar", "Космонавтов"], False),
+    ("Ойбек", ["Oybek", "Айбек"], True),
+    ("Ташкент", ["Toshkent"], True),
+    ("Машинасозлар", ["Mashinasozlar", "Машиностроителей"], False),
+    ("Дустлик", ["Do'stlik"], False),
+    ("Минг Урик", ["Ming O'rik"], False),
+    ("Юнус Раджабий", ["Yunus Rajabiy", "Юнуса Раджаби"], False),
+    ("Абдулла Кадыри", ["Abdulla Qodiriy", "Абдуллы Кадыри"], False),
+    ("Минор", ["Minor"], True),
+    ("Бодомзор", ["Bodomzor"], False),
+    ("Шахристан", ["Shahriston", "Хабиб Абдуллаев"], False),
+    ("Юнусабад", ["Yunusobod"], True),
+    ("Туркистон", ["Turkiston"], True),
+    ("Янгихаёт", ["Yangihayot"], True),
+    ("Чоштепа", ["Choshtepa"], True),
+    ("Сергели", ["Sergeli"], True),
+    ("Куйлюк", ["Qo'yliq"], True),
+    ("Технопарк", ["Texnopark"], True),
+]
+
+LANDMARKS = [
+    ("Сезам", ["Sezam"]),
+    ("Корзинка", ["Korzinka"]),
+    ("Макро", ["Makro"]),
+    ("Мега Планет", ["Mega Planet"]),
+    ("Самарканд Дарвоза", ["Samarqand Darvoza"]),
+    ("Ташкент Сити", ["Tashkent City", "Toshkent Siti"]),
+    ("Некст", ["Next"]),
+    ("Компас", ["Compass", "Kompas"]),
+    ("Ривьера", ["Riviera"]),
+    ("Алайский базар", ["Алайский", "Oloy bozori"]),
+    ("Чорсу базар", ["Chorsu bozori"]),
+    ("Фархадский базар", ["Farhod bozori"]),
+    ("Куйлюк базар", ["Qo'yliq bozori"]),
+    ("Ипподром", ["Ippodrom"]),
+    ("Хадра", ["Xadra"]),
+    ("Анхор", ["Anhor"]),
+    ("Цирк", ["Sirk", "Tsirk"]),
+    ("Телебашня", ["Teleminora", "Телевышка"]),
+    ("Ботанический сад", ["Botanika bog'i"]),
+    ("Мэджик Сити", ["Magic City"]),
+    ("Бродвей", ["Broadway"]),
+    ("Ойбек базар", ["Oybek bozori"]),
+    ("Мирабадский базар", ["Mirobod bozori"]),
+    ("ЦУМ", ["TSUM", "Tsum"]),
+    ("Госпиталь", ["Gospital"]),
+    ("Больница Жуковский", ["Жуковский", "Jukovskiy"]),
+    ("Юнусабадская налоговая", ["Юнус-Абадская налоговая", "Yunusobod soliq"]),
+]
+
+MASSIVS = [
+    ("Чиланзар", ["Чилонзор", "Chilonzor"]),
+    ("Юнусабад", ["Yunusobod"]),
+    ("Карасу", ["Qorasuv", "Korasu"]),
+    ("Куйлюк", ["Qo'yliq", "Kuylyuk"]),
+    ("Сергели", ["Sergeli"]),
+    ("Кушбеги", ["Qushbegi"]),
+    ("Себзар", ["Sebzor"]),
+    ("Бешагач", ["Beshyog'och"]),
+    ("Феруза", ["Feruza"]),
+    ("Каракамыш", ["Qoraqamish"]),
+    ("Ялангач", ["Yalang'och"]),
+    ("Карасарай", ["Qorasaroy"]),
+    ("Кукча", ["Ko'kcha"]),
+    ("Высоковольтный", ["Visokovoltniy"]),
+    ("ТТЗ", ["TTZ"]),
+]
+
+# single-letter targets keep the folded form stable between scripts (ч/ch/c -> c, ш/sh/w -> w)
+_CYR_FOLD = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "s", "ч": "c", "ш": "w", "щ": "w",
+    "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya", "ў": "u", "қ": "k", "ғ": "g",
+    "ҳ": "h",
+}
+_APOSTROPHES = "'’ʻʼ`‘"
+_LATIN_FOLD = [("dj", "j"), ("zh", "j"), ("kh", "h"), ("ch", "c"), ("sh", "w"), ("ts", "s"),
+               ("x", "h"), ("q", "k"), ("o", "a")]
+_TRAILING_IY_RE = re.compile(r"iy\b")
+
+# folded spellings of м. / метро / metrosi / станция / bekati
+_METRO_CUES = {"m", "metra", "metrasi", "st", "stansiya", "bekati", "bekat"}
+_RU_QUALIFIERS = {
+    "za": "за", "vazle": "возле", "akala": "около", "naprativ": "напротив", "ryadam s": "рядом с",
+    "ryadam": "рядом с",
+}
+_UZ_QUALIFIERS = {
+    "arkasida": "сзади", "artida": "сзади", "yanida": "рядом", "yakinida": "рядом",
+    "ruparasida": "напротив", "aldida": "перед",
+}
+_DISTANCE_RE = re.compile(r"(\d+)\s*(astanavk\w*|minut\w*|min|bekat\w*)\s*(?:pewkam\s*)?(?:at|da|dan)?$")
+# the number must come with массив/mavze/квартал, "Чиланзар 3 комнаты" is not a massiv
+_MASSIV_NUMBER_AFTER_RE = re.compile(r"^\s*(\d{1,2})\s*(?:massiv|mavze|kvartal|kv\b)")
+_MAX_SUFFIX = 5
+
+_WORD = r"[A-ZА-ЯЁЎҚҒҲ][\w'’ʻ\-]+"
+STREET_RU_RE = re.compile(
+    r"(?i:\bул\.|\bулица|\bпр-т|\bпроспект|\bпр\.|\bпереулок|\bпер\.)\s*"
+    rf"({_WORD}(?:\s{_WORD})?)[,\s]*(?i:дом\s*|д\.\s*)?(\d{{1,3}}[а-яa-z]?)\b"
+)
+# Ц-1 … Ц-6 quarters in the centre; needs the hyphen, "с 2 комнатами" must not match
+CENTER_RE = re.compile(r"(?<!\w)[ЦC]\s?-\s?(\d{1,2})\b")
+STREET_UZ_RE = re.compile(
+    rf"({_WORD}(?:\s{_WORD})?)\s+(?i:ko['’ʻ`]?chasi|кўчаси|kuchasi|кучаси)[,\s]*(?i:uy\s*)?(\d{{1,3}}[a-zа-я]?)\b"
+)
+
+_LAT_TO_CYR = [
+    ("o'", "ў"), ("o’", "ў"), ("oʻ", "ў"), ("g'", "ғ"), ("g’", "ғ"), ("gʻ", "ғ"),
+    ("sh", "ш"), ("ch", "ч"), ("yo", "ё"), ("yu", "ю"), ("ya", "я"), ("ye", "е"),
+    ("a", "а"), ("b", "б"), ("d", "д"), ("e", "е"), ("f", "ф"), ("g", "г"), ("h", "ҳ"), ("i", "и"),
+    ("j", "ж"), ("k", "к"), ("l", "л"), ("m", "м"), ("n", "н"), ("o", "о"), ("p", "п"), ("q", "қ"),
+    ("r", "р"), ("s", "с"), ("t", "т"), ("u", "у"), ("v", "в"), ("x", "х"), ("y", "й"), ("z", "з"),
+    ("w", "ш"), ("c", "ц"),
+]
+
+
+def fold(text: str) -> str:
+    """
+    Folds Cyrillic / Uzbek Latin / chat spellings of a name to one comparable Latin form.
+    """
+    text = text.lower()
+    # Uzbek o' is ў, which Russian spells у (Do'stlik / Дўстлик / Дустлик)
+    for apostrophe in _APOSTROPHES:
+        text = text.replace("o" + apostrophe, "u")
+    out = []
+    for ch in text:
+        if ch in _CYR_FOLD:
+            out.append(_CYR_FOLD[ch])
+        elif ch in _APOSTROPHES:
+            continue
+        elif ch.isalnum():
+            out.append(ch)
+        else:
+            out.append(" ")
+    text = "".join(out)
+    for src, dst in _LATIN_FOLD:
+        text = text.replace(src, dst)
+    text = _TRAILING_IY_RE.sub("i", text)
+    return " ".join(text.split())
+
+
+def to_cyrillic(name: str) -> str:
+    if re.search(r"[А-Яа-яЁёЎўҚқҒғҲҳ]", name):
+        return name
+    out = []
+    i = 0
+    lower = name.lower()
+    while i < len(name):
+        for src, dst in _LAT_TO_CYR:
+            if lower.startswith(src, i):
+                out.append(dst.upper() if name[i].isupper() else dst)
+                i += len(src)
+                break
+        else:
+            out.append(name[i])
+            i += 1
+    return "".join(out)
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: finds every occurrence of every pattern in one pass over the text.
+    """
+
+    def __init__(self):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+        self.patterns: list[str] = []
+        self._built = False
+
+    def add(self, pattern: str) -> int:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self.patterns.append(pattern)
+        self._out[node].append(len(self.patterns) - 1)
+        self._built = False
+        return len(self.patterns) - 1
+
+    def build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def iter(self, text: str):
+        """
+        Yields (start, end, pattern_id) for every match, end exclusive.
+        """
+        if not self._built:
+            self.build()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pid in self._out[node]:
+                yield i + 1 - len(self.patterns[pid]), i + 1, pid
+
+
+class Gazetteer:
+    def __init__(self):
+        self.matcher = AhoCorasick()
+        # pattern id -> (kind, canonical name, needs_cue)
+        self.entries: dict[int, tuple[int, str, bool]] = {}
+        for name, aliases, needs_cue in METRO_STATIONS:
+            self._add(METRO, name, aliases, needs_cue)
+        for name, aliases in LANDMARKS:
+            self._add(LANDMARK, name, aliases, False)
+        for name, aliases in MASSIVS:
+            self._add(MASSIV, name, aliases, False)
+        self.matcher.build()
+
+    def _add(self, kind: int, name: str, aliases: list[str], needs_cue: bool) -> None:
+        for spelling in {fold(name), *(fold(a) for a in aliases)}:
+            if spelling:
+                self.entries[self.matcher.add(spelling)] = (kind, name, needs_cue)
+
+    def matches(self, folded: str):
+        """
+        Yields (kind, name, needs_cue, start, end) for whole-word matches; up to a few
+        trailing letters are allowed for case endings and Uzbek suffixes (Чиланзаре, Sezamdan).
+        """
+        for start, end, pid in self.matcher.iter(folded):
+            if start > 0 and folded[start - 1] != " ":
+                continue
+            suffix_end = end
+            while suffix_end < len(folded) and folded[suffix_end].isalpha():
+                suffix_end += 1
+            if suffix_end - end > _MAX_SUFFIX:
+                continue
+            kind, name, needs_cue = self.entries[pid]
+            yield kind, name, needs_cue, start, suffix_end
+
+
+GAZETTEER = Gazetteer()
+
+
+def _tokens_before(folded: str, start: int, n: int) -> list[str]:
+    return folded[:start].split()[-n:]
+
+
+def _tokens_after(folded: str, end: int, n: int) -> list[str]:
+    return folded[end:].split()[:n]
+
+
+def _plural_stops(n: int) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return "остановка"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return "остановки"
+    return "остановок"
+
+
+def _distance_prefix(folded: str, start: int) -> Optional[str]:
+    tokens = folded[max(0, start - 40):start].split()
+    while tokens and tokens[-1] in _METRO_CUES:
+        tokens.pop()
+    m = _DISTANCE_RE.search(" ".join(tokens))
+    if not m:
+        return None
+    n = int(m.group(1))
+    unit = m.group(2)
+    if unit.startswith("min"):
+        return f"{n} мин от"
+    return f"{n} {_plural_stops(n)} от"
+
+
+def _qualifier(folded: str, start: int, end: int) -> Optional[tuple[str, bool]]:
+    # (qualifier text, goes before the name)
+    before = _tokens_before(folded, start, 2)
+    if len(before) == 2 and " ".join(before) in _RU_QUALIFIERS:
+        return _RU_QUALIFIERS[" ".join(before)], True
+    if before and before[-1] in _RU_QUALIFIERS and before[-1] != "u":
+        return _RU_QUALIFIERS[before[-1]], True
+    for token in _tokens_after(folded, end, 2):
+        if token in _UZ_QUALIFIERS:
+            return _UZ_QUALIFIERS[token], False
+    return None
+
+
+def _street(description: str) -> Optional[tuple[int, str]]:
+    best = None
+    m = STREET_RU_RE.search(description)
+    if m:
+        best = (m.start(), f"ул. {to_cyrillic(m.group(1))} {m.group(2)}")
+    m = STREET_UZ_RE.search(description)
+    if m and (best is None or m.start() < best[0]):
+        best = (m.start(), f"ул. {to_cyrillic(m.group(1))} {m.group(2)}")
+    return best
+
+
+def extract_address_local(description: str) -> Optional[str]:
+    """
+    Returns the best address found with the gazetteer, or None when there is no confident
+    match (nothing found, or only a district/massiv name without number).
+    """
+    if not description:
+        return None
+    street = _street(description)
+    if street:
+        return street[1]
+
+    folded = fold(description)
+    candidates: list[tuple[int, int, str]] = []  # (priority, position, address)
+    for kind, name, needs_cue, start, end in GAZETTEER.matches(folded):
+        if kind == METRO:
+            before = _tokens_before(folded, start, 1)
+            after = _tokens_after(folded, end, 1)
+            has_cue = bool(set(before + after) & _METRO_CUES)
+            if needs_cue and not has_cue:
+                continue
+            address = f"м. {name}"
+            distance = _distance_prefix(folded, start)
+            if distance:
+                candidates.append((LANDMARK_QUALIFIED, start, f"{distance} {address}"))
+            else:
+                candidates.append((METRO, start, address))
+        elif kind == LANDMARK:
+            distance = _distance_prefix(folded, start)
+            qualifier = _qualifier(folded, start, end)
+            if distance:
+                candidates.append((LANDMARK_QUALIFIED, start, f"{distance} {name}"))
+            elif qualifier:
+                text, before = qualifier
+                address = f"{text} {name}" if before else f"{name}, {text}"
+                candidates.append((LANDMARK_QUALIFIED, start, address))
+            else:
+                candidates.append((LANDMARK, start, name))
+        elif kind == MASSIV:
+            m = _MASSIV_NUMBER_AFTER_RE.match(folded[end:])
+            if m:
+                candidates.append((MASSIV, start, f"{name} {m.group(1)} массив"))
+    m = CENTER_RE.search(description)
+    if m:
+        candidates.append((MASSIV, len(folded), f"Ц-{m.group(1)}"))
+
+    if not candidates:
+        return None
+    return min(candidates)[2]
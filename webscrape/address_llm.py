@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+import weakref
+from typing import Optional
+
+from openai import AsyncOpenAI
+from sqlalchemy.dialects.postgresql import insert
+
+from db.engine import SessionLocal
+from db.models import AddressCache
+from environment.utils import Env
+from monitoring.metrics import counter, histogram
+from webscrape.address_gazetteer import extract_address_local
+
+key = Env.key.OPENAI_API_KEY
+BASE_URL = Env.key.OPENAI_BASE_URL
+MODEL = Env.key.OPENAI_MODEL
+MAX_CONCURRENCY = Env.key.OPENAI_MAX_CONCURRENCY
+MEMORY_CACHE_SIZE = 10_000
+
+ADDRESS_LOOKUPS = counter("scraper_address_lookups_total", "Address lookups by where the answer came from", ("source",))
+LLM_SECONDS = histogram("scraper_llm_seconds", "Latency of OpenAI address extraction calls", ("outcome",))
+
+NON_WORD_RE = re.compile(r"[^\w]+")
+
+SYSTEM_PROMPT = (
+    "You are a strict address extractor for short property rental ads.\n"
+    "RULES (priority & behavior):\n"
+    "1) Extract ONLY the single best address/location from the ad and NOTHING else.\n"
+    "2) Prefer more specific actionable locations in this order (highest -> lowest):\n"
+    "   a) street + number (e.g., 'ул. Лермонтова 5')\n"
+    "   b) landmark with qualifier or direction/distance (e.g., '3 остановки от м. Дустлик', 'за Сезам', 'рядом с больница Жуковский')\n"
+    "   c) metro name (e.g., 'м. Дустлик', 'Метро: Янгиҳаёт')\n"
+    "   d) массив/массив + number (e.g., 'Чилонзор 18 массив')\n"
+    "   e) район/туман only as a last resort.\n"
+    "3) IMPORTANT: If the ad contains a district/район/туман/масcив **only** and no more specific location (no street, no landmark, no metro/distance), RETURN the string 'null' (lowercase) — do NOT return the generic district as the address.\n"
+    "4) If both a generic region and a more specific cue exist, return the MORE SPECIFIC cue (e.g., if text has 'Яшнабадский район' and '3 остановки от м. Дустлик', return '3 остановки от м. Дустлик').\n"
+    "5) Normalize to Russian/Cyrillic — transliterate Latin-script Uzbek/English to Russian phonetics when needed (e.g., 'Yangihayot' -> 'Янгиҳаёт', 'sezam' -> 'Сезам').\n"
+    "6) Capitalize appropriately (e.g., 'Больница Жуковский', 'Метрo: Янгиҳаёт').\n"
+    "7) Output EXACTLY one string — the address text alone (no JSON, no quotes, no punctuation wrappers). If no appropriate address is found, output the literal string: null\n"
+    "8) Do NOT output any explanation, extra text, or other fields — only a single line containing the address or 'null'.\n"
+    "\n"
+    "EXAMPLES (input -> output):\n"
+    "Input:\n"
+    "Xamma waroilari bn yangi remontdan ciqqan ... yunusobod 4kv da kvartira  sezam orqasida joylawgan\n"
+    "Output:\n"
+    "Сезам, сзади\n"
+    "\n"
+    "Input:\n"
+    "Chilonzor 18 mavzeda Arendaga kvartira qizlarga. 2 ta qiz kerak ...\n"
+    "Output:\n"
+    "Чилонзор 18 массив\n"
+    "\n"
+    "Input:\n"
+    "Предлагается ... в центре на Ц - 6, ориентир Юнус-Абадская налоговая. ...\n"
+    "Output:\n"
+    "Юнус-Абадская налоговая\n"
+    "\n"
+    "Input:\n"
+    "Предложение только для иностранных граждан. ... в Яшнабадском районе, 3 остановки от м. Дустлик. ...\n"
+    "Output:\n"
+    "3 остановки от м. Дустлик\n"
+    "\n"
+    "Input:\n"
+    "Уютная квартира, рядом школа и парк. Без точного адреса, подробности в Telegram.\n"
+    "Output:\n"
+    "null\n"
+)
+
+
+def normalize_description(description: str) -> str:
+    # reposts differ in case, spacing, emoji and punctuation; none of it changes the address
+    text = description.lower().replace("ё", "е")
+    text = NON_WORD_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def description_hash(description: str) -> str:
+    return hashlib.sha256(normalize_description(description).encode("utf-8")).hexdigest()
+
+
+def build_messages(description: str) -> list[dict]:
+    user_prompt = (
+        "Extract the single best address/location from the following advertisement.\n\n"
+        f"---\n{description.strip()}\n---\n\n"
+        "Return EXACTLY one string."
+    )
+    # the system prompt is identical on every call, so it stays a cacheable prompt prefix
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def parse_answer(content: str | None) -> Optional[str]:
+    text = (content or "").strip().strip('"')
+    return None if not text or text.lower() in ("null", "none") else text
+
+
+def load_cached(hashes: list[str]) -> dict[str, Optional[str]]:
+    if not hashes:
+        return {}
+    session_db = SessionLocal()
+    try:
+        rows = session_db.query(AddressCache).filter(AddressCache.description_hash.in_(hashes)).all()
+        return {row.description_hash: row.address for row in rows}
+    finally:
+        session_db.close()
+
+
+def store_cached(digest: str, address: Optional[str]) -> None:
+    session_db = SessionLocal()
+    try:
+        session_db.execute(
+            insert(AddressCache)
+            .values(description_hash=digest, address=address, model=MODEL)
+            .on_conflict_do_nothing(index_elements=[AddressCache.description_hash])
+        )
+        session_db.commit()
+    finally:
+        session_db.close()
+
+
+class _LoopState:
+    """What AddressExtractor needs per event loop: asyncio objects and httpx clients are loop-bound."""
+
+    def __init__(self, api_key: str | None, base_url: str | None, max_concurrency: int):
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+
+class AddressExtractor:
+    """
+    Address extraction: descriptions that name a known street, landmark, metro station or
+    massiv are resolved locally by the gazetteer; the rest go through a persistent cache
+    keyed by the normalized description hash and then the LLM.
+    Each event loop gets its own AsyncOpenAI client, semaphore (at most max_concurrency
+    requests in flight) and in-flight table, so concurrent ingestion runs in different
+    threads never share loop-bound objects; a run calls aclose() when it ends. The
+    memory cache is shared. Reposted ads hit the cache and cost no LLM call; identical
+    descriptions requested concurrently in one loop share a single call.
+    OPENAI_BASE_URL can point the client at a local stub endpoint.
+    """
+
+    def __init__(self, api_key: str | None = key, base_url: str | None = BASE_URL,
+                 model: str = MODEL, max_concurrency: int = MAX_CONCURRENCY):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self._memory: dict[str, Optional[str]] = {}
+        # dropped with the loop if a run ends without aclose()
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self._states_lock = threading.Lock()
+        self.local_hits = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+
+    def _count(self, attr: str, source: str) -> None:
+        setattr(self, attr, getattr(self, attr) + 1)
+        ADDRESS_LOOKUPS.inc(source=source)
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._states_lock:
+            state = self._states.get(loop)
+            if state is None:
+                if not self.api_key:
+                    raise RuntimeError("OPENAI_API_KEY environment variable not set")
+                state = self._states[loop] = _LoopState(self.api_key, self.base_url, self.max_concurrency)
+            return state
+
+    async def aclose(self) -> None:
+        """Closes the running loop's client; the next call in this loop opens a new one."""
+        with self._states_lock:
+            state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.client.close()
+
+    async def _call_llm(self, state: _LoopState, description: str) -> Optional[str]:
+        async with state.semaphore:
+            self._count("llm_calls", "llm")
+            t0 = time.perf_counter()
+            try:
+                resp = await state.client.chat.completions.create(
+                    model=self.model,
+                    messages=build_messages(description),
+                    temperature=0.0,
+                    max_tokens=20,
+                )
+            except Exception:
+                LLM_SECONDS.observe(time.perf_counter() - t0, outcome="error")
+                raise
+            LLM_SECONDS.observe(time.perf_counter() - t0, outcome="ok")
+        return parse_answer(resp.choices[0].message.content)
+
+    async def _extract_uncached(self, digest: str, description: str) -> Optional[str]:
+        state = self._state()
+        future = state.in_flight.get(digest)
+        if future is not None:
+            return await future
+        future = asyncio.get_running_loop().create_future()
+        state.in_flight[digest] = future
+        try:
+            address = await self._call_llm(state, description)
+            await asyncio.to_thread(store_cached, digest, address)
+            self._memory[digest] = address
+            future.set_result(address)
+            return address
+        except Exception as e:
+            future.set_exception(e)
+            # the exception is re-raised here; mark it retrieved for waiters that never come
+            future.exception()
+            raise
+        finally:
+            state.in_flight.pop(digest, None)
+
+    def _remember(self, cached: dict[str, Optional[str]]) -> None:
+        if len(self._memory) > MEMORY_CACHE_SIZE:
+            self._memory.clear()
+        self._memory.update(cached)
+
+    def _extract_local(self, description: str) -> Optional[str]:
+        address = extract_address_local(description)
+        if address is not None:
+            self._count("local_hits", "gazetteer")
+        return address
+
+    async def extract(self, description: str) -> Optional[str]:
+        address = self._extract_local(description)
+        if address is not None:
+            return address
+        self._state()  # fail fast without an API key, before the cache lookup
+        digest = description_hash(description)
+        if digest in self._memory:
+            self._count("cache_hits", "cache")
+            return self._memory[digest]
+        cached = await asyncio.to_thread(load_cached, [digest])
+        if digest in cached:
+            self._count("cache_hits", "cache")
+            self._remember(cached)
+            return cached[digest]
+        return await self._extract_uncached(digest, description)
+
+
+address_extractor = AddressExtractor()
+
+
+async def _extract_once(description: str) -> Optional[str]:
+    try:
+        return await address_extractor.extract(description)
+    finally:
+        await address_extractor.aclose()
+
+
+def extract_address_llm(description: str) -> Optional[str]:
+    """
+    Blocking helper for scripts and threads with no event loop; same gazetteer and cache
+    as AddressExtractor. Async code (the ingestion engine, bot handlers) must
+    await address_extractor.extract(description) instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_extract_once(description))
+    raise RuntimeError(
+        "extract_address_llm() blocks and cannot run inside an event loop; "
+        "use await address_extractor.extract(description)"
+    )
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from db.engine import SessionLocal
+from db.manager import agent_phones, phone_counts, promote_agent_phone
+from environment.utils import Env
+from webscrape.scrapping_olx import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+AGENT_PHONE_THRESHOLD = Env.scraper.AGENT_PHONE_THRESHOLD
+# other workers' ads only reach this process's counts on a reload
+RELOAD_SECONDS = 600
+
+
+class AgentPhoneIndex:
+    """
+    In-memory phone -> ad count index behind agent detection. Loaded from the database
+    (one GROUP BY plus the blocked list) and then kept current by record(), so checking a
+    number during ingestion is a dict lookup instead of a query.
+
+    A number is an agent's once it is on threshold ads: it goes into agentphonenumbers,
+    its apartments are deleted in one statement and later ads with it are dropped right
+    after the phone lookup, before the LLM and the image downloads.
+    """
+
+    def __init__(self, threshold: int = AGENT_PHONE_THRESHOLD, reload_seconds: float = RELOAD_SECONDS):
+        self.threshold = threshold
+        self.reload_seconds = reload_seconds
+        self._counts: Counter = Counter()
+        self._agents: set[str] = set()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.promoted = 0
+        self.purged = 0
+
+    def load(self) -> None:
+        session_db = SessionLocal()
+        try:
+            counts = Counter()
+            for phone, n in phone_counts(session_db):
+                normalized = normalize_phone(phone)
+                if normalized:
+                    counts[normalized] += n
+            agents = {n for n in map(normalize_phone, agent_phones(session_db)) if n}
+        finally:
+            session_db.close()
+        with self._lock:
+            self._counts = counts
+            self._agents = agents
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self) -> None:
+        # blocking (database); the ingestion engine calls it once per run from a thread
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_seconds:
+            self.load()
+
+    def is_agent(self, phone: Optional[str]) -> bool:
+        return bool(phone) and phone in self._agents
+
+    def record(self, phone: Optional[str]) -> bool:
+        """
+        Counts one more ad for phone. Returns True when this ad makes the number an
+        agent's: the caller then drops the ad and calls promote().
+        """
+        if not phone:
+            return False
+        with self._lock:
+            if phone in self._agents:
+                return True
+            self._counts[phone] += 1
+            if self._counts[phone] < self.threshold:
+                return False
+            self._agents.add(phone)
+            return True
+
+    def forget(self, phone: Optional[str]) -> None:
+        # the ad counted by record() was not saved after all
+        if not phone:
+            return
+        with self._lock:
+            if self._counts[phone] > 0:
+                self._counts[phone] -= 1
+
+    def promote(self, phone: str, agent_name: Optional[str] = None) -> int:
+        """Blocks phone in the database and deletes its apartments; returns how many."""
+        session_db = SessionLocal()
+        try:
+            deleted = promote_agent_phone(session_db, phone, agent_name)
+            session_db.commit()
+        finally:
+            session_db.close()
+        with self._lock:
+            self._counts.pop(phone, None)
+            self.promoted += 1
+            self.purged += deleted
+        logger.info("Phone %s is on %d+ ads, blocked as an agent; deleted %d apartments", phone, self.threshold, deleted)
+        return deleted
+
+
+agent_index = AgentPhoneIndex()
@@ -0,0 +1,215 @@
+"""
+Local stand-in for olx.uz used by the offline scraping benchmark.
+
+Serves listing pages, ad pages (recorded fixtures with their ID and photo URLs rewritten),
+the limited-phones JSON, photos, and an OpenAI-compatible chat completions stub, with
+configurable latency and error rates. Run standalone with
+
+    python -m webscrape.benchmarks.olx_standin --port 8099 --latency-ms 80 --error-rate 0.02
+
+and point the scraper at it with OLX_BASE_URL=http://127.0.0.1:8099.
+"""
+import argparse
+import asyncio
+import io
+import random
+import re
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+
+try:
+    from PIL import Image
+except ImportError:  # without Pillow the photos are random bytes
+    Image = None
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+SEARCH_PATH = "/nedvizhimost/kvartiry/arenda-dolgosrochnaya/tashkent/"
+FIRST_AD_ID = 50_000_000
+
+OFFER_ID_RE = re.compile(r"ID:\s*\d+")
+PHOTO_URL_RE = re.compile(r"https?://[^\"'\s]*olxcdn\.com[^\"'\s]*")
+LISTING_CARD = '<div data-cy="l-card" class="css-1sw7q4x"><a class="css-1tqlkj0" href="{href}">Квартира {ad_id}</a></div>'
+
+
+def load_ad_templates(fixtures_dir: Path) -> list[str]:
+    # recorded ad pages: *.html files that contain an offer ID (the parser fixtures qualify)
+    templates = []
+    for path in sorted(fixtures_dir.glob("*.html")):
+        html = path.read_text(encoding="utf-8")
+        if OFFER_ID_RE.search(html):
+            templates.append(html)
+    return templates
+
+
+def make_photos(count: int, seed: int) -> list[bytes]:
+    rnd = random.Random(seed)
+    photos = []
+    for _ in range(count):
+        if Image is None:
+            photos.append(rnd.randbytes(40_000))
+            continue
+        # distinct noise images, so the image store keeps every one of them
+        img = Image.frombytes("L", (160, 120), rnd.randbytes(160 * 120)).resize((640, 480)).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=80)
+        photos.append(buf.getvalue())
+    return photos
+
+
+class OlxStandIn:
+    """
+    aiohttp application imitating the parts of olx.uz the scraper touches.
+    pages x ads_per_page ads are listed; page numbers past the last return an empty page.
+    Every response waits latency_ms (+-jitter) and fails with 503/429 at error_rate.
+    """
+
+    def __init__(self, pages: int = 5, ads_per_page: int = 40, photos_per_ad: int = 5,
+                 latency_ms: float = 0.0, jitter: float = 0.5, error_rate: float = 0.0,
+                 fixtures_dir: Path = FIXTURES_DIR, seed: int = 1):
+        self.pages = pages
+        self.ads_per_page = ads_per_page
+        self.photos_per_ad = photos_per_ad
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.templates = load_ad_templates(fixtures_dir)
+        if not self.templates:
+            raise RuntimeError(f"No recorded ad pages in {fixtures_dir}")
+        self.photos = make_photos(max(photos_per_ad * 4, 1), seed)
+        self.random = random.Random(seed)
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.base_url = ""
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.base_url}{SEARCH_PATH}?currency=UYE"
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._inject])
+        app.router.add_get("/", self.home)
+        app.router.add_get(SEARCH_PATH, self.listing)
+        app.router.add_get("/d/obyavlenie/ad-{ad_id:\\d+}.html", self.ad)
+        app.router.add_get("/api/v1/offers/{ad_id:\\d+}/limited-phones/", self.phones)
+        app.router.add_get("/img/{ad_id:\\d+}/{n:\\d+}.jpg", self.photo)
+        app.router.add_post("/v1/chat/completions", self.chat_completion)
+        return app
+
+    @staticmethod
+    def _kind(request: web.Request) -> str:
+        path = request.path
+        if path.startswith("/d/"):
+            return "ad"
+        if path.startswith("/api/"):
+            return "phone"
+        if path.startswith("/img/"):
+            return "image"
+        if path.startswith("/v1/"):
+            return "llm"
+        return "listing" if path == SEARCH_PATH else "home"
+
+    @web.middleware
+    async def _inject(self, request: web.Request, handler):
+        kind = self._kind(request)
+        self.requests[kind] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+        if kind != "llm" and self.random.random() < self.error_rate:
+            self.errors[kind] += 1
+            if self.random.random() < 0.5:
+                return web.Response(status=429, headers={"Retry-After": "1"})
+            return web.Response(status=503)
+        return await handler(request)
+
+    async def home(self, request: web.Request) -> web.Response:
+        resp = web.Response(text="<html><body>OLX stand-in</body></html>", content_type="text/html")
+        resp.set_cookie("deviceGUID", "standin")
+        return resp
+
+    async def listing(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", "1"))
+        cards = []
+        if 1 <= page <= self.pages:
+            first = FIRST_AD_ID + (page - 1) * self.ads_per_page
+            for ad_id in range(first, first + self.ads_per_page):
+                cards.append(LISTING_CARD.format(href=f"/d/obyavlenie/ad-{ad_id}.html", ad_id=ad_id))
+        html = f"<html><body><main>{''.join(cards)}</main></body></html>"
+        return web.Response(text=html, content_type="text/html")
+
+    async def ad(self, request: web.Request) -> web.Response:
+        ad_id = int(request.match_info["ad_id"])
+        html = self.templates[ad_id % len(self.templates)]
+        html = OFFER_ID_RE.sub(f"ID: {ad_id}", html)
+        counter = iter(range(10_000))
+        html = PHOTO_URL_RE.sub(
+            lambda m: f"{self.base_url}/img/{ad_id}/{next(counter) % self.photos_per_ad}.jpg", html
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def phones(self, request: web.Request) -> web.Response:
+        ad_id = int(request.match_info["ad_id"])
+        return web.json_response({"data": {"phones": [f"+998 9{ad_id % 10**8:08d}"]}})
+
+    async def photo(self, request: web.Request) -> web.Response:
+        ad_id = int(request.match_info["ad_id"])
+        n = int(request.match_info["n"])
+        body = self.photos[(ad_id * self.photos_per_ad + n) % len(self.photos)]
+        return web.Response(body=body, content_type="image/jpeg")
+
+    async def chat_completion(self, request: web.Request) -> web.Response:
+        # minimal OpenAI chat.completions response; the benchmark measures the scraper, not the LLM
+        return web.json_response({
+            "id": "chatcmpl-standin",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "standin",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "null"},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 1, "total_tokens": 1},
+        })
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}"
+        return runner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OLX stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--ads-per-page", type=int, default=40)
+    parser.add_argument("--photos-per-ad", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    standin = OlxStandIn(args.pages, args.ads_per_page, args.photos_per_ad,
+                         latency_ms=args.latency_ms, error_rate=args.error_rate)
+
+    async def serve():
+        runner = await standin.start(args.host, args.port)
+        print(f"OLX stand-in on {standin.base_url}, search URL: {standin.search_url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmarks the OLX ad page parser backends on saved ad pages.
+
+    python -m webscrape.benchmarks.parser_benchmark                 # all installed backends
+    python -m webscrape.benchmarks.parser_benchmark -b bs4 -b selectolax -r 50
+    python -m webscrape.benchmarks.parser_benchmark --save URL [URL ...]
+
+Fixtures are the *.html files in webscrape/benchmarks/fixtures (or --fixtures DIR);
+--save downloads live ad pages there. Each backend runs in its own process so the
+reported peak memory (RSS growth and Python heap peak) is not shared between backends.
+Every backend's output is compared with the bs4 reference parse.
+"""
+import argparse
+import hashlib
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from webscrape.olx_parsers import BACKENDS, get_backend
+from webscrape.olx_session import olx_pool
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+FIXTURE_URL = "https://www.olx.uz/d/obyavlenie/fixture.html"
+
+
+def load_fixtures(fixtures_dir: Path) -> list[str]:
+    return [p.read_text(encoding="utf-8") for p in sorted(fixtures_dir.glob("*.html"))]
+
+
+def save_fixtures(urls: list[str], fixtures_dir: Path) -> None:
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    for url in urls:
+        with olx_pool.session() as http:
+            resp = http.get(url, timeout=15)
+        resp.raise_for_status()
+        path = fixtures_dir / f"{hashlib.sha1(url.encode()).hexdigest()[:12]}.html"
+        path.write_text(resp.text, encoding="utf-8")
+        print(f"Saved {url} -> {path}")
+
+
+def max_rss_kb() -> int:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_backend(name: str, pages: list[str], rounds: int) -> dict:
+    backend = get_backend(name)
+    reference = get_backend("bs4")
+    mismatches = sum(backend.parse(html, FIXTURE_URL) != reference.parse(html, FIXTURE_URL) for html in pages)
+
+    rss_before = max_rss_kb()
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            backend.parse(html, FIXTURE_URL)
+    elapsed = time.perf_counter() - t0
+    rss_growth = max_rss_kb() - rss_before
+
+    # separate pass: tracemalloc slows parsing down, so it is kept out of the timing
+    tracemalloc.start()
+    for html in pages:
+        backend.parse(html, FIXTURE_URL)
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    parsed = rounds * len(pages)
+    return {
+        "backend": name,
+        "ads": parsed,
+        "seconds": elapsed,
+        "ads_per_sec": parsed / elapsed if elapsed > 0 else 0.0,
+        "rss_growth_kb": rss_growth,
+        "heap_peak_kb": heap_peak // 1024,
+        "mismatches": mismatches,
+    }
+
+
+def run_isolated(name: str, fixtures_dir: Path, rounds: int) -> dict:
+    cmd = [sys.executable, "-m", __spec__.name, "--child", name, "--fixtures", str(fixtures_dir), "-r", str(rounds)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark OLX ad parser backends")
+    parser.add_argument("-b", "--backend", action="append", choices=sorted(BACKENDS),
+                        help="backend to run (repeatable), default: all installed")
+    parser.add_argument("-r", "--rounds", type=int, default=20, help="passes over the fixtures")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--save", nargs="+", metavar="URL", help="download ad pages into the fixtures dir")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.save:
+        save_fixtures(args.save, args.fixtures)
+        return
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, load_fixtures(args.fixtures), args.rounds)))
+        return
+
+    pages = load_fixtures(args.fixtures)
+    if not pages:
+        sys.exit(f"No *.html fixtures in {args.fixtures}")
+    print(f"{len(pages)} fixtures x {args.rounds} rounds")
+    print(f"{'backend':<12}{'ads/sec':>10}{'RSS growth':>14}{'heap peak':>12}{'mismatches':>12}")
+    for name in args.backend or sorted(BACKENDS):
+        r = run_isolated(name, args.fixtures, args.rounds)
+        print(
+            f"{r['backend']:<12}{r['ads_per_sec']:>10.1f}{r['rss_growth_kb']:>11} KB"
+            f"{r['heap_peak_kb']:>9} KB{r['mismatches']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
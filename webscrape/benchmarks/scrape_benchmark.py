@@ -0,0 +1,168 @@
+"""
+End-to-end scraping benchmark against the local OLX stand-in and a throwaway database.
+
+    python -m webscrape.benchmarks.scrape_benchmark --pages 5 --ads-per-page 40 --latency-ms 80 --error-rate 0.02
+
+Creates <DB_NAME>_bench_<pid> next to the configured database, starts the stand-in server,
+then runs get_all_urls_for_apart (listing crawl) and the ingestion engine in a child process
+whose OLX_BASE_URL, OPENAI_BASE_URL, DB_NAME and APARTMENT_IMG_DIR point at the stand-ins.
+Reports pages/sec, ads/sec, per-stage time, DB queries and server request/error counts;
+--json prints the same numbers as one JSON object for comparing runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import event, text
+
+from db.engine import DB_NAME, engine
+from webscrape.benchmarks.olx_standin import OlxStandIn
+
+
+class QueryCounter:
+    """Counts the statements sent through an engine by leading keyword, per benchmark phase."""
+
+    def __init__(self, bind):
+        self.phase = None
+        self.counts: dict[str, Counter] = defaultdict(Counter)
+        event.listen(bind, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.counts[self.phase][statement.lstrip().split(None, 1)[0].upper()] += 1
+
+
+def run_child(search_url: str) -> dict:
+    """Runs inside the child process, where the environment already points at the stand-ins."""
+    from db.engine import Base
+    from db.migrations import apply_migrations
+    from webscrape.process_olx import ingest_olx_ads
+    from webscrape.scrapping_urls_olx import get_all_urls_for_apart
+
+    Base.metadata.create_all(engine)
+    apply_migrations(engine)
+    queries = QueryCounter(engine)
+
+    queries.phase = "crawl"
+    t0 = time.perf_counter()
+    new_urls = get_all_urls_for_apart(search_url, incremental=False, ingest=False)
+    crawl_seconds = time.perf_counter() - t0
+
+    queries.phase = "ingest"
+    stats = asyncio.run(ingest_olx_ads())
+    return {
+        "new_urls": new_urls,
+        "crawl_seconds": crawl_seconds,
+        "crawl_queries": dict(queries.counts["crawl"]),
+        "ingest_seconds": stats.elapsed,
+        "ads_processed": stats.processed,
+        "ads_skipped": stats.skipped,
+        "ads_failed": stats.failed,
+        "ads_per_sec": stats.ads_per_sec,
+        "stage_seconds": dict(stats.stage_seconds),
+        "ingest_queries": dict(queries.counts["ingest"]),
+    }
+
+
+def create_database(name: str) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f'CREATE DATABASE "{name}"'))
+
+
+def drop_database(name: str) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+
+
+async def run_benchmark(args) -> dict:
+    standin = OlxStandIn(args.pages, args.ads_per_page, args.photos_per_ad,
+                         latency_ms=args.latency_ms, error_rate=args.error_rate)
+    runner = await standin.start()
+    db_name = f"{DB_NAME}_bench_{os.getpid()}"
+    await asyncio.to_thread(create_database, db_name)
+    try:
+        with tempfile.TemporaryDirectory(prefix="olx-bench-images-") as img_dir:
+            env = dict(
+                os.environ,
+                DB_NAME=db_name,
+                OLX_BASE_URL=standin.base_url,
+                OPENAI_BASE_URL=f"{standin.base_url}/v1",
+                OPENAI_API_KEY="standin",
+                APARTMENT_IMG_DIR=img_dir,
+            )
+            if args.max_in_flight:
+                env["SCRAPER_MAX_IN_FLIGHT"] = str(args.max_in_flight)
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", __spec__.name, "--child", standin.search_url,
+                env=env, stdout=asyncio.subprocess.PIPE,
+            )
+            out, _ = await proc.communicate()
+            if proc.returncode:
+                raise RuntimeError(f"benchmark child failed with exit code {proc.returncode}")
+            lines = out.decode().strip().splitlines()
+            if args.verbose:
+                print("\n".join(lines[:-1]))
+            result = json.loads(lines[-1])
+    finally:
+        await runner.cleanup()
+        if args.keep_db:
+            print(f"Kept benchmark database {db_name}")
+        else:
+            await asyncio.to_thread(drop_database, db_name)
+
+    result["listing_pages"] = standin.requests["listing"]
+    result["pages_per_sec"] = result["listing_pages"] / result["crawl_seconds"] if result["crawl_seconds"] else 0.0
+    result["server_requests"] = dict(standin.requests)
+    result["server_errors"] = dict(standin.errors)
+    result["config"] = {
+        "pages": args.pages, "ads_per_page": args.ads_per_page, "photos_per_ad": args.photos_per_ad,
+        "latency_ms": args.latency_ms, "error_rate": args.error_rate,
+    }
+    return result
+
+
+def print_report(r: dict) -> None:
+    print(f"Listing crawl: {r['listing_pages']} pages in {r['crawl_seconds']:.2f}s "
+          f"= {r['pages_per_sec']:.1f} pages/sec, {r['new_urls']} new URLs")
+    print(f"Ingestion: {r['ads_processed']} ads ({r['ads_skipped']} skipped, {r['ads_failed']} failed) "
+          f"in {r['ingest_seconds']:.2f}s = {r['ads_per_sec']:.2f} ads/sec")
+    for stage, seconds in sorted(r["stage_seconds"].items(), key=lambda kv: -kv[1]):
+        print(f"  {stage:<10}{seconds:>9.2f}s")
+    for phase in ("crawl_queries", "ingest_queries"):
+        queries = r[phase]
+        detail = ", ".join(f"{k}={v}" for k, v in sorted(queries.items()))
+        print(f"DB queries ({phase.split('_')[0]}): {sum(queries.values())} [{detail}]")
+    print(f"Server requests: {r['server_requests']}, injected errors: {r['server_errors']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end scraping benchmark")
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--ads-per-page", type=int, default=40)
+    parser.add_argument("--photos-per-ad", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-in-flight", type=int, help="overrides SCRAPER_MAX_IN_FLIGHT")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the throwaway database")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the scraper's own output")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child)))
+        return
+
+    result = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+
+from db.engine import SessionLocal
+from db.models import ApartmentImage
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it only byte-identical photos are de-duplicated
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BASE_IMG_DIR = Path(os.getenv(
+    "APARTMENT_IMG_DIR",
+    Path(__file__).resolve().parent.parent / "webscrape" / "images",
+))
+BLOB_DIR = BASE_IMG_DIR / "blobs"
+TMP_DIR = BLOB_DIR / "tmp"
+
+# max Hamming distance between perceptual hashes of the "same" photo
+PHASH_MAX_DISTANCE = 6
+# the hash (63 bits in a 64-bit int, the top one always 0) is split into 8 bands of 8 bits;
+# two hashes within distance 7 share at least one band
+PHASH_BANDS = 8
+PHASH_BAND_BITS = 64 // PHASH_BANDS
+
+_DCT_SIZE = 32
+_DCT_KEEP = 8
+_DCT_COS = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+    for u in range(_DCT_KEEP)
+]
+
+
+def to_signed64(value: int) -> int:
+    # perceptual hashes are unsigned 64-bit, postgres BIGINT is signed
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def perceptual_hash(path: Path) -> int | None:
+    """
+    DCT perceptual hash: 32x32 grayscale, low 8x8 frequencies without DC compared to their median.
+    Returns a 63-bit int (one bit per AC coefficient), or None when Pillow is missing or the
+    file is not an image.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            pixels = list(img.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.warning("Failed to hash image %s: %s", path, e)
+        return None
+
+    rows = [pixels[i * _DCT_SIZE:(i + 1) * _DCT_SIZE] for i in range(_DCT_SIZE)]
+    # separable 2D DCT, keeping only the 8 lowest frequencies in each direction
+    row_dct = [[sum(c * p for c, p in zip(_DCT_COS[u], row)) for u in range(_DCT_KEEP)] for row in rows]
+    coeffs = []
+    for v in range(_DCT_KEEP):
+        for u in range(_DCT_KEEP):
+            coeffs.append(sum(_DCT_COS[v][y] * row_dct[y][u] for y in range(_DCT_SIZE)))
+
+    ac = coeffs[1:]
+    median = sorted(ac)[len(ac) // 2]
+    value = 0
+    # DC is the mean brightness, not structure: it would be a bit that is set for nearly every photo
+    for c in ac:
+        value = (value << 1) | (1 if c > median else 0)
+    return value
+
+
+class PHashIndex:
+    """
+    In-memory band index over perceptual hashes: phash -> (local_path, content_hash).
+    Candidates are looked up by exact band match, then filtered by Hamming distance,
+    so a lookup touches only hashes that share a band instead of the whole store.
+    """
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._bands: list[dict[int, list[int]]] = [{} for _ in range(PHASH_BANDS)]
+        self._blobs: dict[int, tuple[str, str]] = {}
+        self._by_content: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._blobs)
+
+    @staticmethod
+    def _band_keys(phash: int):
+        mask = (1 << PHASH_BAND_BITS) - 1
+        for i in range(PHASH_BANDS):
+            yield i, (phash >> (i * PHASH_BAND_BITS)) & mask
+
+    def add(self, phash: int, local_path: str, content_hash: str) -> None:
+        if phash in self._blobs:
+            return
+        self._blobs[phash] = (local_path, content_hash)
+        self._by_content[content_hash] = phash
+        for i, key in self._band_keys(phash):
+            self._bands[i].setdefault(key, []).append(phash)
+
+    def phash_of(self, content_hash: str) -> int | None:
+        return self._by_content.get(content_hash)
+
+    def find(self, phash: int) -> tuple[str, str] | None:
+        best = None
+        best_distance = self.max_distance + 1
+        for i, key in self._band_keys(phash):
+            for candidate in self._bands[i].get(key, ()):
+                distance = bin(candidate ^ phash).count("1")
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return self._blobs[best] if best is not None else None
+
+
+class ImageStore:
+    """
+    Content-addressed image store under webscrape/images/blobs/<sha[:2]>/<sha><ext>.
+    Identical files are stored once; near-identical photos (by perceptual hash) reuse the
+    first stored blob, so several ApartmentImage rows can point at the same local_path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: PHashIndex | None = None
+
+    def _load_index(self) -> PHashIndex:
+        index = PHashIndex()
+        session_db = SessionLocal()
+        try:
+            rows = (
+                session_db.query(ApartmentImage.phash, ApartmentImage.local_path, ApartmentImage.content_hash)
+                .filter(ApartmentImage.phash.isnot(None))
+                .distinct()
+                .all()
+            )
+        finally:
+            session_db.close()
+        for phash, local_path, content_hash in rows:
+            index.add(to_unsigned64(phash), local_path, content_hash)
+        return index
+
+    @property
+    def index(self) -> PHashIndex:
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            return self._index
+
+    def blob_path(self, content_hash: str, ext: str) -> tuple[Path, str]:
+        relative = f"blobs/{content_hash[:2]}/{content_hash}{ext}"
+        return BLOB_DIR.parent / relative, relative
+
+    def store(self, tmp_path: Path, content_hash: str, ext: str) -> dict:
+        """
+        Moves a fully downloaded temp file into the store (or discards it when the same or a
+        near-identical photo is already stored). Returns the ApartmentImage columns for it.
+        """
+        full_path, local_path = self.blob_path(content_hash, ext)
+        if full_path.exists():
+            tmp_path.unlink(missing_ok=True)
+            index = self.index
+            with self._lock:
+                phash = index.phash_of(content_hash)
+            return {"local_path": local_path, "content_hash": content_hash,
+                    "phash": to_signed64(phash) if phash is not None else None}
+
+        phash = perceptual_hash(tmp_path)
+        if phash is not None:
+            index = self.index
+            with self._lock:
+                match = index.find(phash)
+            if match:
+                tmp_path.unlink(missing_ok=True)
+                match_path, match_hash = match
+                return {"local_path": match_path, "content_hash": match_hash, "phash": to_signed64(phash)}
+
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, full_path)
+        if phash is not None:
+            index = self.index
+            with self._lock:
+                index.add(phash, local_path, content_hash)
+        return {"local_path": local_path, "content_hash": content_hash,
+                "phash": to_signed64(phash) if phash is not None else None}
+
+
+image_store = ImageStore()
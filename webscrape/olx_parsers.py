@@ -0,0 +1,321 @@
+import logging
+import re
+from urllib.parse import urljoin, urlparse, parse_qs
+
+from bs4 import BeautifulSoup
+import soupsieve
+
+from environment.utils import Env
+
+logger = logging.getLogger(__name__)
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional fast backend
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # optional fast backend
+    lxml = None
+
+HTML_PARSER = Env.scraper.HTML_PARSER
+
+OFFER_ID_RE = re.compile(r"ID:\s*(\d+)")
+PRICE_RE = re.compile(r"([\d\s]+)")
+LOCATION_LABEL = "Местоположение"
+MAP_LINK_MARKER = "maps.google.com/maps?ll="
+
+# Every element the ad parser needs is either one of these "anchors" or inside one,
+# so each backend finds them all with a single precompiled query (results in document order)
+# and only looks inside the few anchors it gets back.
+ANCHORS_CSS = ", ".join([
+    "h1",
+    'div[data-testid="offer_title"]',
+    'div[data-testid="ad-price-container"]',
+    'div[data-testid="ad-parameters-container"]',
+    'div[data-testid="ad_description"]',
+    'div[data-testid="ad-photo"]',
+    'img[data-testid*="swiper-image"]',
+    "p",
+    '[data-testid="user-profile-user-name"]',
+    "span.css-w85dhy",
+    f'a[href*="{MAP_LINK_MARKER}"]',
+])
+ANCHORS_XPATH = " | ".join([
+    "//h1",
+    "//div[@data-testid='offer_title']",
+    "//div[@data-testid='ad-price-container']",
+    "//div[@data-testid='ad-parameters-container']",
+    "//div[@data-testid='ad_description']",
+    "//div[@data-testid='ad-photo']",
+    "//img[contains(@data-testid, 'swiper-image')]",
+    "//p",
+    "//*[@data-testid='user-profile-user-name']",
+    "//span[contains(concat(' ', normalize-space(@class), ' '), ' css-w85dhy ')]",
+    f"//a[contains(@href, '{MAP_LINK_MARKER}')]",
+])
+
+
+def text_of(backend, node, separator: str = "") -> str:
+    # same result as BeautifulSoup's get_text(separator, strip=True)
+    return separator.join(s for s in (s.strip() for s in backend.strings(node)) if s)
+
+
+def parse_price(text: str) -> int | None:
+    m = PRICE_RE.search(text.replace("\u00A0", " "))
+    if not m:
+        return None
+    try:
+        return int(m.group(1).replace(" ", ""))
+    except ValueError:
+        return None
+
+
+def district_from_location(location: str) -> str:
+    # "Ташкент, Юнусабадский район" -> "Юнусабадский район"
+    if "район" not in location:
+        return location
+    helper = ''
+    index = location.find('район') - 2
+    while location[index] != ' ' and index != -1:
+        helper += location[index]
+        index -= 1
+    return helper[::-1] + ' район'
+
+
+def map_coordinates(map_link: str) -> tuple[float, float] | None:
+    try:
+        qs = parse_qs(urlparse(map_link).query)
+        ll_vals = qs.get('ll') or qs.get('q')
+        if ll_vals:
+            parts = ll_vals[0].split(',')
+            if len(parts) >= 2:
+                return float(parts[0]), float(parts[1])
+    except Exception as e:
+        logger.warning("Failed parsing map link %s: %s", map_link, e)
+    return None
+
+
+def extract_ad(backend, root, url: str) -> dict:
+    """
+    Builds the ad dict from one anchor query over the document.
+    backend supplies the node accessors, so every backend returns identical dicts.
+    """
+    data: dict = {}
+    title = fallback_title = None
+    params: dict = {}
+    photos: list[str] = []
+    slides: list[str] = []
+    location = None
+
+    def image_src(img):
+        src = backend.attr(img, 'src') or backend.attr(img, 'data-src')
+        return urljoin(url, src) if src else None
+
+    for node in backend.anchors(root):
+        tag = backend.tag(node)
+        testid = backend.attr(node, 'data-testid')
+
+        if testid == 'offer_title':
+            if fallback_title is None:
+                h4 = next(iter(backend.descendants(node, 'h4')), None)
+                if h4 is not None:
+                    fallback_title = text_of(backend, h4)
+        elif testid == 'ad-price-container':
+            if 'PriceValue' not in data:
+                h3 = next(iter(backend.descendants(node, 'h3')), None)
+                if h3 is not None:
+                    price = parse_price(text_of(backend, h3))
+                    if price is not None:
+                        data['PriceValue'] = price
+        elif testid == 'ad-parameters-container':
+            if not params:
+                for p in backend.descendants(node, 'p'):
+                    text = text_of(backend, p)
+                    if ':' in text:
+                        key, val = text.split(':', 1)
+                        params[key.strip()] = val.strip()
+                    else:
+                        params.setdefault('OtherInfo', []).append(text.strip())
+        elif testid == 'ad_description':
+            if 'Description' not in data:
+                inner = next(iter(backend.descendants(node, 'div')), None)
+                if inner is not None:
+                    data['Description'] = text_of(backend, inner, ' ')
+        elif testid == 'ad-photo':
+            img = next(iter(backend.descendants(node, 'img')), None)
+            src = image_src(img) if img is not None else None
+            if src:
+                photos.append(src)
+        elif testid == 'user-profile-user-name':
+            if 'SellerName' not in data:
+                data['SellerName'] = text_of(backend, node)
+        elif tag == 'h1':
+            if title is None:
+                title = text_of(backend, node)
+        elif tag == 'p':
+            if location is None and text_of(backend, node) == LOCATION_LABEL:
+                parent = backend.parent(node)
+                vals = []
+                if parent is not None:
+                    for p in backend.descendants(parent, 'p'):
+                        text = text_of(backend, p)
+                        if text != LOCATION_LABEL:
+                            vals.append(text)
+                location = ', '.join(vals)
+        elif tag == 'img':
+            src = image_src(node)
+            if src:
+                slides.append(src)
+        elif tag == 'span':
+            if 'OfferId' not in data:
+                m = OFFER_ID_RE.search(text_of(backend, node))
+                if m:
+                    data['OfferId'] = m.group(1)
+        elif tag == 'a':
+            if 'MapLink' not in data:
+                href = backend.attr(node, 'href')
+                data['MapLink'] = href if href.startswith('http') else urljoin(url, href)
+
+    if title is not None or fallback_title is not None:
+        data['Title'] = title if title is not None else fallback_title
+    if params:
+        data['Parameters'] = params
+    images = photos + [src for src in dict.fromkeys(slides) if src not in photos]
+    if images:
+        data['Images'] = images
+    if location:
+        data['Location'] = district_from_location(location)
+    if 'MapLink' in data:
+        coordinates = map_coordinates(data['MapLink'])
+        if coordinates:
+            data['Latitude'], data['Longitude'] = coordinates
+    return data
+
+
+class SoupBackend:
+    """BeautifulSoup with html.parser: pure Python, always available, slowest."""
+    name = "bs4"
+    _anchors = soupsieve.compile(ANCHORS_CSS)
+
+    def parse(self, html: str, url: str) -> dict:
+        return extract_ad(self, BeautifulSoup(html, 'html.parser'), url)
+
+    def anchors(self, root):
+        return self._anchors.select(root)
+
+    @staticmethod
+    def tag(node) -> str:
+        return node.name
+
+    @staticmethod
+    def attr(node, name: str):
+        value = node.get(name)
+        # bs4 splits multi-valued attributes such as class
+        return " ".join(value) if isinstance(value, list) else value
+
+    @staticmethod
+    def strings(node):
+        return node.strings
+
+    @staticmethod
+    def parent(node):
+        return node.parent
+
+    @staticmethod
+    def descendants(node, tag: str):
+        return node.find_all(tag)
+
+
+class LxmlBackend:
+    """lxml.html (libxml2) with a precompiled XPath union."""
+    name = "lxml"
+
+    def __init__(self):
+        self._anchors = etree.XPath(ANCHORS_XPATH)
+
+    def parse(self, html: str, url: str) -> dict:
+        return extract_ad(self, lxml.html.fromstring(html), url)
+
+    def anchors(self, root):
+        return self._anchors(root)
+
+    @staticmethod
+    def tag(node) -> str:
+        return node.tag
+
+    @staticmethod
+    def attr(node, name: str):
+        return node.get(name)
+
+    @staticmethod
+    def strings(node):
+        return node.itertext()
+
+    @staticmethod
+    def parent(node):
+        return node.getparent()
+
+    @staticmethod
+    def descendants(node, tag: str):
+        return node.iterdescendants(tag)
+
+
+class SelectolaxBackend:
+    """selectolax on the lexbor engine (C); the fastest of the three."""
+    name = "selectolax"
+
+    def parse(self, html: str, url: str) -> dict:
+        return extract_ad(self, LexborHTMLParser(html), url)
+
+    def anchors(self, root):
+        return root.css(ANCHORS_CSS)
+
+    @staticmethod
+    def tag(node) -> str:
+        return node.tag
+
+    @staticmethod
+    def attr(node, name: str):
+        return node.attributes.get(name)
+
+    @staticmethod
+    def strings(node):
+        return (n.text_content or '' for n in node.traverse(include_text=True) if n.tag == '-text')
+
+    @staticmethod
+    def parent(node):
+        return node.parent
+
+    @staticmethod
+    def descendants(node, tag: str):
+        # scoped css() also matches the node itself
+        return [n for n in node.css(tag) if n != node]
+
+
+BACKENDS = {"bs4": SoupBackend}
+if lxml is not None:
+    BACKENDS["lxml"] = LxmlBackend
+if LexborHTMLParser is not None:
+    BACKENDS["selectolax"] = SelectolaxBackend
+
+# fastest first
+_AUTO_ORDER = ("selectolax", "lxml", "bs4")
+_instances: dict = {}
+
+
+def get_backend(name: str | None = None):
+    """
+    Returns the parser backend by name ('selectolax', 'lxml', 'bs4' or 'auto').
+    Defaults to SCRAPER_HTML_PARSER; 'auto' picks the fastest one installed.
+    """
+    name = (name or HTML_PARSER).lower()
+    if name == "auto":
+        name = next(n for n in _AUTO_ORDER if n in BACKENDS)
+    if name not in BACKENDS:
+        raise ValueError(f"HTML parser backend {name!r} is not available, installed: {sorted(BACKENDS)}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
@@ -0,0 +1,151 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from environment.utils import Env
+
+logger = logging.getLogger(__name__)
+
+OLX_BASE_URL = Env.scraper.OLX_BASE_URL
+OLX_HOME = f"{OLX_BASE_URL}/"
+SESSION_TTL = Env.scraper.SESSION_TTL
+MAX_SESSIONS = Env.scraper.MAX_SESSIONS
+
+HEADERS_LIST = [
+    {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
+        "X-Requested-With": "XMLHttpRequest",
+    },
+    {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0 Safari/537.36",
+        "X-Requested-With": "XMLHttpRequest",
+    },
+    {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
+        "X-Requested-With": "XMLHttpRequest",
+    },
+    {
+        "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1",
+        "X-Requested-With": "XMLHttpRequest",
+    },
+]
+
+
+class PooledSession:
+    """
+    A requests.Session pinned to one HEADERS_LIST identity.
+    Cookies are re-seeded from the OLX homepage once they are older than the TTL.
+    """
+
+    def __init__(self, headers: dict, cookie_ttl: float):
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.cookie_ttl = cookie_ttl
+        self.warmed_at = None
+
+    @property
+    def expired(self) -> bool:
+        return self.warmed_at is None or time.monotonic() - self.warmed_at > self.cookie_ttl
+
+    def warm(self) -> None:
+        self.session.cookies.clear()
+        try:
+            self.session.get(OLX_HOME, timeout=10).raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.warning("Failed to seed OLX cookies: %s", e)
+        # retry seeding after the next TTL either way, not on every borrow
+        self.warmed_at = time.monotonic()
+
+    def connection_counts(self) -> tuple[int, int]:
+        # (connections opened, requests sent) across the urllib3 pools of this session
+        opened = sent = 0
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        return opened, sent
+
+
+class OlxSessionPool:
+    """
+    Thread-safe pool of warm OLX sessions shared by all scraper functions.
+    Borrow one with `with olx_pool.session() as s:`; it blocks when max_sessions are in use.
+    """
+
+    def __init__(self, identities: list[dict] = HEADERS_LIST, cookie_ttl: float = SESSION_TTL,
+                 max_sessions: int = MAX_SESSIONS):
+        self.cookie_ttl = cookie_ttl
+        self.max_sessions = max_sessions
+        self._identities = itertools.cycle(identities)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._all: list[PooledSession] = []
+        self._lock = threading.Lock()
+        self.sessions_created = 0
+        self.sessions_reused = 0
+        self.cookie_seeds = 0
+
+    def _acquire(self) -> PooledSession:
+        try:
+            pooled = self._idle.get_nowait()
+            with self._lock:
+                self.sessions_reused += 1
+        except queue.Empty:
+            with self._lock:
+                can_create = len(self._all) < self.max_sessions
+                if can_create:
+                    pooled = PooledSession(next(self._identities), self.cookie_ttl)
+                    self._all.append(pooled)
+                    self.sessions_created += 1
+            if not can_create:
+                pooled = self._idle.get()
+                with self._lock:
+                    self.sessions_reused += 1
+
+        if pooled.expired:
+            pooled.warm()
+            with self._lock:
+                self.cookie_seeds += 1
+        return pooled
+
+    @contextmanager
+    def session(self):
+        pooled = self._acquire()
+        try:
+            yield pooled.session
+        finally:
+            self._idle.put(pooled)
+
+    def identity(self) -> tuple[dict, dict]:
+        """
+        Headers and warm cookies of a pooled session, for clients other than requests (aiohttp).
+        """
+        with self.session() as session:
+            return dict(session.headers), session.cookies.get_dict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = list(self._all)
+            result = {
+                "sessions_created": self.sessions_created,
+                "sessions_reused": self.sessions_reused,
+                "cookie_seeds": self.cookie_seeds,
+            }
+        opened = sent = 0
+        for pooled in sessions:
+            o, s = pooled.connection_counts()
+            opened += o
+            sent += s
+        result["connections_opened"] = opened
+        result["connections_reused"] = max(sent - opened, 0)
+        return result
+
+
+olx_pool = OlxSessionPool()
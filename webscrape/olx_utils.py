@@ -1,13 +1,113 @@
-import os
+import asyncio
+import hashlib
+import logging
+import time
 import uuid
 from urllib.parse import urlparse
-import requests
+import aiofiles
+import aiohttp
 from pathlib import Path
 
+from monitoring.metrics import histogram
+from webscrape.image_store import BASE_IMG_DIR, TMP_DIR, image_store
+
 import re
-from decimal import Decimal
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+NUMBER_RE = re.compile(r"\d+")
+FLOOR_OF_RE = re.compile(r"(\d+)\s*(?:/|из)\s*(\d+)")
+AREA_RE = re.compile(r"([\d,.]+)")
+
+
+def _parse_rooms(val: str) -> dict:
+    m = NUMBER_RE.search(val)
+    if m:
+        return {'rooms': int(m.group())}
+    # “Студия” → treat as 1
+    if "студ" in val.lower():
+        return {'rooms': 1}
+    return {}
+
+
+def _parse_floor_of(val: str) -> dict:
+    # "3 / 9", "3 из 9", "3/9"
+    m = FLOOR_OF_RE.search(val)
+    return {'floor': int(m.group(1)), 'total_storeys': int(m.group(2))} if m else {}
+
+
+def _parse_int(field: str):
+    def parse(val: str) -> dict:
+        m = NUMBER_RE.search(val)
+        return {field: int(m.group())} if m else {}
+    return parse
+
+
+def _parse_area(val: str) -> dict:
+    # e.g. "85" or "85 м²", "45.5"
+    m = AREA_RE.search(val.replace(',', '.'))
+    if m:
+        try:
+            return {'area': Decimal(m.group(1))}
+        except InvalidOperation:
+            pass
+    return {}
+
+
+def _parse_furnished(val: str) -> dict:
+    v = val.lower().strip()
+    # "Меблирована: Да" / "Нет"
+    if v == "да":
+        return {'is_furnished': True}
+    if v == "нет" or "без" in v:
+        return {'is_furnished': False}
+    if "част" in v:
+        return {'is_furnished': True}
+    if any(x in v for x in ["меблирован", "есть мебель", "furnished", "мебель"]):
+        return {'is_furnished': True}
+    # else leave absent
+    return {}
+
+
+# Rule table: (rule, key pattern on the lowercased key, value guard, value parser).
+# The first key matching a rule (and its guard) is the only one that rule looks at,
+# even if parsing its value yields nothing. A parser of None marks labels OLX shows
+# that we knowingly ignore, so they are not reported as unrecognized.
+PARAMETER_RULES = [
+    ('rooms', r"комнат", None, _parse_rooms),
+    # combined floor under a single key, e.g. "Этаж: 3 / 9"
+    ('floor_of', r"этаж", lambda val: "/" in val or "из" in val, _parse_floor_of),
+    # exactly "Этаж", not "Этажность"
+    ('floor', r"^(?!.*этажность)\s*этаж", None, _parse_int('floor')),
+    ('total_storeys', r"этажность", None, _parse_int('total_storeys')),
+    ('area', r"площад", None, _parse_area),
+    # "Меблирована", "Мебель", "Обстановка", "Furnished"
+    ('is_furnished', r"мебел|меблир|обстан|furnished", None, _parse_furnished),
+    # OLX example: "Тип строения: Кирпичный"
+    ('building_type', r"тип строен|тип дома|материал", None, lambda val: {'building_type': val}),
+    ('repair', r"ремонт", None, lambda val: {'repair': val}),
+    ('ignored', r"комиссион|санузел|планировк|потолк|год постройки|можно|рядом есть|в квартире есть", None, None),
+]
+_COMPILED_RULES = [(name, re.compile(pattern), guard, parser) for name, pattern, guard, parser in PARAMETER_RULES]
+
+# labels seen by parse_parameters that no rule matched, across the whole process
+unrecognized_keys: Counter = Counter()
+
+
+@lru_cache(maxsize=1024)
+def classify_key(key: str) -> tuple:
+    """
+    Returns the rules whose key pattern matches this parameter label.
+    OLX uses a handful of labels, so each one is matched against the rule table only once.
+    """
+    lk = key.lower()
+    return tuple(rule for rule in _COMPILED_RULES if rule[1].search(lk))
+
 
-def parse_parameters(params: dict) -> dict:
+def parse_parameters(params: dict, unrecognized: Counter | None = None) -> dict:
     """
     Given params like {"Количество комнат": "3", "Общая площадь": "85", "Этаж": "7", "Этажность дома": "9", ...},
     return a dict mapping to our model fields:
@@ -18,151 +118,102 @@ def parse_parameters(params: dict) -> dict:
       - is_furnished: bool (only if confidently parsed)
       - building_type: str
       - repair: str
+    Classifies every key against PARAMETER_RULES in a single pass; keys no rule knows
+    are counted in unrecognized (defaults to the module-wide unrecognized_keys).
     """
-    result: dict = {}
+    if unrecognized is None:
+        unrecognized = unrecognized_keys
+    found: dict[str, dict] = {}
 
-    # 1. Rooms: look for key containing "комнат"
-    for key, val in params.items():
-        if "комнат" in key.lower():
-            m = re.search(r"\d+", val)
-            if m:
-                try:
-                    result['rooms'] = int(m.group())
-                except:
-                    pass
-            else:
-                # “Студия” → treat as 1
-                if "студ" in val.lower():
-                    result['rooms'] = 1
-            break
-
-    # 2. Floor and total_storeys
-    floor = None
-    total = None
-
-    # First: combined pattern under a single key, e.g. "Этаж: 3 / 9"
     for key, val in params.items():
-        if "этаж" in key.lower() and ("/" in val or "из" in val):
-            # Try "3 / 9", "3 из 9", "3/9"
-            m = re.search(r"(\d+)\s*(?:/|из)\s*(\d+)", val)
-            if m:
-                try:
-                    floor = int(m.group(1))
-                    total = int(m.group(2))
-                except:
-                    pass
-            break
-
-    # Next: if not combined, look separately:
-    if floor is None:
-        for key, val in params.items():
-            # Exactly "Этаж" or contains only "этаж:" but not "этажность"
-            if key.lower().strip().startswith("этаж") and "этажность" not in key.lower():
-                m = re.search(r"\d+", val)
-                if m:
-                    try:
-                        floor = int(m.group())
-                    except:
-                        pass
-                break
-
-    if total is None:
-        for key, val in params.items():
-            # Look for "Этажность" (total floors in building)
-            if "этажность" in key.lower():
-                m = re.search(r"\d+", val)
-                if m:
-                    try:
-                        total = int(m.group())
-                    except:
-                        pass
-                break
+        if not isinstance(val, str):
+            # 'OtherInfo' holds the parameter lines without a label
+            continue
+        rules = classify_key(key)
+        if not rules:
+            unrecognized[key] += 1
+        for name, _, guard, parser in rules:
+            if name in found or (guard and not guard(val)):
+                continue
+            found[name] = parser(val) if parser else {}
 
+    result: dict = {}
+    for name in ('rooms', 'area', 'is_furnished', 'building_type', 'repair'):
+        result.update(found.get(name, {}))
+    # a combined "3 / 9" value wins over the separate keys
+    floor_of = found.get('floor_of', {})
+    floor = floor_of.get('floor', found.get('floor', {}).get('floor'))
+    total = floor_of.get('total_storeys', found.get('total_storeys', {}).get('total_storeys'))
     if floor is not None:
         result['floor'] = floor
     if total is not None:
         result['total_storeys'] = total
+    return result
 
-    # 3. Area: look for key containing "площад"
-    for key, val in params.items():
-        if "площад" in key.lower():
-            # e.g. "85" or "85 м²", "45.5"
-            num_part = re.search(r"([\d,.]+)", val.replace(',', '.'))
-            if num_part:
-                try:
-                    result['area'] = Decimal(num_part.group(1))
-                except:
-                    pass
-            break
-
-    # 4. Furnishing: keys like "Меблирована", "Обстановка", "Furnished"
-    for key, val in params.items():
-        lk = key.lower()
-        if any(sub in lk for sub in ["мебел", "обстан", "furnished"]):
-            v = val.lower()
-            if "без" in v:
-                result['is_furnished'] = False
-            elif "част" in v:
-                result['is_furnished'] = True
-            elif any(x in v for x in ["меблирован", "есть мебель", "furnished", "мебель"]):
-                result['is_furnished'] = True
-            # else leave absent
-            break
-
-    # 5. Building type / material: look for "Тип строения", "Тип дома", "Материал"
-    for key, val in params.items():
-        lk = key.lower()
-        # OLX example: "Тип строения: Кирпичный"
-        if "тип строен" in lk or "тип дома" in lk or "материал" in lk:
-            result['building_type'] = val
-            break
 
-    # 6. Repair: key containing "ремонт"
-    for key, val in params.items():
-        if "ремонт" in key.lower():
-            result['repair'] = val
-            break
+MAX_IMAGES_PER_APARTMENT = 10
+IMAGE_SECONDS = histogram("scraper_image_seconds", "Download and store time per ad photo", ("outcome",))
+CHUNK_SIZE = 64 * 1024
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 
-    return result
+def _legacy_image_count(apartment_id: int) -> int:
+    # images saved before the blob store live in a per-apartment directory
+    legacy_dir = BASE_IMG_DIR / str(apartment_id)
+    return sum(1 for _ in legacy_dir.iterdir()) if legacy_dir.is_dir() else 0
 
 
-MAX_IMAGES_PER_APARTMENT = 10
+def _image_extension(image_url: str) -> str:
+    ext = Path(urlparse(image_url).path).suffix.lower()
+    return ext if ext in IMAGE_EXTENSIONS else ".jpg"
 
-BASE_IMG_DIR = (
-    Path(__file__).resolve()
-    .parent.parent
-    / "webscrape"
-    / "images"
-)
 
-def save_image_for_apartment(apartment_id: int, image_url: str) -> str | None:
-    dirpath = BASE_IMG_DIR / str(apartment_id)
+def _tmp_image_path() -> Path | None:
     try:
-        dirpath.mkdir(parents=True, exist_ok=True)
+        TMP_DIR.mkdir(parents=True, exist_ok=True)
     except Exception as e:
-        print(f"Failed to create image directory {dirpath}: {e}")
-        return None
-
-    # enforce max images per apartment
-    existing = list(dirpath.iterdir())
-    if len(existing) >= MAX_IMAGES_PER_APARTMENT:
-        # already at (or above) limit
+        logger.warning("Failed to create image directory %s: %s", TMP_DIR, e)
         return None
+    return TMP_DIR / f"{uuid.uuid4()}.part"
 
-    # parse extension
-    parsed = urlparse(image_url)
-    ext = Path(parsed.path).suffix.lower()
-    if ext not in {".jpg", ".jpeg", ".png", ".gif", ".webp"}:
-        ext = ".jpg"
 
-    filename = f"{uuid.uuid4()}{ext}"
-    full_path = dirpath / filename
+async def save_image_for_apartment_async(http: aiohttp.ClientSession, image_url: str) -> dict | None:
+    """
+    Streams one image into the content-addressed store.
+    Returns the ApartmentImage columns (original_url, local_path, content_hash, phash) or None.
+    """
+    tmp_path = _tmp_image_path()
+    if tmp_path is None:
+        return None
 
+    t0 = time.perf_counter()
     try:
-        resp = requests.get(image_url, timeout=10)
-        resp.raise_for_status()
-        full_path.write_bytes(resp.content)
-        return f"{apartment_id}/{filename}"
+        hasher = hashlib.sha256()
+        async with http.get(image_url) as resp:
+            resp.raise_for_status()
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    await f.write(chunk)
+        # hashing the pixels and moving the file are blocking, keep them off the event loop
+        stored = await asyncio.to_thread(image_store.store, tmp_path, hasher.hexdigest(), _image_extension(image_url))
+        IMAGE_SECONDS.observe(time.perf_counter() - t0, outcome="saved")
+        return {"original_url": image_url, **stored}
     except Exception as e:
-        print(f"Failed to download image {image_url}: {e}")
-        return None
\ No newline at end of file
+        IMAGE_SECONDS.observe(time.perf_counter() - t0, outcome="failed")
+        logger.warning("Failed to download image %s: %s", image_url, e)
+        tmp_path.unlink(missing_ok=True)
+        return None
+
+
+async def save_images_for_apartment(http: aiohttp.ClientSession, apartment_id: int,
+                                    image_urls: list[str], existing: int = 0) -> list[dict]:
+    """
+    Downloads an apartment's images concurrently, streaming each one to a temp file
+    before it is moved into the image store. existing is how many images the apartment
+    already has; together they stay within MAX_IMAGES_PER_APARTMENT. Returns
+    ApartmentImage column dicts in the order of image_urls for the images that were saved.
+    """
+    room = MAX_IMAGES_PER_APARTMENT - max(existing, _legacy_image_count(apartment_id))
+    urls = list(dict.fromkeys(image_urls))[:max(room, 0)]
+    saved = await asyncio.gather(*(save_image_for_apartment_async(http, u) for u in urls))
+    return [row for row in saved if row]
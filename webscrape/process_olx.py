@@ -1,212 +1,381 @@
-import random
-import re
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import Event
+from typing import Optional
+
+import aiohttp
+from sqlalchemy.sql import func
+
+from db.districts import DISTRICTS_BY_ID, resolve_district
 from db.engine import SessionLocal
-from db.models import Apartment, ApartmentImage, ApartmentUrl, AgentPhoneNumber
+from db.manager import claim_urls
+from db.near_duplicates import band_keys, find_cluster, minhash_signature
+from db.models import Apartment, ApartmentImage, ApartmentUrl
 from environment.utils import Env
-from webscrape.olx_utils import parse_parameters, save_image_for_apartment
-from webscrape.scrapping_olx import scrape_olx_ad_static
-from typing import Optional
-from openai import OpenAI
-key = Env.key.OPENAI_API_KEY
-
-HEADERS_LIST = [
-    {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-    {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0 Safari/537.36",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-    {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-    {
-        "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-]
-def fetch_olx_phone(ad_url: str) -> str | None:
-    session = requests.Session()
-    session.headers.update(random.choice(HEADERS_LIST))
-    try:
-        session.get("https://www.olx.uz/").raise_for_status()
-        r = session.get(ad_url)
-        r.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Skipping {ad_url}, initial request failed: {e}")
-        return None
+from monitoring.metrics import counter, histogram
+from webscrape.address_llm import address_extractor
+from webscrape.agent_phones import agent_index
+from webscrape.olx_utils import parse_parameters, save_images_for_apartment, unrecognized_keys
+from webscrape.olx_session import OLX_BASE_URL, olx_pool
+from webscrape.rate_limit import gate_for, gate_stats
+from webscrape.scrapping_olx import fetch_olx_ad_async, fetch_olx_phone_async
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    span = soup.find("span", class_="css-w85dhy")
-    if not span:
-        return None
+logger = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = Env.scraper.MAX_IN_FLIGHT
+PER_HOST_LIMIT = Env.scraper.PER_HOST_LIMIT
+IMAGE_PER_HOST_LIMIT = Env.scraper.IMAGE_PER_HOST_LIMIT
+REQUEST_TIMEOUT = 15
+CLAIM_BATCH = Env.scraper.CLAIM_BATCH
+LEASE_SECONDS = Env.scraper.LEASE_SECONDS
+URL_MAX_RETRIES = Env.scraper.URL_MAX_RETRIES
+# a failed URL is retried after RETRY_DELAY * 4^retry_count seconds
+RETRY_DELAY = 300
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+STAGE_SECONDS = histogram("scraper_stage_seconds", "Time per ad spent in each scraping stage", ("pipeline", "stage"))
+ADS = counter("scraper_ads_total", "Ads handled by the scraper, by outcome", ("pipeline", "result"))
+NEAR_DUPLICATES = counter("scraper_near_duplicates_total", "Saved ads that joined the cluster of an earlier, similar ad")
+
+
+class IngestStats:
+    """
+    Counters and per-stage wall time for one ingestion run, mirrored to the process-wide
+    scraper_stage_seconds / scraper_ads_total metrics.
+    Stage times are summed over all ads, so with N ads in flight they can exceed the total.
+    """
+    pipeline = "ingest"
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.agents = 0
+        self.stage_seconds = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            self.stage_seconds[name] += seconds
+            STAGE_SECONDS.observe(seconds, pipeline=self.pipeline, stage=name)
+
+    def count(self, result: str) -> None:
+        # result is one of the counter attributes: processed, skipped, failed, ...
+        setattr(self, result, getattr(self, result) + 1)
+        ADS.inc(pipeline=self.pipeline, result=result)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def ads_per_sec(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
 
-    m = re.search(r"ID:\s*(\d+)", span.text)
-    if not m:
+    def report(self) -> str:
+        stages = ", ".join(f"{k}={v:.2f}s" for k, v in sorted(self.stage_seconds.items()))
+        return (
+            f"Ingested {self.processed} ads ({self.skipped} skipped, {self.agents} from agents, {self.failed} failed) "
+            f"in {self.elapsed:.1f}s — {self.ads_per_sec:.2f} ads/sec [{stages}]"
+        )
+
+
+def prepare_parameters(data: dict) -> dict | None:
+    """
+    Parses ad parameters and returns them, or None if the ad lacks a required field.
+    """
+    parsed = parse_parameters(data.get("Parameters", {}))
+    if "floor" in parsed and "total_storeys" not in parsed:
+        parsed["total_storeys"] = parsed["floor"]
+
+    missing = [f for f in ("rooms", "floor", "total_storeys", "area") if f not in parsed]
+    if missing or data.get("PriceValue") is None or not data.get("Title") or not data.get("Description"):
         return None
-    offer_id = m.group(1)
+    return parsed
+
+
+def apartment_fields(data: dict, parsed: dict) -> dict:
+    """
+    Apartment column values taken from the ad page itself (everything except the phone,
+    which needs its own request, and the address, which comes from the description).
+    """
+    location = data.get("Location")
+    district_id = resolve_district(location)
+    if district_id is None:
+        logger.info("District not recognized: %r", location)
+    return dict(
+        owner_name=data.get("SellerName"),
+        title=data.get("Title"),
+        description=data.get("Description"),
+        price=data.get("PriceValue"),
+        floor=parsed["floor"],
+        total_storeys=parsed["total_storeys"],
+        area=parsed["area"],
+        rooms=parsed["rooms"],
+        is_furnished=parsed.get("is_furnished", False),
+        district=DISTRICTS_BY_ID[district_id].name if district_id else location,
+        district_id=district_id,
+        building_type=parsed.get("building_type"),
+        repair=parsed.get("repair"),
+        latitude=data.get("Latitude"),
+        longitude=data.get("Longitude"),
+    )
+
+
+def build_apartment(data: dict, parsed: dict, phone: str | None, address: str | None, url_id: int) -> Apartment:
+    return Apartment(
+        **apartment_fields(data, parsed),
+        phone_number=phone,
+        map_link=address,
+        status="active",
+        url_id=url_id
+    )
 
-    # 2) hit the AJAX endpoint
-    phone_api = f"https://www.olx.uz/api/v1/offers/{offer_id}/limited-phones/"
+
+def set_url_status(url_id: int, status: str) -> None:
+    session_db = SessionLocal()
     try:
-        resp = session.get(phone_api, headers={"Referer": ad_url})
-        resp.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Skipping {ad_url}, phone API request failed: {e}")
-        return None
+        session_db.query(ApartmentUrl).filter_by(id=url_id).update(
+            {"status": status, "claimed_by": None, "lease_until": None}
+        )
+        session_db.commit()
+    finally:
+        session_db.close()
 
-    phones = resp.json().get("data", {}).get("phones", [])
-    if not phones:
-        return None
 
-    # 3) normalize: take first phone, strip non-digits
-    digits = re.sub(r"\D", "", phones[0])
-    if digits.startswith("998") and len(digits) > 9:
-        digits = digits[3:]
-    return digits if len(digits) == 9 else None
+def mark_url_failed(url_id: int) -> None:
+    """
+    Marks a URL 'error' and counts the failure; claim_urls picks it up again after a
+    growing delay until it has failed URL_MAX_RETRIES times.
+    """
+    session_db = SessionLocal()
+    try:
+        url = session_db.get(ApartmentUrl, url_id)
+        if url is None:
+            return
+        url.retry_count = (url.retry_count or 0) + 1
+        url.status = "error"
+        url.claimed_by = None
+        url.lease_until = func.now() + timedelta(seconds=RETRY_DELAY * 4 ** (url.retry_count - 1))
+        session_db.commit()
+    finally:
+        session_db.close()
+
 
+def claim_batch(worker_id: str, batch_size: int) -> list[tuple[int, str]]:
+    session_db = SessionLocal()
+    try:
+        claimed = claim_urls(session_db, worker_id, batch_size, LEASE_SECONDS, URL_MAX_RETRIES)
+        session_db.commit()
+        return claimed
+    finally:
+        session_db.close()
 
 
-def process_olx_ad() -> Apartment | None:
+def release_urls(url_ids: list[int]) -> None:
+    # hands claimed but unstarted URLs back instead of letting their lease run out
+    if not url_ids:
+        return
     session_db = SessionLocal()
-    processed_count = 0
-    ad_urls = session_db.query(ApartmentUrl).filter_by(status='new').all()
-    for ad_url in ad_urls:
-        data = scrape_olx_ad_static(ad_url.url)
-        if not data:
-            print(f"Skipping {ad_url.url}, no data returned")
-            ad_url.status = 'done'
-            session_db.commit()
-            continue
-
-        phone = fetch_olx_phone(ad_url.url)
-
-        parsed = parse_parameters(data.get("Parameters", {}))
-        if "floor" in parsed and "total_storeys" not in parsed:
-            parsed["total_storeys"] = parsed["floor"]
-
-        missing = [f for f in ("rooms", "floor", "total_storeys", "area") if f not in parsed]
-        if missing or data.get("PriceValue") is None or not data.get("Title") or not data.get("Description"):
-            print(f"Skipping {ad_url.url}, missing {missing}")
-            ad_url.status = 'done'
-            session_db.commit()
-            continue
-
-        def extract_address_llm(description: str) -> Optional[str]:
-            api_key = key
-            if not api_key:
-                raise RuntimeError("OPENAI_API_KEY environment variable not set")
-
-            # 2. Instantiate the client
-            client = OpenAI(api_key=api_key)
-
-            system_prompt = (
-                "You are a strict address extractor for short property rental ads.\n"
-                "RULES (priority & behavior):\n"
-                "1) Extract ONLY the single best address/location from the ad and NOTHING else.\n"
-                "2) Prefer more specific actionable locations in this order (highest -> lowest):\n"
-                "   a) street + number (e.g., 'ул. Лермонтова 5')\n"
-                "   b) landmark with qualifier or direction/distance (e.g., '3 остановки от м. Дустлик', 'за Сезам', 'рядом с больница Жуковский')\n"
-                "   c) metro name (e.g., 'м. Дустлик', 'Метро: Янгиҳаёт')\n"
-                "   d) массив/массив + number (e.g., 'Чилонзор 18 массив')\n"
-                "   e) район/туман only as a last resort.\n"
-                "3) IMPORTANT: If the ad contains a district/район/туман/масcив **only** and no more specific location (no street, no landmark, no metro/distance), RETURN the string 'null' (lowercase) — do NOT return the generic district as the address.\n"
-                "4) If both a generic region and a more specific cue exist, return the MORE SPECIFIC cue (e.g., if text has 'Яшнабадский район' and '3 остановки от м. Дустлик', return '3 остановки от м. Дустлик').\n"
-                "5) Normalize to Russian/Cyrillic — transliterate Latin-script Uzbek/English to Russian phonetics when needed (e.g., 'Yangihayot' -> 'Янгиҳаёт', 'sezam' -> 'Сезам').\n"
-                "6) Capitalize appropriately (e.g., 'Больница Жуковский', 'Метрo: Янгиҳаёт').\n"
-                "7) Output EXACTLY one string — the address text alone (no JSON, no quotes, no punctuation wrappers). If no appropriate address is found, output the literal string: null\n"
-                "8) Do NOT output any explanation, extra text, or other fields — only a single line containing the address or 'null'.\n"
-                "\n"
-                "EXAMPLES (input -> output):\n"
-                "Input:\n"
-                "Xamma waroilari bn yangi remontdan ciqqan ... yunusobod 4kv da kvartira  sezam orqasida joylawgan\n"
-                "Output:\n"
-                "Сезам, сзади\n"
-                "\n"
-                "Input:\n"
-                "Chilonzor 18 mavzeda Arendaga kvartira qizlarga. 2 ta qiz kerak ...\n"
-                "Output:\n"
-                "Чилонзор 18 массив\n"
-                "\n"
-                "Input:\n"
-                "Предлагается ... в центре на Ц - 6, ориентир Юнус-Абадская налоговая. ...\n"
-                "Output:\n"
-                "Юнус-Абадская налоговая\n"
-                "\n"
-                "Input:\n"
-                "Предложение только для иностранных граждан. ... в Яшнабадском районе, 3 остановки от м. Дустлик. ...\n"
-                "Output:\n"
-                "3 остановки от м. Дустлик\n"
-                "\n"
-                "Input:\n"
-                "Уютная квартира, рядом школа и парк. Без точного адреса, подробности в Telegram.\n"
-                "Output:\n"
-                "null\n"
-            )
-
-            user_prompt = (
-                "Extract the single best address/location from the following advertisement.\n\n"
-                f"---\n{description.strip()}\n---\n\n"
-                "Return EXACTLY one string."
-            )
-
-            resp = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content":user_prompt}
-                ],
-                temperature=0.0,
-                max_tokens=20,
-            )
-
-            text = resp.choices[0].message.content.strip().strip('"')
-            return None if text.lower() in ("null", "none") else text
-        address=extract_address_llm(data.get("Description"))
-        print(address)
-        apt = Apartment(
-            owner_name=data.get("SellerName"),
-            title=data.get("Title"),
-            description=data.get("Description"),
-            price=data.get("PriceValue"),
-            floor=parsed["floor"],
-            total_storeys=parsed["total_storeys"],
-            area=parsed["area"],
-            rooms=parsed["rooms"],
-            is_furnished=parsed.get("is_furnished", False),
-            district=data.get("Location"),
-            phone_number=phone,
-            building_type=parsed.get("building_type"),
-            repair=parsed.get("repair"),
-            map_link=address,
-            latitude=data.get("Latitude"),
-            longitude=data.get("Longitude"),
-            status="active",
-            url_id=ad_url.id
+    try:
+        (
+            session_db.query(ApartmentUrl)
+            .filter(ApartmentUrl.id.in_(url_ids), ApartmentUrl.status == "in_progress")
+            .update({"status": "new", "claimed_by": None, "lease_until": None}, synchronize_session=False)
         )
-        session_db.add(apt)
         session_db.commit()
+    finally:
+        session_db.close()
 
-        # save images
-        for img_url in data.get("Images", []):
-            local_path = save_image_for_apartment(apt.id, img_url)
-            if local_path:
-                session_db.add(ApartmentImage(
-                    apartment_id=apt.id,
-                    original_url=img_url,
-                    local_path=local_path,
-                ))
+
+def save_apartment(apt: Apartment) -> int:
+    session_db = SessionLocal()
+    try:
+        # a repost of a stored ad joins its cluster; searches show one apartment per cluster
+        apt.minhash = minhash_signature(apt.title, apt.description)
+        if apt.minhash:
+            apt.lsh_bands = band_keys(apt.minhash)
+            apt.cluster_id = find_cluster(session_db, apt.minhash, apt.lsh_bands)
+            if apt.cluster_id:
+                NEAR_DUPLICATES.inc()
+        session_db.add(apt)
         session_db.commit()
+        return apt.id
+    finally:
+        session_db.close()
 
-        # mark URL as processed
-        ad_url.status = 'done'
+
+def save_image_rows(apartment_id: int, saved: list[dict]) -> None:
+    session_db = SessionLocal()
+    try:
+        # blobs already uploaded to Telegram for another ad can reuse that file_id
+        hashes = {row["content_hash"] for row in saved}
+        known_file_ids = dict(
+            session_db.query(ApartmentImage.content_hash, ApartmentImage.telegram_file_id)
+            .filter(ApartmentImage.content_hash.in_(hashes), ApartmentImage.telegram_file_id.isnot(None))
+            .all()
+        ) if hashes else {}
+        for row in saved:
+            session_db.add(ApartmentImage(
+                apartment_id=apartment_id,
+                telegram_file_id=known_file_ids.get(row["content_hash"]),
+                **row,
+            ))
         session_db.commit()
-        processed_count += 1
+    finally:
+        session_db.close()
+
+
+async def ingest_one_ad(http: aiohttp.ClientSession, images_http: aiohttp.ClientSession,
+                        url_id: int, url: str, stats: IngestStats) -> None:
+    with stats.stage("fetch"):
+        data = await fetch_olx_ad_async(http, url)
+    if not data:
+        logger.info("Skipping %s, no data returned", url)
+        stats.count("skipped")
+        await asyncio.to_thread(set_url_status, url_id, "done")
+        return
+
+    with stats.stage("phone"):
+        phone = await fetch_olx_phone_async(http, url, data.get("OfferId"))
+    # agent ads stop here, before the LLM and the image downloads
+    if agent_index.is_agent(phone):
+        logger.info("Skipping %s, agent phone %s", url, phone)
+        stats.count("agents")
+        await asyncio.to_thread(set_url_status, url_id, "done")
+        return
+
+    parsed = prepare_parameters(data)
+    if parsed is None:
+        logger.info("Skipping %s, missing required fields", url)
+        stats.count("skipped")
+        await asyncio.to_thread(set_url_status, url_id, "done")
+        return
+
+    if agent_index.record(phone):
+        stats.count("agents")
+        with stats.stage("db"):
+            await asyncio.to_thread(agent_index.promote, phone, data.get("SellerName"))
+            await asyncio.to_thread(set_url_status, url_id, "done")
+        return
+
+    try:
+        with stats.stage("llm"):
+            address = await address_extractor.extract(data.get("Description"))
+        with stats.stage("db"):
+            apt_id = await asyncio.to_thread(save_apartment, build_apartment(data, parsed, phone, address, url_id))
+    except BaseException:
+        agent_index.forget(phone)
+        raise
+
+    with stats.stage("images"):
+        saved = await save_images_for_apartment(images_http, apt_id, data.get("Images", []))
+    with stats.stage("db"):
+        await asyncio.to_thread(save_image_rows, apt_id, saved)
+
+    # mark URL as processed
+    with stats.stage("db"):
+        await asyncio.to_thread(set_url_status, url_id, "done")
+    stats.count("processed")
+
+
+async def ingest_olx_ads(
+    max_in_flight: int = MAX_IN_FLIGHT,
+    per_host_limit: int = PER_HOST_LIMIT,
+    stop_event: Optional[Event] = None,
+    worker_id: str = WORKER_ID,
+    claim_size: int = CLAIM_BATCH,
+) -> IngestStats:
+    """
+    Scrapes ApartmentUrls until none are claimable, keeping up to max_in_flight ads in progress
+    and at most per_host_limit open connections to any single host.
+    URLs are claimed claim_size at a time (status 'in_progress' with a lease), so several
+    processes can run this concurrently; claimed URLs not started when stopped are released.
+    """
+    stats = IngestStats()
+    queue: asyncio.Queue = asyncio.Queue()
+    claim_lock = asyncio.Lock()
+    exhausted = False
+    await asyncio.to_thread(agent_index.ensure_loaded)
+
+    async def next_url() -> tuple[int, str] | None:
+        nonlocal exhausted
+        async with claim_lock:
+            if queue.empty() and not exhausted:
+                # while OLX's circuit is open, claiming more would only fail them
+                await gate_for(OLX_BASE_URL).wait_closed()
+                batch = await asyncio.to_thread(claim_batch, worker_id, claim_size)
+                exhausted = not batch
+                for item in batch:
+                    queue.put_nowait(item)
+            return None if queue.empty() else queue.get_nowait()
+
+    # borrow a warm identity (headers + cookies) from the shared pool for this run
+    headers, cookies = await asyncio.to_thread(olx_pool.identity)
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=per_host_limit)
+    # images come from the CDN and are fetched in parallel per ad, so they get their own connection budget
+    images_connector = aiohttp.TCPConnector(limit=0, limit_per_host=IMAGE_PER_HOST_LIMIT)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers=headers, cookies=cookies
+    ) as http, aiohttp.ClientSession(
+        connector=images_connector, timeout=timeout, headers={"User-Agent": headers.get("User-Agent", "")}
+    ) as images_http:
+
+        async def worker():
+            while not (stop_event and stop_event.is_set()):
+                item = await next_url()
+                if item is None:
+                    return
+                url_id, url = item
+                try:
+                    await ingest_one_ad(http, images_http, url_id, url, stats)
+                except Exception as e:
+                    logger.warning("Failed to ingest %s: %s", url, e)
+                    stats.count("failed")
+                    await asyncio.to_thread(mark_url_failed, url_id)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, max_in_flight))))
+        finally:
+            unstarted = []
+            while not queue.empty():
+                unstarted.append(queue.get_nowait()[0])
+            await asyncio.to_thread(release_urls, unstarted)
+            # this run's loop closes with it: close the LLM client bound to it
+            await address_extractor.aclose()
+
+    stats.finished = time.perf_counter()
+    logger.info("%s", stats.report())
+    logger.info("Rate limits: %s", gate_stats())
+    logger.info(
+        "Addresses: %d gazetteer, %d cached, %d LLM calls",
+        address_extractor.local_hits, address_extractor.cache_hits, address_extractor.llm_calls,
+    )
+    if agent_index.promoted:
+        logger.info("Agents: %d numbers blocked, %d apartments deleted", agent_index.promoted, agent_index.purged)
+    if unrecognized_keys:
+        # a label showing up here usually means OLX renamed a parameter
+        logger.warning("Unrecognized OLX parameters: %s", unrecognized_keys.most_common(10))
+    return stats
 
 
-    session_db.close()
-    return processed_count
+def process_olx_ad(stop_event: Optional[Event] = None) -> int:
+    """
+    Synchronous entry point: runs the async ingestion engine to completion
+    and returns the number of ads saved. Must not be called from a running event loop.
+    """
+    stats = asyncio.run(ingest_olx_ads(stop_event=stop_event))
+    return stats.processed
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+
+from environment.utils import Env
+from monitoring.metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = Env.scraper.MAX_ATTEMPTS
+PER_HOST_LIMIT = Env.scraper.PER_HOST_LIMIT
+BREAKER_THRESHOLD = Env.scraper.BREAKER_THRESHOLD
+BREAKER_COOLDOWN = Env.scraper.BREAKER_COOLDOWN
+
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# statuses that mean "slow down", as opposed to a dead or permanently failing page
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+_POLL = 0.05
+
+HTTP_SECONDS = histogram(
+    "scraper_http_request_seconds", "Scraper HTTP requests by host and status ('error' when none came back)",
+    ("host", "status"),
+)
+
+
+class ScrapeError(Exception):
+    """A request kept failing after all retries (or with a status that is not retried)."""
+
+    def __init__(self, url: str, reason: str, status: int | None = None):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.status = status
+
+
+class CircuitOpenError(ScrapeError):
+    """The host's circuit is open: the request was not sent."""
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    # Retry-After is either seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    # full jitter: uniform in [0, base * 2^attempt], capped; Retry-After is a floor
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class HostGate:
+    """
+    Per-host admission control shared by all threads and event loops of the process.
+
+    Concurrency is AIMD: the limit grows by one after `limit` consecutive successes and
+    halves on 429/503 (also pausing everyone for Retry-After). After breaker_threshold
+    consecutive failures the circuit opens: requests fail fast with CircuitOpenError for
+    the cooldown, then a single probe request decides whether to close it or to open it
+    again for twice as long. Producers of new work can wait_closed() meanwhile.
+    """
+
+    def __init__(self, host: str, max_limit: int = PER_HOST_LIMIT, min_limit: int = 1,
+                 breaker_threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.host = host
+        self.max_limit = max(min_limit, max_limit)
+        self.min_limit = min_limit
+        self.limit = float(max(min_limit, self.max_limit // 2))
+        self.breaker_threshold = breaker_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._successes = 0
+        self._failures = 0
+        self._paused_until = 0.0
+        self._open_until = 0.0
+        self._probing = False
+        self.throttled = 0
+        self.circuit_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._probing:
+            return "half-open"
+        return "open" if self._open_until > time.monotonic() else "closed"
+
+    def _try_acquire(self) -> float:
+        """
+        Takes a slot and returns 0, or returns how long to wait before trying again.
+        Raises CircuitOpenError while the circuit is open.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._open_until:
+                if now < self._open_until or self._probing:
+                    raise CircuitOpenError(self.host, f"circuit open for {max(0.0, self._open_until - now):.0f}s")
+                # half-open: let exactly one request through
+                self._probing = True
+                self._in_flight += 1
+                return 0.0
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self.limit):
+                return _POLL
+            self._in_flight += 1
+            return 0.0
+
+    def acquire(self) -> None:
+        while (wait := self._try_acquire()) > 0:
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self) -> None:
+        while (wait := self._try_acquire()) > 0:
+            await asyncio.sleep(min(wait, 1.0))
+
+    async def wait_closed(self) -> None:
+        # returns once the circuit is closed or ready for its probe request
+        while True:
+            with self._lock:
+                if self._probing:
+                    wait = _POLL
+                else:
+                    wait = self._open_until - time.monotonic() if self._open_until else 0.0
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def cancel(self) -> None:
+        # the request was abandoned (e.g. task cancelled): free the slot without judging the host
+        with self._lock:
+            self._in_flight -= 1
+            self._probing = False
+
+    def release(self, ok: bool, throttled: bool = False, retry_after: float | None = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            probe = self._probing
+            self._probing = False
+            if ok:
+                self._failures = 0
+                if probe:
+                    self._open_until = 0.0
+                    self.cooldown = self.base_cooldown
+                self._successes += 1
+                if self._successes >= self.limit:
+                    self._successes = 0
+                    self.limit = min(self.max_limit, self.limit + 1)
+                return
+
+            self._successes = 0
+            self._failures += 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            if probe:
+                self.cooldown = min(self.cooldown * 2, 3600)
+                self._open_until = now + self.cooldown
+            elif self._failures >= self.breaker_threshold and not self._open_until:
+                self.circuit_opened += 1
+                self._open_until = now + self.cooldown
+                logger.warning("Circuit for %s opened for %.0fs after %d failures",
+                               self.host, self.cooldown, self._failures)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "state": self.state,
+            "throttled": self.throttled,
+            "circuit_opened": self.circuit_opened,
+        }
+
+
+_gates: dict[str, HostGate] = {}
+_gates_lock = threading.Lock()
+
+
+def gate_for(url: str) -> HostGate:
+    host = urlparse(url).netloc
+    with _gates_lock:
+        if host not in _gates:
+            _gates[host] = HostGate(host)
+        return _gates[host]
+
+
+def gate_stats() -> dict:
+    with _gates_lock:
+        return {host: gate.stats() for host, gate in _gates.items()}
+
+
+def guarded_get(session: requests.Session, url: str, attempts: int = MAX_ATTEMPTS, **kwargs) -> requests.Response:
+    """
+    GET through the host gate with jittered retries on connection errors, 429 and 5xx.
+    Returns the successful response; raises ScrapeError otherwise.
+    """
+    gate = gate_for(url)
+    for attempt in range(attempts):
+        gate.acquire()
+        retry_after = None
+        t0 = time.perf_counter()
+        try:
+            resp = session.get(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            HTTP_SECONDS.observe(time.perf_counter() - t0, host=gate.host, status="error")
+            gate.release(ok=False)
+            reason, status = str(e), None
+        else:
+            status = resp.status_code
+            HTTP_SECONDS.observe(time.perf_counter() - t0, host=gate.host, status=str(status))
+            if status < 400:
+                gate.release(ok=True)
+                return resp
+            if status not in RETRY_STATUSES:
+                # 404 & co. say nothing about the host's health and are not worth retrying
+                gate.release(ok=True)
+                raise ScrapeError(url, f"HTTP {status}", status)
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            gate.release(ok=False, throttled=status in THROTTLE_STATUSES, retry_after=retry_after)
+            reason = f"HTTP {status}"
+        if attempt + 1 < attempts:
+            time.sleep(backoff_delay(attempt, retry_after))
+    raise ScrapeError(url, f"{reason} after {attempts} attempts", status)
+
+
+async def guarded_get_async(http: aiohttp.ClientSession, url: str, read: str = "text",
+                            attempts: int = MAX_ATTEMPTS, **kwargs):
+    """
+    Async counterpart of guarded_get; returns the body already read (read='text', 'json' or 'bytes'),
+    or (status, headers, text) with read='page', for conditional requests that may get a 304.
+    """
+    gate = gate_for(url)
+    for attempt in range(attempts):
+        await gate.acquire_async()
+        retry_after = None
+        status = None
+        t0 = time.perf_counter()
+        try:
+            async with http.get(url, **kwargs) as resp:
+                status = resp.status
+                if status < 400:
+                    if read == "json":
+                        body = await resp.json(content_type=None)
+                    elif read == "bytes":
+                        body = await resp.read()
+                    elif read == "page":
+                        body = (status, resp.headers.copy(), await resp.text())
+                    else:
+                        body = await resp.text()
+                    HTTP_SECONDS.observe(time.perf_counter() - t0, host=gate.host, status=str(status))
+                    gate.release(ok=True)
+                    return body
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            HTTP_SECONDS.observe(time.perf_counter() - t0, host=gate.host, status=str(status))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            HTTP_SECONDS.observe(time.perf_counter() - t0, host=gate.host, status="error")
+            gate.release(ok=False)
+            reason = str(e) or type(e).__name__
+        except BaseException:
+            gate.cancel()
+            raise
+        else:
+            if status not in RETRY_STATUSES:
+                gate.release(ok=True)
+                raise ScrapeError(url, f"HTTP {status}", status)
+            gate.release(ok=False, throttled=status in THROTTLE_STATUSES, retry_after=retry_after)
+            reason = f"HTTP {status}"
+        if attempt + 1 < attempts:
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+    raise ScrapeError(url, f"{reason} after {attempts} attempts", status)
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from threading import Event
+from typing import Optional
+
+import aiohttp
+from sqlalchemy.sql import func
+
+from db.engine import SessionLocal
+from db.manager import claim_refresh_urls
+from db.near_duplicates import band_keys, minhash_signature
+from db.models import Apartment, ApartmentImage, ApartmentUrl
+from environment.utils import Env
+from webscrape.address_llm import address_extractor
+from webscrape.olx_session import OLX_BASE_URL, olx_pool
+from webscrape.olx_utils import save_images_for_apartment
+from webscrape.process_olx import (
+    CLAIM_BATCH, IMAGE_PER_HOST_LIMIT, LEASE_SECONDS, MAX_IN_FLIGHT, PER_HOST_LIMIT, REQUEST_TIMEOUT, WORKER_ID,
+    IngestStats, apartment_fields, prepare_parameters, save_image_rows,
+)
+from webscrape.rate_limit import ScrapeError, gate_for, gate_stats, guarded_get_async
+from webscrape.scrapping_olx import GONE_STATUSES, parse_olx_ad
+
+logger = logging.getLogger(__name__)
+
+REFRESH_MIN_INTERVAL = Env.scraper.REFRESH_MIN_INTERVAL
+REFRESH_MAX_INTERVAL = Env.scraper.REFRESH_MAX_INTERVAL
+
+# parts of an ad page that differ between two requests for the same ad: scripts (tokens,
+# tracking), styles, comments and the view counter. Nothing the parser reads lives there.
+VOLATILE_RE = re.compile(
+    r"<script\b.*?</script>|<style\b.*?</style>|<noscript\b.*?</noscript>|<!--.*?-->"
+    r"|(?:Просмотров|Ko'rishlar soni)\s*:?\s*\d+",
+    re.S | re.I,
+)
+WHITESPACE_RE = re.compile(r"\s+")
+# Apartment columns compared on refresh; phone_number is not re-fetched and map_link
+# is only re-extracted when the description changed
+REFRESH_FIELDS = (
+    "owner_name", "title", "description", "price", "floor", "total_storeys", "area", "rooms",
+    "is_furnished", "district", "district_id", "building_type", "repair", "latitude", "longitude",
+)
+
+
+class RefreshStats(IngestStats):
+    """IngestStats for a refresh pass; processed counts every ad checked."""
+    pipeline = "refresh"
+
+    def __init__(self):
+        super().__init__()
+        self.not_modified = 0
+        self.unchanged = 0
+        self.updated = 0
+        self.deactivated = 0
+        self.changed_fields = Counter()
+
+    def report(self) -> str:
+        stages = ", ".join(f"{k}={v:.2f}s" for k, v in sorted(self.stage_seconds.items()))
+        return (
+            f"Refreshed {self.processed} ads in {self.elapsed:.1f}s: {self.not_modified} not modified, "
+            f"{self.unchanged} unchanged, {self.updated} updated, {self.deactivated} deactivated, "
+            f"{self.skipped} unparsable, {self.failed} failed [{stages}]"
+        )
+
+
+def page_fingerprint(html: str) -> str:
+    stable = WHITESPACE_RE.sub(" ", VOLATILE_RE.sub("", html))
+    return hashlib.sha256(stable.encode("utf-8")).hexdigest()
+
+
+def next_interval(previous: int | None, changed: bool) -> int:
+    # a change brings the ad back to the shortest interval; quiet ads are checked ever less often
+    if changed or not previous:
+        return REFRESH_MIN_INTERVAL
+    return min(REFRESH_MAX_INTERVAL, max(REFRESH_MIN_INTERVAL, previous * 2))
+
+
+def differs(old, new) -> bool:
+    if isinstance(old, Decimal) and new is not None:
+        # compare at the column's scale: 54.5 scraped vs Decimal('54.50') stored is no change
+        try:
+            return old != Decimal(str(new)).quantize(old)
+        except InvalidOperation:
+            return True
+    return old != new
+
+
+def claim_refresh_batch(worker_id: str, batch_size: int) -> list:
+    session_db = SessionLocal()
+    try:
+        claimed = claim_refresh_urls(session_db, worker_id, batch_size, LEASE_SECONDS)
+        session_db.commit()
+        return claimed
+    finally:
+        session_db.close()
+
+
+def finish_check(url_id: int, interval: int, **validators) -> None:
+    # validators: etag, last_modified and page_hash when a full page came back
+    session_db = SessionLocal()
+    try:
+        session_db.query(ApartmentUrl).filter_by(id=url_id).update({
+            "claimed_by": None,
+            "checked_at": func.now(),
+            "next_check_at": func.now() + timedelta(seconds=interval),
+            "check_interval": interval,
+            **validators,
+        })
+        session_db.commit()
+    finally:
+        session_db.close()
+
+
+def deactivate_apartment(url_id: int) -> None:
+    session_db = SessionLocal()
+    try:
+        session_db.query(Apartment).filter_by(url_id=url_id).update({"status": "inactive"})
+        session_db.query(ApartmentUrl).filter_by(id=url_id).update(
+            {"claimed_by": None, "checked_at": func.now(), "next_check_at": None}
+        )
+        session_db.commit()
+    finally:
+        session_db.close()
+
+
+def release_refresh_urls(url_ids: list[int]) -> None:
+    # claimed but unchecked URLs are due again right away instead of when the lease runs out
+    if not url_ids:
+        return
+    session_db = SessionLocal()
+    try:
+        (
+            session_db.query(ApartmentUrl)
+            .filter(ApartmentUrl.id.in_(url_ids))
+            .update({"claimed_by": None, "next_check_at": func.now()}, synchronize_session=False)
+        )
+        session_db.commit()
+    finally:
+        session_db.close()
+
+
+def load_apartment(url_id: int) -> tuple[int, dict, set[str]] | None:
+    """Returns the apartment id, its REFRESH_FIELDS values and the source URLs of its images."""
+    session_db = SessionLocal()
+    try:
+        apt = session_db.query(Apartment).filter_by(url_id=url_id).one_or_none()
+        if apt is None:
+            return None
+        image_urls = {
+            u for (u,) in session_db.query(ApartmentImage.original_url).filter_by(apartment_id=apt.id)
+        }
+        return apt.id, {f: getattr(apt, f) for f in REFRESH_FIELDS}, image_urls
+    finally:
+        session_db.close()
+
+
+def update_apartment(apartment_id: int, changes: dict) -> None:
+    session_db = SessionLocal()
+    try:
+        session_db.query(Apartment).filter_by(id=apartment_id).update(changes)
+        session_db.commit()
+    finally:
+        session_db.close()
+
+
+async def refresh_one_ad(http: aiohttp.ClientSession, images_http: aiohttp.ClientSession,
+                         row, stats: RefreshStats) -> None:
+    """
+    Re-checks one scraped ad. The cheap exits come first: a 304 to the conditional
+    request, then an unchanged page fingerprint; only a page that really changed is
+    parsed, and only the columns that differ are written. The LLM runs again only for a
+    new description, and only photos not downloaded before are fetched.
+    """
+    headers = {}
+    if row.etag:
+        headers["If-None-Match"] = row.etag
+    if row.last_modified:
+        headers["If-Modified-Since"] = row.last_modified
+    stats.count("processed")
+
+    with stats.stage("fetch"):
+        try:
+            status, resp_headers, html = await guarded_get_async(http, row.url, read="page", headers=headers)
+        except ScrapeError as e:
+            if e.status not in GONE_STATUSES:
+                raise
+            status = None
+    if status is None:
+        stats.count("deactivated")
+        await asyncio.to_thread(deactivate_apartment, row.id)
+        return
+    if status == 304:
+        stats.count("not_modified")
+        await asyncio.to_thread(finish_check, row.id, next_interval(row.check_interval, changed=False))
+        return
+
+    validators = {
+        "etag": resp_headers.get("ETag"),
+        "last_modified": resp_headers.get("Last-Modified"),
+        "page_hash": page_fingerprint(html),
+    }
+    if validators["page_hash"] == row.page_hash:
+        stats.count("unchanged")
+        await asyncio.to_thread(finish_check, row.id, next_interval(row.check_interval, changed=False), **validators)
+        return
+
+    with stats.stage("parse"):
+        data = parse_olx_ad(html, row.url)
+    if not data.get("Title") or data.get("PriceValue") is None:
+        # removed ads come back as a 200 page without the ad on it
+        stats.count("deactivated")
+        await asyncio.to_thread(deactivate_apartment, row.id)
+        return
+    parsed = prepare_parameters(data)
+    stored = await asyncio.to_thread(load_apartment, row.id)
+    if parsed is None or stored is None:
+        logger.warning("Refresh of %s: missing required fields, keeping the stored values", row.url)
+        stats.count("skipped")
+        await asyncio.to_thread(finish_check, row.id, next_interval(row.check_interval, changed=False), **validators)
+        return
+
+    apt_id, current, image_urls = stored
+    fields = apartment_fields(data, parsed)
+    changes = {f: fields[f] for f in REFRESH_FIELDS if differs(current[f], fields[f])}
+    if "title" in changes or "description" in changes:
+        # the ad stays in its cluster; later reposts are matched against the new text
+        changes["minhash"] = minhash_signature(fields["title"], fields["description"])
+        changes["lsh_bands"] = band_keys(changes["minhash"]) if changes["minhash"] else None
+    if "description" in changes:
+        with stats.stage("llm"):
+            changes["map_link"] = await address_extractor.extract(fields["description"])
+    new_images = [u for u in data.get("Images", []) if u not in image_urls]
+    if new_images:
+        with stats.stage("images"):
+            saved = await save_images_for_apartment(images_http, apt_id, new_images, existing=len(image_urls))
+        with stats.stage("db"):
+            await asyncio.to_thread(save_image_rows, apt_id, saved)
+
+    changed = bool(changes or new_images)
+    with stats.stage("db"):
+        if changes:
+            await asyncio.to_thread(update_apartment, apt_id, changes)
+        await asyncio.to_thread(finish_check, row.id, next_interval(row.check_interval, changed), **validators)
+    if changed:
+        stats.count("updated")
+        stats.changed_fields.update(changes.keys())
+        if new_images:
+            stats.changed_fields["images"] += 1
+    else:
+        # only markup outside the fields we store changed
+        stats.count("unchanged")
+
+
+async def refresh_olx_ads(
+    max_in_flight: int = MAX_IN_FLIGHT,
+    per_host_limit: int = PER_HOST_LIMIT,
+    stop_event: Optional[Event] = None,
+    worker_id: str = WORKER_ID,
+    claim_size: int = CLAIM_BATCH,
+) -> RefreshStats:
+    """
+    Re-checks every scraped ad whose next check is due, with the same worker pool, host
+    gate and claiming scheme as ingest_olx_ads. Each ad is rescheduled after
+    REFRESH_MIN_INTERVAL when it changed, otherwise after twice its previous interval
+    (at most REFRESH_MAX_INTERVAL); ads gone from OLX are marked inactive.
+    """
+    stats = RefreshStats()
+    queue: asyncio.Queue = asyncio.Queue()
+    claim_lock = asyncio.Lock()
+    exhausted = False
+
+    async def next_row():
+        nonlocal exhausted
+        async with claim_lock:
+            if queue.empty() and not exhausted:
+                await gate_for(OLX_BASE_URL).wait_closed()
+                batch = await asyncio.to_thread(claim_refresh_batch, worker_id, claim_size)
+                exhausted = not batch
+                for row in batch:
+                    queue.put_nowait(row)
+            return None if queue.empty() else queue.get_nowait()
+
+    headers, cookies = await asyncio.to_thread(olx_pool.identity)
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=per_host_limit)
+    images_connector = aiohttp.TCPConnector(limit=0, limit_per_host=IMAGE_PER_HOST_LIMIT)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers=headers, cookies=cookies
+    ) as http, aiohttp.ClientSession(
+        connector=images_connector, timeout=timeout, headers={"User-Agent": headers.get("User-Agent", "")}
+    ) as images_http:
+
+        async def worker():
+            while not (stop_event and stop_event.is_set()):
+                row = await next_row()
+                if row is None:
+                    return
+                try:
+                    await refresh_one_ad(http, images_http, row, stats)
+                except Exception as e:
+                    logger.warning("Failed to refresh %s: %s", row.url, e)
+                    stats.count("failed")
+                    # try again at the ad's usual pace rather than right away
+                    await asyncio.to_thread(finish_check, row.id, next_interval(row.check_interval, changed=False))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, max_in_flight))))
+        finally:
+            unstarted = []
+            while not queue.empty():
+                unstarted.append(queue.get_nowait().id)
+            await asyncio.to_thread(release_refresh_urls, unstarted)
+            # this run's loop closes with it: close the LLM client bound to it
+            await address_extractor.aclose()
+
+    stats.finished = time.perf_counter()
+    if stats.processed:
+        logger.info("%s", stats.report())
+        if stats.changed_fields:
+            logger.info("Changed fields: %s", stats.changed_fields.most_common())
+        logger.info("Rate limits: %s", gate_stats())
+    return stats
@@ -1,152 +1,129 @@
-import random
+import logging
 import re
-from urllib.parse import urljoin, urlparse, parse_qs
+import aiohttp
 import requests
-from bs4 import BeautifulSoup
-
-HEADERS_LIST = [
-    {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-    {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0 Safari/537.36",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-    {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-    {
-        "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1",
-        "X-Requested-With": "XMLHttpRequest",
-    },
-]
-
-def scrape_olx_ad_static(url: str) -> dict:
+
+from monitoring.metrics import histogram
+from webscrape.olx_parsers import get_backend
+from webscrape.olx_session import OLX_BASE_URL, olx_pool
+from webscrape.rate_limit import ScrapeError, guarded_get, guarded_get_async
+
+logger = logging.getLogger(__name__)
+
+# the ad or its phone is gone for good: skip instead of retrying later
+GONE_STATUSES = {403, 404, 410}
+
+PARSE_SECONDS = histogram("scraper_parse_seconds", "Time to parse one ad page", ("backend",))
+
+
+def scrape_olx_ad_static(url: str, session: requests.Session | None = None) -> dict:
     """
     Scrapes an OLX ad page. Returns a dict with keys like:
     'Title', 'PriceValue', 'Parameters', 'Description', 'Images', 'Location', 'SellerName',
-    and now optionally: 'MapLink', 'Latitude', 'Longitude'.
+    and now optionally: 'MapLink', 'Latitude', 'Longitude', 'OfferId'.
+    The page is downloaded once; pass the same session to fetch_olx_phone so the
+    phone lookup reuses its cookies instead of fetching the page again.
+    Without a session, one is borrowed from the shared olx_pool.
     """
-    session = requests.Session()
-    session.headers.update(random.choice(HEADERS_LIST))
-    # seed cookies
-    session.get(url, timeout=5)
+    if session is None:
+        with olx_pool.session() as session:
+            return scrape_olx_ad_static(url, session)
+
+    try:
+        resp = guarded_get(session, url, timeout=10)
+    except ScrapeError as e:
+        logger.warning("Error fetching %s: %s", url, e)
+        return {}
 
+    return parse_olx_ad(resp.text, url)
+
+
+async def fetch_olx_ad_async(http: aiohttp.ClientSession, url: str) -> dict:
+    """
+    Async counterpart of scrape_olx_ad_static for the ingestion engine.
+    Uses the engine's shared aiohttp session (cookies and connections are reused).
+    Returns {} for removed ads; raises ScrapeError when the page kept failing, so the
+    caller can record the failure and retry the URL later.
+    """
     try:
-        resp = session.get(url, timeout=10)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
+        html = await guarded_get_async(http, url)
+    except ScrapeError as e:
+        if e.status not in GONE_STATUSES:
+            raise
+        logger.warning("Error fetching %s: %s", url, e)
         return {}
 
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    data: dict = {}
-
-    # Title
-    title_tag = soup.find('h1') or soup.select_one('div[data-testid="offer_title"] h4')
-    if title_tag:
-        data['Title'] = title_tag.get_text(strip=True)
-
-    # Price
-    price_container = soup.find('div', attrs={'data-testid': 'ad-price-container'})
-    if price_container:
-        price_tag = price_container.find('h3')
-        if price_tag:
-            price_text = price_tag.get_text(strip=True)
-            m = re.search(r'([\d\s]+)', price_text.replace('\u00A0', ' '))
-            if m:
-                try:
-                    data['PriceValue'] = int(m.group(1).replace(' ', ''))
-                except:
-                    pass
-
-    # Parameters
-    params: dict = {}
-    container = soup.find('div', attrs={'data-testid': 'ad-parameters-container'})
-    if container:
-        for p in container.find_all('p'):
-            text = p.get_text(strip=True)
-            if ':' in text:
-                key, val = text.split(':', 1)
-                params[key.strip()] = val.strip()
-            else:
-                params.setdefault('OtherInfo', []).append(text.strip())
-    if params:
-        data['Parameters'] = params
-
-    # Description
-    desc_div = soup.find('div', attrs={'data-testid': 'ad_description'})
-    if desc_div:
-        inner = desc_div.find('div')
-        if inner:
-            data['Description'] = inner.get_text(separator=' ', strip=True)
-
-    images = []
-    for img_container in soup.find_all('div', attrs={'data-testid': 'ad-photo'}):
-        img = img_container.find('img')
-        if img:
-            src = img.get('src') or img.get('data-src')
-            if src:
-                images.append(urljoin(url, src))
-    for img in soup.find_all('img', attrs={'data-testid': re.compile(r'swiper-image')}):
-        src = img.get('src') or img.get('data-src')
-        if src:
-            full = urljoin(url, src)
-            if full not in images:
-                images.append(full)
-    if images:
-        data['Images'] = images
-
-    location = None
-    for p in soup.find_all('p'):
-        if p.get_text(strip=True) == 'Местоположение':
-            parent = p.find_parent()
-            if parent:
-                ps = parent.find_all('p')
-                vals = [x.get_text(strip=True) for x in ps if x.get_text(strip=True) != 'Местоположение']
-                if vals:
-                    location = ', '.join(vals)
-            break
-    if location:
-        if "район" in location:
-            helper = ''
-            index = location.find('район')-2
-            while location[index]!=' ' and index!=-1:
-                helper+=location[index]
-                index-=1
-            data['Location'] = helper[::-1]+' район'
-        else:
-            data['Location'] = location
-
-
-    seller_tag = soup.find(attrs={'data-testid': 'user-profile-user-name'})
-    if seller_tag:
-        data['SellerName'] = seller_tag.get_text(strip=True)
-
-    map_link = None
-    lat = lon = None
-    a_tag = soup.find('a', href=re.compile(r'maps\.google\.com/maps\?ll='))
-    if a_tag:
-        href = a_tag.get('href')
-        map_link = href if href.startswith('http') else urljoin(url, href)
-        try:
-            parsed = urlparse(map_link)
-            qs = parse_qs(parsed.query)
-            ll_vals = qs.get('ll') or qs.get('q')
-            if ll_vals:
-                parts = ll_vals[0].split(',')
-                if len(parts) >= 2:
-                    lat = float(parts[0])
-                    lon = float(parts[1])
-        except Exception as e:
-            print(f"Failed parsing map link {map_link}: {e}")
-
-    if map_link:
-        data['MapLink'] = map_link
-    if lat is not None and lon is not None:
-        data['Latitude'] = lat
-        data['Longitude'] = lon
-
-    return data
+    return parse_olx_ad(html, url)
+
+
+def parse_olx_ad(html: str, url: str, backend: str | None = None) -> dict:
+    """
+    Parses the HTML of an OLX ad page into the dict returned by scrape_olx_ad_static.
+    backend overrides SCRAPER_HTML_PARSER ('selectolax', 'lxml', 'bs4' or 'auto').
+    """
+    parser = get_backend(backend)
+    with PARSE_SECONDS.time(backend=parser.name):
+        return parser.parse(html, url)
+
+
+def normalize_phone(raw: str) -> str | None:
+    # strip non-digits and the 998 country code, keep 9-digit local numbers only
+    digits = re.sub(r"\D", "", raw)
+    if digits.startswith("998") and len(digits) > 9:
+        digits = digits[3:]
+    return digits if len(digits) == 9 else None
+
+
+def phone_api_url(offer_id: str) -> str:
+    return f"{OLX_BASE_URL}/api/v1/offers/{offer_id}/limited-phones/"
+
+
+def fetch_olx_phone(ad_url: str, offer_id: str | None = None,
+                    session: requests.Session | None = None) -> str | None:
+    """
+    Looks up the seller phone via the limited-phones API.
+    offer_id should come from the already parsed ad page ('OfferId'); when it is
+    missing the page is fetched once to read it.
+    """
+    if session is None:
+        with olx_pool.session() as session:
+            return fetch_olx_phone(ad_url, offer_id, session)
+    if offer_id is None:
+        offer_id = scrape_olx_ad_static(ad_url, session).get("OfferId")
+        if not offer_id:
+            return None
+
+    try:
+        resp = guarded_get(session, phone_api_url(offer_id), headers={"Referer": ad_url}, timeout=10)
+    except ScrapeError as e:
+        logger.warning("Skipping %s, phone API request failed: %s", ad_url, e)
+        return None
+
+    phones = resp.json().get("data", {}).get("phones", [])
+    if not phones:
+        return None
+
+    # normalize: take first phone
+    return normalize_phone(phones[0])
+
+
+async def fetch_olx_phone_async(http: aiohttp.ClientSession, ad_url: str, offer_id: str | None) -> str | None:
+    """
+    Returns None when the ad has no (visible) phone; raises ScrapeError when the
+    phone API kept failing, so the ad is retried later instead of saved without a phone.
+    """
+    if not offer_id:
+        return None
+
+    try:
+        payload = await guarded_get_async(http, phone_api_url(offer_id), read="json", headers={"Referer": ad_url})
+    except ScrapeError as e:
+        if e.status not in GONE_STATUSES:
+            raise
+        logger.warning("Skipping %s, phone API request failed: %s", ad_url, e)
+        return None
+
+    phones = payload.get("data", {}).get("phones", [])
+    if not phones:
+        return None
+    return normalize_phone(phones[0])
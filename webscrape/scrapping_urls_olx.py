@@ -1,69 +1,134 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import logging
+
 from bs4 import BeautifulSoup
 from typing import Optional
 from threading import Event
+from sqlalchemy.orm import Session
 from db.engine import SessionLocal
-from db.models import ApartmentUrl
+from db.manager import insert_new_urls
+from db.models import SearchCrawlState
+from environment.utils import Env
+from webscrape.olx_session import OLX_BASE_URL, olx_pool
 from webscrape.process_olx import process_olx_ad
+from webscrape.rate_limit import ScrapeError, gate_stats, guarded_get
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGES = 9
+LISTING_CONCURRENCY = Env.scraper.LISTING_CONCURRENCY
+
+
+def fetch_listing_page(page_url: str) -> list[str] | None:
+    """
+    Returns the ad URLs of one listing page in page order, or None if the page failed.
+    """
+    try:
+        with olx_pool.session() as http:
+            resp = guarded_get(http, page_url, timeout=15)
+    except ScrapeError as e:
+        logger.warning("Skipping listing page %s: %s", page_url, e)
+        return None
 
+    soup = BeautifulSoup(resp.text, "html.parser")
+    urls = []
+    for a in soup.find_all("a", class_="css-1tqlkj0"):
+        href = a.get("href")
+        if href:
+            urls.append(OLX_BASE_URL + href)
+    return urls
 
-def get_all_urls_for_apart(url: str, stop_event: Optional[Event] = None):
+
+def store_page_urls(session: Session, urls: list[str], seen_urls: set) -> list[str]:
+    """
+    Persists the unseen URLs of one page as 'new' with one set-based insert
+    and returns them in page order.
+    """
+    candidates = list(dict.fromkeys(u for u in urls if u not in seen_urls))
+    seen_urls.update(candidates)
+    inserted = insert_new_urls(session, candidates)
+
+    # Commit after each page to avoid losing progress on cancellation
+    session.commit()
+    return [u for u in candidates if u in inserted]
+
+
+def get_all_urls_for_apart(url: str, stop_event: Optional[Event] = None, incremental: bool = True,
+                           ingest: bool = True):
     """
     Scrape listing pages and persist unseen ad URLs.
+    Pages are fetched LISTING_CONCURRENCY at a time. When the search was crawled before
+    (and incremental is on), page 1 is fetched alone and pagination stops at the first page
+    that yields no unseen ads or reaches the previous crawl's high-water mark.
     Supports cooperative cancellation via stop_event.
+    With ingest off only the URLs are stored and the number of new ones is returned.
     """
     session = SessionLocal()
     try:
-        seen_urls = set()
-        base_url = url
-        for page in range(1, 10):
-            if stop_event and stop_event.is_set():
-                break
-
-            page_url = f"{base_url}&page={page}"
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-                "X-Requested-With": "XMLHttpRequest",
-            }
-            try:
-                resp = requests.get(page_url, headers=headers, timeout=15)
-                resp.raise_for_status()
-            except Exception:
-                # Skip bad pages but continue the loop
-                continue
+        state = session.query(SearchCrawlState).filter_by(search_url=url).first()
+        incremental = incremental and state is not None
+        high_water = state.high_water_url if incremental else None
 
-            soup = BeautifulSoup(resp.text, "html.parser")
-            for a in soup.find_all("a", class_="css-1tqlkj0"):
+        seen_urls = set()
+        new_count = 0
+        first_new_url = None
+        pages_crawled = 0
+        pages = iter(range(1, MAX_PAGES + 1))
+        window = 1 if incremental else LISTING_CONCURRENCY
+        done = False
+        with ThreadPoolExecutor(max_workers=LISTING_CONCURRENCY) as pool:
+            while not done:
                 if stop_event and stop_event.is_set():
                     break
+                batch = list(islice(pages, window))
+                if not batch:
+                    break
+                results = pool.map(fetch_listing_page, [f"{url}&page={page}" for page in batch])
+                pages_crawled += len(batch)
 
-                href = a.get("href")
-                if not href:
-                    continue
-                full_url = "https://www.olx.uz" + href
-
-                if full_url in seen_urls:
-                    continue
-
-                exists = session.query(
-                    session.query(ApartmentUrl).filter_by(url=full_url).exists()
-                ).scalar()
-                if exists:
-                    continue
-                seen_urls.add(full_url)
-                session.add(ApartmentUrl(url=full_url, status="new"))
+                # handle pages in order so the stop rules see them as a sequential crawl would
+                for ad_urls in results:
+                    if stop_event and stop_event.is_set():
+                        done = True
+                        break
+                    if ad_urls is None:
+                        # Skip bad pages but continue the crawl
+                        continue
+                    if not ad_urls:
+                        # past the last page of results
+                        done = True
+                        break
+                    new_urls = store_page_urls(session, ad_urls, seen_urls)
+                    new_count += len(new_urls)
+                    if new_urls and first_new_url is None:
+                        first_new_url = new_urls[0]
+                    if incremental and (not new_urls or high_water in ad_urls):
+                        done = True
+                        break
+                window = LISTING_CONCURRENCY
 
-            # Commit after each page to avoid losing progress on cancellation
-            session.commit()
+        if state is None:
+            state = SearchCrawlState(search_url=url)
+            session.add(state)
+        if first_new_url:
+            state.high_water_url = first_new_url
+        state.pages_crawled = pages_crawled
+        session.commit()
+        logger.info(
+            "Crawled %d listing pages for %s: %d new ads, %d duplicates",
+            pages_crawled, url, new_count, len(seen_urls) - new_count,
+        )
+        logger.info("OLX session pool: %s, rate limits: %s", olx_pool.stats(), gate_stats())
 
+        if not ingest:
+            return new_count
         # Process saved ads (can also be cancelled if supported inside)
         if not (stop_event and stop_event.is_set()):
-            return process_olx_ad()
+            return process_olx_ad(stop_event)
         return None
     finally:
         try:
             session.close()
         except Exception:
             pass
-
-
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import signal
+import sys
+from threading import Event
+
+from environment.utils import Env
+from monitoring.metrics import start_metrics_server
+from webscrape.process_olx import WORKER_ID, ingest_olx_ads
+from webscrape.refresh_olx import refresh_olx_ads
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = Env.scraper.POLL_INTERVAL
+
+
+async def run_worker(stop_event: Event, poll_interval: float = POLL_INTERVAL) -> None:
+    """
+    Standalone scraper worker: drains claimable URLs (new ones and expired leases), then
+    re-checks the scraped ads that are due for a refresh, then polls for more every
+    poll_interval seconds. Run as many copies as needed, on one machine or several; they
+    share the work through claim_urls and claim_refresh_urls.
+    """
+    logger.info("Scraper worker %s started", WORKER_ID)
+    while not stop_event.is_set():
+        try:
+            stats = await ingest_olx_ads(stop_event=stop_event)
+            if not (stats.processed or stats.skipped or stats.failed):
+                # new ads first; refreshes only fill the idle time
+                stats = await refresh_olx_ads(stop_event=stop_event)
+        except Exception as e:
+            # database restarts etc. should not kill the worker
+            logger.warning("Scraper worker %s run failed: %s", WORKER_ID, e)
+            stats = None
+        if stats is None or not (stats.processed or stats.skipped or stats.failed):
+            await asyncio.to_thread(stop_event.wait, poll_interval)
+    logger.info("Scraper worker %s stopped", WORKER_ID)
+
+
+async def main() -> None:
+    stop_event = Event()
+    start_metrics_server(Env.metrics.WORKER_PORT, Env.metrics.HOST)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # finish the ads in progress, release the rest of the claimed batch
+        loop.add_signal_handler(sig, stop_event.set)
+    await run_worker(stop_event)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    asyncio.run(main())